@@ -78,7 +78,7 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
       FROM pull_events
       WHERE repo_name=%s
         AND created_at >= %s AND created_at < %s
-        AND JSON_EXTRACT(raw_json,'$.event')='merged'
+        AND event='merged'
     """
     pm= (repo_name, start_dt, end_dt)
     cursor.execute(q_merges, pm)
@@ -95,7 +95,7 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
       FROM issue_events ie
       WHERE ie.repo_name=%s
         AND ie.created_at >= %s AND ie.created_at < %s
-        AND JSON_EXTRACT(ie.raw_json,'$.event')='closed'
+        AND ie.event='closed'
         AND ie.issue_number IN (
            SELECT i.issue_number FROM issues i WHERE i.repo_name=%s
         )
@@ -115,7 +115,7 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
       FROM pull_events
       WHERE repo_name=%s
         AND created_at >= %s AND created_at < %s
-        AND JSON_EXTRACT(raw_json,'$.event') in ('closed','merged')
+        AND event in ('closed','merged')
     """
     pcpr= (repo_name, start_dt, end_dt)
     cursor.execute(q_cpr, pcpr)
@@ -192,14 +192,14 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
        "finalSQL": _inject_params_into_sql(q_pr, ppr)
     }
 
-    # commentsIssRaw => ignoring +1/-1 => body not like
+    # commentsIssRaw => ignoring +1/-1 => body_has_vote=0
     q_c_iss= """
       SELECT COUNT(*)
       FROM issue_comments ic
       JOIN issues i ON (i.repo_name=ic.repo_name AND i.issue_number=ic.issue_number)
       WHERE ic.repo_name=%s
         AND ic.created_at >= %s AND ic.created_at < %s
-        AND (ic.body NOT LIKE '%+1%' AND ic.body NOT LIKE '%-1%')
+        AND ic.body_has_vote=0
     """
     pciss= (repo_name, start_dt, end_dt)
     cursor.execute(q_c_iss, pciss)
@@ -210,14 +210,14 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
        "finalSQL": _inject_params_into_sql(q_c_iss, pciss)
     }
 
-    # commentsPRRaw => ignoring +1/-1 => body not like
+    # commentsPRRaw => ignoring +1/-1 => body_has_vote=0
     q_c_pr= """
       SELECT COUNT(*)
       FROM issue_comments ic
       JOIN pulls p ON (p.repo_name=ic.repo_name AND p.pull_number=ic.issue_number)
       WHERE ic.repo_name=%s
         AND ic.created_at >= %s AND ic.created_at < %s
-        AND (ic.body NOT LIKE '%+1%' AND ic.body NOT LIKE '%-1%')
+        AND ic.body_has_vote=0
     """
     pcpr2= (repo_name, start_dt, end_dt)
     cursor.execute(q_c_pr, pcpr2)
@@ -235,7 +235,7 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
       JOIN issues i ON (i.repo_name=ic.repo_name AND i.issue_number=ic.issue_number)
       WHERE ic.repo_name=%s
         AND ic.created_at >= %s AND ic.created_at < %s
-        AND (ic.body LIKE '%+1%' OR ic.body LIKE '%-1%')
+        AND ic.body_has_vote=1
     """
     priss= (repo_name, start_dt, end_dt)
     cursor.execute(q_r_iss, priss)
@@ -253,7 +253,7 @@ def gather_data_for_window(repo_name, start_dt, end_dt):
       JOIN pulls p ON (p.repo_name=ic.repo_name AND p.pull_number=ic.issue_number)
       WHERE ic.repo_name=%s
         AND ic.created_at >= %s AND ic.created_at < %s
-        AND (ic.body LIKE '%+1%' OR ic.body LIKE '%-1%')
+        AND ic.body_has_vote=1
     """
     prpr= (repo_name, start_dt, end_dt)
     cursor.execute(q_r_pr, prpr)
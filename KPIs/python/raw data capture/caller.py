@@ -1,52 +1,133 @@
 #!/usr/bin/env python
 # caller.py
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from repo_list import repo_list
 from fetch_data import (
+    METADATA_DB,
+    STAGING_DB,
     load_tokens,
+    get_session,
+    print_token_budgets,
+    connect_db,
     init_metadata_db,
-    create_ephemeral_db,
-    create_tables,
+    init_history_db,
+    begin_run,
+    publish_run,
+    fetch_repo_sizes,
     fetch_all_data_for_repo
 )
 
-def main():
-    # 1) Load tokens
-    load_tokens()
-
-    # 2) Connect to persistent metadata DB
-    metadata_conn = init_metadata_db()
+# Repos fetched at the same time. Every worker has its own DB connections; all of
+# them draw GraphQL points from the shared per-token budget (fetch_data).
+WORKERS = 4
 
-    # 3) Create ephemeral DB for this run
-    ephemeral_conn, ephemeral_name = create_ephemeral_db()
-    create_tables(ephemeral_conn)
+_worker = threading.local()
+_worker_conns = []
+_worker_lock = threading.Lock()
 
-    # 4) Loop over repos
-    for rinfo in repo_list:
-        if not rinfo.get("enabled", False):
-            continue
+def worker_conns():
+    """
+    (run_conn, metadata_conn) of the calling worker thread, opened on first use.
+    """
+    if not hasattr(_worker, "conns"):
+        _worker.conns = (connect_db(database=STAGING_DB), connect_db(database=METADATA_DB))
+        with _worker_lock:
+            _worker_conns.append(_worker.conns)
+    return _worker.conns
 
-        owner = rinfo["owner"]
-        repo  = rinfo["repo"]
-        fallback_str = rinfo.get("start_date", "") or ""
-        end_str = rinfo.get("end_date", "") or None
+def run_repo(rinfo, session):
+    owner = rinfo["owner"]
+    repo  = rinfo["repo"]
+    fallback_str = rinfo.get("start_date", "") or ""
+    end_str = rinfo.get("end_date", "") or None
 
-        print("\n=============================================")
-        print(f"Processing {owner}/{repo} from {fallback_str or 'METADATA'} to {end_str or 'NOW'}")
+    print("\n=============================================")
+    print(f"Processing {owner}/{repo} from {fallback_str or 'METADATA'} to {end_str or 'NOW'}")
 
-        fetch_all_data_for_repo(
-            ephemeral_conn,
+    started = time.monotonic()
+    try:
+        run_conn, metadata_conn = worker_conns()
+        stats = fetch_all_data_for_repo(
+            run_conn,
             metadata_conn,
             owner,
             repo,
             fallback_str,
-            end_str
+            end_str,
+            session=session
         )
+    except Exception as e:
+        # one repo failing must not stop the others => its last_dates did not move and
+        # its re-readable staged rows were dropped (fetch_all_data_for_repo)
+        print(f"Repo {owner}/{repo} => failed => {e}")
+        stats = {"error": e}
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+def print_timing_summary(results, sizes, wall_seconds):
+    header = (f"{'Repo':50s}  {'Size':>8s}  {'Seconds':>8s}  {'Forks':>6s}  {'Stars':>6s}  "
+              f"{'Issues':>6s}  {'Pulls':>6s}  Status")
+    print("\n========== RUN TIMING SUMMARY ==========")
+    print(header)
+    print("-" * len(header))
+    busy = 0.0
+    for key, st in sorted(results.items(), key=lambda kv: -kv[1].get("seconds", 0)):
+        name = f"{key[0]}/{key[1]}"
+        if "error" in st:
+            print(f"{name[:50]:50s}  {sizes.get(key, 0):>8d}  {st['seconds']:>8.1f}  "
+                  f"{'-':>6s}  {'-':>6s}  {'-':>6s}  {'-':>6s}  FAILED => {st['error']}")
+        else:
+            status = "ok" if st["complete"] else "incomplete"
+            print(f"{name[:50]:50s}  {sizes.get(key, 0):>8d}  {st['seconds']:>8.1f}  {st['forks']:>6d}  "
+                  f"{st['stars']:>6d}  {st['issues']:>6d}  {st['pulls']:>6d}  {status}")
+        busy += st["seconds"]
+    print("-" * len(header))
+    print(f"Wall {wall_seconds:.1f}s => sum of repo times {busy:.1f}s => {WORKERS} worker(s)")
+    print("========================================")
+
+def main():
+    # 1) Load tokens
+    load_tokens()
+
+    # 2) Connect to persistent metadata DB
+    metadata_conn = init_metadata_db()
+
+    # 3) Start a run => rows are staged, then swapped into the history partition p<run_id>
+    init_history_db(metadata_conn)
+    run_conn, run_id = begin_run(metadata_conn)
+    run_conn.close()
+
+    # One pooled GraphQL session for the whole run, shared by the workers
+    session = get_session(pool_size=WORKERS)
+
+    # 4) Largest repos first => the longest fetch starts at once instead of last
+    enabled = [rinfo for rinfo in repo_list if rinfo.get("enabled", False)]
+    sizes = fetch_repo_sizes(session, [(r["owner"], r["repo"]) for r in enabled])
+    enabled.sort(key=lambda r: -sizes.get((r["owner"], r["repo"]), 0))
+    print(f"Fetching {len(enabled)} repo(s) with {WORKERS} worker(s), largest first")
+
+    run_started = time.monotonic()
+    results = {}
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="repo") as pool:
+        futures = {pool.submit(run_repo, rinfo, session): (rinfo["owner"], rinfo["repo"]) for rinfo in enabled}
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+    wall_seconds = time.monotonic() - run_started
 
-    ephemeral_conn.close()
+    for conns in _worker_conns:
+        for conn in conns:
+            conn.close()
+    session.close()
+    print_token_budgets()
+    publish_run(metadata_conn, run_id)
     metadata_conn.close()
 
-    print(f"\nAll done. Ephemeral DB was: {ephemeral_name}")
+    print_timing_summary(results, sizes, wall_seconds)
+    print(f"\nAll done. Run {run_id} is partition p{run_id} of the history tables.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,206 @@
+# bulk_load.py
+"""
+Bulk mode for first-time backfills => LOAD DATA instead of row-by-row upserts.
+
+With bulk_load on, the insert_* helpers hand their row to spool_row()
+instead of executing it. Rows collect in one TSV spool file per table; at
+every commit (commit_spooled, used by write_behind) each file is loaded with
+LOAD DATA LOCAL INFILE into a TEMPORARY staging table (same columns, no
+indexes) and merged with one
+  INSERT INTO <table> (...) SELECT ... FROM <staging> ON DUPLICATE KEY UPDATE ...
+=> the rows and the checkpoints deferred after them still commit together.
+
+Per-row side effects skipped in bulk mode => repo_stats deltas and the
+closed/merged flags; recount_bulk_repo() recomputes both once per repo.
+
+bulk_defer_indexes => the secondary indexes in DEFERRED_INDEXES are dropped
+by start_bulk() and rebuilt once by migrate_tables() in finish_bulk(). Only
+for a fresh DB: the run's own per-repo reads are slower without them.
+
+Needs local_infile=ON on the server (the client side is enabled by connect_db).
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from db import migrate_tables
+from repo_stats import rebuild_repo_stats
+
+# table => (spooled columns, columns refreshed on a duplicate key)
+BULK_TABLES = {
+    "watchers": (("repo_name", "user_login", "raw_json"), ("raw_json",)),
+    "forks": (("repo_name", "fork_id", "created_at", "owner_login", "raw_json"),
+              ("created_at", "owner_login", "raw_json")),
+    "stars": (("repo_name", "user_login", "starred_at", "raw_json"), ("starred_at", "raw_json")),
+    "issues": (("repo_name", "issue_number", "created_at", "updated_at", "state", "comments_count",
+                "reactions_total", "reactions_summary"),
+               ("created_at", "updated_at", "state", "comments_count", "reactions_total", "reactions_summary")),
+    "pulls": (("repo_name", "pull_number", "created_at", "updated_at", "state", "comments_count"),
+              ("created_at", "updated_at", "state", "comments_count")),
+    "issue_events": (("repo_name", "issue_number", "event_id", "created_at", "event", "actor_login", "raw_json"),
+                     ("created_at", "event", "actor_login", "raw_json")),
+    "pull_events": (("repo_name", "pull_number", "event_id", "created_at", "event", "actor_login", "raw_json"),
+                    ("created_at", "event", "actor_login", "raw_json")),
+    "issue_comments": (("repo_name", "issue_number", "comment_id", "created_at", "body", "body_has_vote",
+                        "reactions_total", "reactions_summary"),
+                       ("created_at", "body", "body_has_vote", "reactions_total", "reactions_summary")),
+    "issue_reactions": (("repo_name", "issue_number", "reaction_id", "created_at", "content", "user_login", "raw_json"),
+                        ("created_at", "content", "user_login", "raw_json")),
+    "comment_reactions": (("repo_name", "issue_number", "comment_id", "reaction_id", "created_at", "content",
+                           "user_login", "raw_json"),
+                          ("created_at", "content", "user_login", "raw_json"))
+}
+# Secondary indexes rebuilt by migrate_tables() => safe to drop for the load
+DEFERRED_INDEXES = (
+    ("issues", "idx_issues_repo_updated"),
+    ("pulls", "idx_pulls_repo_updated"),
+    ("stars", "idx_stars_repo_starred")
+)
+
+_enabled = False
+_defer_indexes = False
+_flush_rows = 50000
+_spool_dir = None
+_lock = threading.RLock()
+_spool_files = {}
+_spooled = 0
+
+def bulk_enabled():
+    return _enabled
+
+def _tsv_field(val):
+    if val is None:
+        return "\\N"
+    if isinstance(val, datetime):
+        return val.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(val, bool):
+        return str(int(val))
+    if isinstance(val, bytes):
+        val = val.decode("utf-8")
+    return (str(val).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r").replace("\0", "\\0"))
+
+def _spool_path(table):
+    return os.path.join(_spool_dir, f"{table}.tsv")
+
+def spool_row(conn, table, row, commit=False):
+    """
+    Queue one row for the next LOAD DATA. commit => flush + commit now.
+    """
+    global _spooled
+    line = "\t".join(_tsv_field(v) for v in row) + "\n"
+    with _lock:
+        f = _spool_files.get(table)
+        if f is None:
+            f = _spool_files[table] = open(_spool_path(table), "w", encoding="utf-8", newline="\n")
+        f.write(line)
+        _spooled += 1
+        flush_now = commit or _spooled >= _flush_rows
+    if flush_now:
+        commit_spooled(conn)
+
+def _load_table(c, table, path):
+    (cols, updates) = BULK_TABLES[table]
+    col_list = ", ".join(cols)
+    stage = f"bulk_stage_{table}"
+    c.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage} AS SELECT {col_list} FROM {table} LIMIT 0")
+    # default FIELDS/LINES => tab separated, backslash escapes, \N => NULL
+    c.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {stage} CHARACTER SET utf8mb4 ({col_list})", (path,))
+    loaded = c.rowcount
+    c.execute(f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {stage} "
+              "ON DUPLICATE KEY UPDATE " + ", ".join(f"{u}=VALUES({u})" for u in updates))
+    c.execute(f"DELETE FROM {stage}")
+    return loaded
+
+def flush_spool(conn):
+    """
+    LOAD DATA + merge every non-empty spool file. Caller commits (commit_spooled).
+    """
+    global _spooled
+    with _lock:
+        if not _spooled:
+            return
+        c = conn.cursor()
+        for table in BULK_TABLES:
+            f = _spool_files.pop(table, None)
+            if f is None:
+                continue
+            f.close()
+            loaded = _load_table(c, table, _spool_path(table))
+            logging.debug(f"[DEBUG] bulk => {table} => {loaded} row(s) loaded")
+        c.close()
+        _spooled = 0
+
+def commit_spooled(conn):
+    """
+    conn.commit() that first loads the spooled rows into the same transaction.
+    """
+    if not _enabled:
+        conn.commit()
+        return
+    with _lock:
+        flush_spool(conn)
+        conn.commit()
+
+def recount_bulk_repo(conn, repo_name):
+    """
+    Bulk rows skipped the per-row counters => closed/merged flags + repo_stats once.
+    """
+    c = conn.cursor()
+    for (parent, number_col, events, flag, event) in (
+            ("issues", "issue_number", "issue_events", "closed_seen", "closed"),
+            ("pulls", "pull_number", "pull_events", "closed_seen", "closed"),
+            ("pulls", "pull_number", "pull_events", "merged_seen", "merged")):
+        c.execute(f"""
+        UPDATE {parent} p JOIN (SELECT DISTINCT {number_col} FROM {events}
+                                WHERE repo_name=%s AND event=%s) e
+          ON p.{number_col}=e.{number_col}
+        SET p.{flag}=1
+        WHERE p.repo_name=%s
+        """, (repo_name, event, repo_name))
+    conn.commit()
+    c.close()
+    rebuild_repo_stats(conn, repo_name)
+
+def start_bulk(cfg, conn):
+    """
+    Turn bulk mode on (cfg["bulk_load"]) and drop the deferred indexes if asked.
+    """
+    global _enabled, _defer_indexes, _flush_rows, _spool_dir
+    if not cfg["bulk_load"]:
+        return
+    _enabled = True
+    _defer_indexes = bool(cfg["bulk_defer_indexes"])
+    _flush_rows = max(1, int(cfg["bulk_flush_rows"]))
+    _spool_dir = cfg["bulk_spool_dir"] or tempfile.mkdtemp(prefix="gh_bulk_")
+    os.makedirs(_spool_dir, exist_ok=True)
+    logging.info("Bulk load => on => spool=%s => flush every %d rows => defer indexes=%s",
+                 _spool_dir, _flush_rows, _defer_indexes)
+    if _defer_indexes:
+        c = conn.cursor()
+        for (table, index_name) in DEFERRED_INDEXES:
+            c.execute("""
+              SELECT COUNT(*) FROM information_schema.STATISTICS
+              WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s
+            """, (table, index_name))
+            if c.fetchone()[0]:
+                logging.info("Bulk load => %s index %s dropped until the load finishes", table, index_name)
+                c.execute(f"ALTER TABLE {table} DROP INDEX {index_name}")
+        conn.commit()
+        c.close()
+
+def finish_bulk(conn):
+    """
+    Load what is left and rebuild the deferred indexes.
+    """
+    global _enabled
+    if not _enabled:
+        return
+    commit_spooled(conn)
+    _enabled = False
+    if _defer_indexes:
+        logging.info("Bulk load => rebuilding deferred indexes")
+        migrate_tables(conn)
@@ -0,0 +1,155 @@
+# checkpoints.py
+"""
+Durable pagination cursors => fetch_checkpoints table.
+
+One row per (repo_name, resource, parent_id):
+  - repo-level listers (watchers/forks/stars/issues/pulls) use parent_id=0
+  - per-issue fetchers use parent_id=issue/pull number or comment_id
+  - the per-repo drivers ("issue_events", "comments", ...) use parent_id=0
+    and keep the last fully processed parent in high_water_id
+
+save_checkpoint() does NOT commit: the fetchers call it after inserting a
+page and then commit once, so the cursor and the page data land together.
+
+Without --resume the checkpoints of a repo are cleared when it starts.
+With --resume the fetchers restart from the stored page / parent and skip
+resources already marked completed.
+"""
+
+import logging
+
+# Per-repo drivers record their progress every N parents (one small upsert each time)
+DRIVER_CHECKPOINT_EVERY = 20
+
+_resume_mode = False
+
+def set_resume_mode(flag):
+    global _resume_mode
+    _resume_mode = bool(flag)
+    logging.info("Checkpoints => resume mode=%s", _resume_mode)
+
+def resume_enabled():
+    return _resume_mode
+
+def get_checkpoint(conn, repo_name, resource, parent_id=0):
+    """
+    Return dict(page, cursor_val, high_water_id, completed) or None.
+    """
+    c=conn.cursor()
+    c.execute("""
+      SELECT page, cursor_val, high_water_id, completed
+      FROM fetch_checkpoints
+      WHERE repo_name=%s AND resource=%s AND parent_id=%s
+    """,(repo_name,resource,parent_id))
+    row=c.fetchone()
+    c.close()
+    if not row:
+        return None
+    return {
+        "page": row[0] or 1,
+        "cursor_val": row[1],
+        "high_water_id": row[2] or 0,
+        "completed": row[3] or 0
+    }
+
+def save_checkpoint(conn, repo_name, resource, parent_id, page,
+                    high_water_id=0, cursor_val=None, completed=0):
+    """
+    Upsert the cursor. Caller commits (together with the page's rows).
+    """
+    c=conn.cursor()
+    c.execute("""
+    INSERT INTO fetch_checkpoints
+      (repo_name, resource, parent_id, page, cursor_val, high_water_id, completed, updated_at)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,NOW())
+    ON DUPLICATE KEY UPDATE
+      page=VALUES(page),
+      cursor_val=VALUES(cursor_val),
+      high_water_id=GREATEST(high_water_id,VALUES(high_water_id)),
+      completed=VALUES(completed),
+      updated_at=NOW()
+    """,(repo_name,resource,parent_id,page,cursor_val,high_water_id,completed))
+    c.close()
+
+def mark_completed(conn, repo_name, resource, parent_id=0, commit=True):
+    c=conn.cursor()
+    c.execute("""
+    INSERT INTO fetch_checkpoints
+      (repo_name, resource, parent_id, page, completed, updated_at)
+    VALUES (%s,%s,%s,1,1,NOW())
+    ON DUPLICATE KEY UPDATE completed=1, updated_at=NOW()
+    """,(repo_name,resource,parent_id))
+    if commit:
+        conn.commit()
+    c.close()
+
+def clear_parent_checkpoint(conn, repo_name, resource, parent_id):
+    """
+    Per-parent cursors are only useful while that parent is in flight => drop when done.
+    Caller commits.
+    """
+    c=conn.cursor()
+    c.execute("""
+    DELETE FROM fetch_checkpoints
+    WHERE repo_name=%s AND resource=%s AND parent_id=%s
+    """,(repo_name,resource,parent_id))
+    c.close()
+
+def reset_checkpoints(conn, repo_name):
+    c=conn.cursor()
+    c.execute("DELETE FROM fetch_checkpoints WHERE repo_name=%s",(repo_name,))
+    conn.commit()
+    c.close()
+
+def is_completed(conn, repo_name, resource):
+    """
+    Only meaningful in resume mode => otherwise always False.
+    """
+    if not _resume_mode:
+        return False
+    cp=get_checkpoint(conn,repo_name,resource,0)
+    return bool(cp and cp["completed"])
+
+def completed_this_run(conn, repo_name, resource):
+    """
+    Did the stage finish (mark_completed) since the run reset its checkpoints?
+    """
+    cp=get_checkpoint(conn,repo_name,resource,0)
+    return bool(cp and cp["completed"])
+
+def resume_page(conn, repo_name, resource, parent_id=0):
+    """
+    Page to start from => stored page in resume mode, else 1.
+    """
+    if not _resume_mode:
+        return 1
+    cp=get_checkpoint(conn,repo_name,resource,parent_id)
+    if not cp or cp["completed"]:
+        return 1
+    if cp["page"]>1:
+        logging.info("%s => resume %s (parent=%s) at page %d",repo_name,resource,parent_id,cp["page"])
+    return cp["page"]
+
+def resume_cursor(conn, repo_name, resource, parent_id=0):
+    """
+    cursor_val stored with an unfinished checkpoint (resume mode only), else None.
+    """
+    if not _resume_mode:
+        return None
+    cp=get_checkpoint(conn,repo_name,resource,parent_id)
+    if not cp or cp["completed"]:
+        return None
+    return cp["cursor_val"]
+
+def resume_parent(conn, repo_name, resource):
+    """
+    Last fully processed parent for a per-repo driver => skip parents <= it in resume mode.
+    """
+    if not _resume_mode:
+        return 0
+    cp=get_checkpoint(conn,repo_name,resource,0)
+    if not cp or cp["completed"]:
+        return 0
+    if cp["high_water_id"]:
+        logging.info("%s => resume %s after parent %d",repo_name,resource,cp["high_water_id"])
+    return cp["high_water_id"]
@@ -26,7 +26,9 @@ def connect_db(cfg, create_db_if_missing=True):
         port=db_conf["port"],
         user=db_conf["user"],
         password=db_conf["password"],
-        database=db_name
+        database=db_name,
+        # LOAD DATA LOCAL INFILE => bulk mode (see bulk_load.py)
+        allow_local_infile=bool(cfg["bulk_load"])
     )
     return conn
 
@@ -45,13 +47,32 @@ def create_tables(conn):
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS control_plane (
+      id INT PRIMARY KEY,
+      version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+      updated_at DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
     c.execute("""
     CREATE TABLE IF NOT EXISTS issues (
       id INT AUTO_INCREMENT PRIMARY KEY,
       repo_name VARCHAR(255) NOT NULL,
       issue_number INT NOT NULL,
       created_at DATETIME,
-      last_event_id BIGINT UNSIGNED DEFAULT 0
+      updated_at DATETIME,
+      state VARCHAR(16),
+      comments_count INT,
+      last_event_id BIGINT UNSIGNED DEFAULT 0,
+      events_synced_at DATETIME,
+      comments_synced_at DATETIME,
+      closed_seen TINYINT DEFAULT 0,
+      reactions_total INT,
+      reactions_summary VARCHAR(255),
+      reactions_synced_total INT,
+      KEY idx_issues_repo_number (repo_name, issue_number),
+      KEY idx_issues_repo_updated (repo_name, updated_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
@@ -61,7 +82,15 @@ def create_tables(conn):
       repo_name VARCHAR(255) NOT NULL,
       pull_number INT NOT NULL,
       created_at DATETIME,
-      last_event_id BIGINT UNSIGNED DEFAULT 0
+      updated_at DATETIME,
+      state VARCHAR(16),
+      comments_count INT,
+      last_event_id BIGINT UNSIGNED DEFAULT 0,
+      events_synced_at DATETIME,
+      closed_seen TINYINT DEFAULT 0,
+      merged_seen TINYINT DEFAULT 0,
+      KEY idx_pulls_repo_number (repo_name, pull_number),
+      KEY idx_pulls_repo_updated (repo_name, updated_at)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
@@ -72,7 +101,10 @@ def create_tables(conn):
       issue_number INT,
       event_id BIGINT UNSIGNED,
       created_at DATETIME,
-      raw_json JSON
+      event VARCHAR(64),
+      actor_login VARCHAR(255),
+      raw_json JSON,
+      UNIQUE KEY idx_issue_events_parent (repo_name, issue_number, event_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
@@ -83,7 +115,10 @@ def create_tables(conn):
       pull_number INT,
       event_id BIGINT UNSIGNED,
       created_at DATETIME,
-      raw_json JSON
+      event VARCHAR(64),
+      actor_login VARCHAR(255),
+      raw_json JSON,
+      UNIQUE KEY idx_pull_events_parent (repo_name, pull_number, event_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
@@ -95,6 +130,10 @@ def create_tables(conn):
       comment_id   BIGINT UNSIGNED NOT NULL,
       created_at   DATETIME,
       body LONGTEXT,
+      body_has_vote TINYINT,
+      reactions_total INT,
+      reactions_summary VARCHAR(255),
+      reactions_synced_total INT,
       UNIQUE KEY (repo_name, issue_number, comment_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
@@ -107,6 +146,8 @@ def create_tables(conn):
       comment_id   BIGINT UNSIGNED NOT NULL,
       reaction_id  BIGINT UNSIGNED NOT NULL,
       created_at   DATETIME,
+      content      VARCHAR(32),
+      user_login   VARCHAR(255),
       raw_json     JSON,
       UNIQUE KEY (repo_name, issue_number, comment_id, reaction_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
@@ -129,7 +170,58 @@ def create_tables(conn):
       user_login VARCHAR(255) NOT NULL,
       starred_at DATETIME,
       raw_json JSON,
-      UNIQUE KEY (repo_name, user_login, starred_at)
+      UNIQUE KEY (repo_name, user_login, starred_at),
+      KEY idx_stars_repo_starred (repo_name, starred_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Repo counters seen by the last completed run => pre-flight change detection
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS repo_snapshots (
+      repo_name VARCHAR(255) NOT NULL PRIMARY KEY,
+      pushed_at DATETIME,
+      updated_at DATETIME,
+      stargazers_count INT,
+      forks_count INT,
+      subscribers_count INT,
+      open_issues_count INT,
+      checked_at DATETIME,
+      full_synced_at DATETIME,
+      reactions_full_at DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Per-repo row counts and date range kept up to date by the inserts (see repo_stats.py)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS repo_stats (
+      repo_name VARCHAR(255) NOT NULL PRIMARY KEY,
+      issues_count INT NOT NULL DEFAULT 0,
+      pulls_count INT NOT NULL DEFAULT 0,
+      issue_events_count INT NOT NULL DEFAULT 0,
+      pull_events_count INT NOT NULL DEFAULT 0,
+      comments_count INT NOT NULL DEFAULT 0,
+      issue_reactions_count INT NOT NULL DEFAULT 0,
+      comment_reactions_count INT NOT NULL DEFAULT 0,
+      stars_count INT NOT NULL DEFAULT 0,
+      forks_count INT NOT NULL DEFAULT 0,
+      watchers_count INT NOT NULL DEFAULT 0,
+      closed_issues INT NOT NULL DEFAULT 0,
+      closed_pulls INT NOT NULL DEFAULT 0,
+      merged_pulls INT NOT NULL DEFAULT 0,
+      min_dt DATETIME,
+      max_dt DATETIME,
+      dirty TINYINT NOT NULL DEFAULT 0,
+      updated_at DATETIME,
+      rebuilt_at DATETIME
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    # Stargazer list length at the last complete star sync => tail-only sync check
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS star_sync (
+      repo_name VARCHAR(255) NOT NULL PRIMARY KEY,
+      listed_total INT NOT NULL,
+      synced_at DATETIME
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
@@ -139,6 +231,7 @@ def create_tables(conn):
       repo_name VARCHAR(255) NOT NULL,
       fork_id BIGINT UNSIGNED NOT NULL,
       created_at DATETIME,
+      owner_login VARCHAR(255),
       raw_json JSON,
       UNIQUE KEY (repo_name, fork_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
@@ -151,11 +244,202 @@ def create_tables(conn):
       issue_number INT NOT NULL,
       reaction_id BIGINT UNSIGNED NOT NULL,
       created_at DATETIME,
+      content VARCHAR(32),
+      user_login VARCHAR(255),
       raw_json JSON,
       UNIQUE KEY (repo_name, issue_number, reaction_id)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
 
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS raw_payloads (
+      table_name VARCHAR(32) NOT NULL,
+      row_key    VARCHAR(255) NOT NULL,
+      payload    LONGBLOB,
+      PRIMARY KEY (table_name, row_key)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      repo_name VARCHAR(255) NOT NULL,
+      resource VARCHAR(64) NOT NULL,
+      parent_id BIGINT UNSIGNED NOT NULL DEFAULT 0,
+      page INT DEFAULT 1,
+      cursor_val VARCHAR(255),
+      high_water_id BIGINT UNSIGNED DEFAULT 0,
+      completed TINYINT DEFAULT 0,
+      updated_at DATETIME,
+      UNIQUE KEY (repo_name, resource, parent_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
     conn.commit()
+    migrate_tables(conn)
     c.close()
     logging.info("All tables created/verified.")
+
+def ensure_column(c, table, column, ddl):
+    """
+    ALTER TABLE ... ADD COLUMN if it's missing (tables created by older versions).
+    Return True if the column was added.
+    """
+    c.execute("""
+      SELECT COUNT(*) FROM information_schema.COLUMNS
+      WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND COLUMN_NAME=%s
+    """,(table,column))
+    if c.fetchone()[0]:
+        return False
+    logging.info("Migrating => %s.%s added", table, column)
+    c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+def ensure_index(c, table, index_name, ddl):
+    """
+    ALTER TABLE ... ADD <ddl> if no index called index_name exists yet.
+    Return True if the index was added.
+    """
+    c.execute("""
+      SELECT COUNT(*) FROM information_schema.STATISTICS
+      WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s
+    """,(table,index_name))
+    if c.fetchone()[0]:
+        return False
+    logging.info("Migrating => %s index %s added", table, index_name)
+    c.execute(f"ALTER TABLE {table} ADD {ddl}")
+    return True
+
+def index_is_unique(c, table, index_name):
+    """
+    True/False for an existing index, None if there is no index called index_name.
+    """
+    c.execute("""
+      SELECT MAX(NON_UNIQUE) FROM information_schema.STATISTICS
+      WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s
+    """,(table,index_name))
+    non_unique=c.fetchone()[0]
+    return None if non_unique is None else not non_unique
+
+def dedup_events(conn, table, num_col, chunk_rows=50000):
+    """
+    Delete repeated (repo_name, number, event_id) rows, keeping the lowest id.
+    Walks the id range in chunks, one commit per chunk => short locks on big tables.
+    Return the number of rows deleted.
+    """
+    c=conn.cursor()
+    c.execute(f"SELECT COALESCE(MIN(id),0), COALESCE(MAX(id),0) FROM {table}")
+    (lo,hi)=c.fetchone()
+    deleted=0
+    while lo and lo<=hi:
+        c.execute(f"""
+        DELETE e FROM {table} e
+        JOIN {table} d
+          ON d.repo_name=e.repo_name AND d.{num_col}=e.{num_col}
+         AND d.event_id=e.event_id AND d.id<e.id
+        WHERE e.id BETWEEN %s AND %s
+        """,(lo,lo+chunk_rows-1))
+        deleted+=c.rowcount
+        conn.commit()
+        lo+=chunk_rows
+    c.close()
+    if deleted:
+        logging.info("Migrating => %s => %d duplicate event row(s) deleted", table, deleted)
+    return deleted
+
+def migrate_tables(conn):
+    """
+    Bring tables created by older versions up to the current columns.
+    Backfills only run right after the column was added.
+    """
+    c=conn.cursor()
+
+    # typed columns extracted from raw_json (see payloads.py)
+    for t in ("issue_events","pull_events"):
+        added=ensure_column(c,t,"event","VARCHAR(64) AFTER created_at")
+        added=ensure_column(c,t,"actor_login","VARCHAR(255) AFTER event") or added
+        if added:
+            c.execute(f"""
+            UPDATE {t}
+            SET event=JSON_UNQUOTE(JSON_EXTRACT(raw_json,'$.event')),
+                actor_login=JSON_UNQUOTE(JSON_EXTRACT(raw_json,'$.actor.login'))
+            WHERE raw_json IS NOT NULL
+            """)
+    if ensure_column(c,"forks","owner_login","VARCHAR(255) AFTER created_at"):
+        c.execute("""
+        UPDATE forks SET owner_login=JSON_UNQUOTE(JSON_EXTRACT(raw_json,'$.owner.login'))
+        WHERE raw_json IS NOT NULL
+        """)
+    for t in ("issue_reactions","comment_reactions"):
+        added=ensure_column(c,t,"content","VARCHAR(32) AFTER created_at")
+        added=ensure_column(c,t,"user_login","VARCHAR(255) AFTER content") or added
+        if added:
+            c.execute(f"""
+            UPDATE {t}
+            SET content=JSON_UNQUOTE(JSON_EXTRACT(raw_json,'$.content')),
+                user_login=JSON_UNQUOTE(JSON_EXTRACT(raw_json,'$.user.login'))
+            WHERE raw_json IS NOT NULL
+            """)
+    if ensure_column(c,"issue_comments","body_has_vote","TINYINT AFTER body"):
+        c.execute("""
+        UPDATE issue_comments
+        SET body_has_vote=(body LIKE '%+1%' OR body LIKE '%-1%')
+        WHERE body IS NOT NULL
+        """)
+
+    # embedded reaction summaries (see reaction_summaries.py) => NULL = never listed
+    for t in ("issues","issue_comments"):
+        ensure_column(c,t,"reactions_total","INT")
+        ensure_column(c,t,"reactions_summary","VARCHAR(255)")
+        ensure_column(c,t,"reactions_synced_total","INT")
+
+    # last full reaction-summary pass (see issue_sync.py) => NULL = never
+    ensure_column(c,"repo_snapshots","reactions_full_at","DATETIME AFTER full_synced_at")
+
+    # updated_at-driven refresh (see issue_sync.py) => NULL = listed by an older version
+    for (t,num_col) in (("issues","issue_number"),("pulls","pull_number")):
+        ensure_column(c,t,"updated_at","DATETIME AFTER created_at")
+        ensure_column(c,t,"state","VARCHAR(16) AFTER updated_at")
+        ensure_column(c,t,"comments_count","INT AFTER state")
+        ensure_column(c,t,"events_synced_at","DATETIME AFTER last_event_id")
+        ensure_index(c,t,f"idx_{t}_repo_number",f"KEY idx_{t}_repo_number (repo_name, {num_col})")
+        ensure_index(c,t,f"idx_{t}_repo_updated",f"KEY idx_{t}_repo_updated (repo_name, updated_at)")
+    ensure_column(c,"issues","comments_synced_at","DATETIME AFTER events_synced_at")
+
+    # distinct closed/merged parents counted once (see repo_stats.py)
+    if ensure_column(c,"issues","closed_seen","TINYINT DEFAULT 0 AFTER comments_synced_at"):
+        c.execute("""
+        UPDATE issues i JOIN (SELECT DISTINCT repo_name, issue_number FROM issue_events WHERE event='closed') e
+          ON e.repo_name=i.repo_name AND e.issue_number=i.issue_number
+        SET i.closed_seen=1
+        """)
+    added=ensure_column(c,"pulls","closed_seen","TINYINT DEFAULT 0 AFTER events_synced_at")
+    added=ensure_column(c,"pulls","merged_seen","TINYINT DEFAULT 0 AFTER closed_seen") or added
+    if added:
+        for (flag,event) in (("closed_seen","closed"),("merged_seen","merged")):
+            c.execute(f"""
+            UPDATE pulls p JOIN (SELECT DISTINCT repo_name, pull_number FROM pull_events WHERE event='{event}') e
+              ON e.repo_name=p.repo_name AND e.pull_number=p.pull_number
+            SET p.{flag}=1
+            """)
+
+    # one row per (parent, event_id) => reruns and overlapping pages upsert instead of duplicating;
+    # same key serves the grouped MAX(event_id) per parent => preloaded watermarks (see watermarks.py)
+    for (t,num_col) in (("issue_events","issue_number"),("pull_events","pull_number")):
+        if index_is_unique(c,t,f"idx_{t}_parent"):
+            continue
+        # plain key first => the self-join in dedup_events is an index lookup, not a scan per chunk
+        ensure_index(c,t,f"idx_{t}_parent",f"KEY idx_{t}_parent (repo_name, {num_col}, event_id)")
+        conn.commit()
+        if dedup_events(conn,t,num_col):
+            # counters included the duplicates => recount on next read (see repo_stats.py)
+            c.execute("UPDATE repo_stats SET dirty=1")
+        logging.info("Migrating => %s index idx_%s_parent => unique", t, t)
+        c.execute(f"ALTER TABLE {t} DROP INDEX idx_{t}_parent, "
+                  f"ADD UNIQUE KEY idx_{t}_parent (repo_name, {num_col}, event_id)")
+
+    # newest stored star per repo => tail-only star sync
+    ensure_index(c,"stars","idx_stars_repo_starred","KEY idx_stars_repo_starred (repo_name, starred_at)")
+
+    conn.commit()
+    c.close()
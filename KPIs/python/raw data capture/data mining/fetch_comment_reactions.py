@@ -1,56 +1,23 @@
 # fetch_comment_reactions.py
 
 import logging
-import time
-import requests
 from datetime import datetime
+from github_http import api_url, get_last_page, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
 from repo_baselines import refresh_baseline_info_mid_run
-
-def get_last_page(resp):
-    link_header = resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts = link_header.split(',')
-    for part in parts:
-        if 'rel="last"' in part:
-            import re
-            match = re.search(r'[?&]page=(\d+)', part)
-            if match:
-                return int(match.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    mini_retry_attempts = 3
-    for attempt in range(1, max_retries + 1):
-        local_attempt = 1
-        while local_attempt <= mini_retry_attempts:
-            try:
-                resp = session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code == 200:
-                    return (resp, True)
-                elif resp.status_code in (403, 429, 500, 502, 503, 504):
-                    logging.warning(
-                        "HTTP %d => attempt %d/%d => retry => %s",
-                        resp.status_code, attempt, max_retries, url
-                    )
-                    time.sleep(5)
-                else:
-                    logging.warning(
-                        "HTTP %d => attempt %d => break => %s",
-                        resp.status_code, attempt, url
-                    )
-                    return (resp, False)
-                break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s", url)
-                time.sleep(3)
-                local_attempt += 1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s", url)
-            return (None, False)
-    logging.warning("Exceeded max_retries => give up => %s", url)
-    return (None, False)
+from checkpoints import (
+    DRIVER_CHECKPOINT_EVERY,
+    resume_page,
+    resume_parent,
+    save_checkpoint,
+    mark_completed,
+    clear_parent_checkpoint
+)
+from payloads import store_payload, payload_key
+from reaction_summaries import comments_needing_reactions, mark_comment_reactions_synced
+from watermarks import load_max_ids
+from write_behind import defer, submit, batched, upsert_row
 
 def get_max_reaction_id_for_comment(conn, repo_name, issue_number, comment_id):
     c = conn.cursor()
@@ -77,46 +44,60 @@ def fetch_comment_reactions_for_all_comments(conn, owner, repo, enabled,
         return
     repo_name = f"{owner}/{repo}"
 
-    # get all known (issue_number, comment_id) from issue_comments
-    c = conn.cursor()
-    c.execute("""
-        SELECT issue_number, comment_id
-        FROM issue_comments
-        WHERE repo_name=%s
-    """,(repo_name,))
-    rows = c.fetchall()
-    c.close()
+    # only comments whose listed reaction total is non-zero and changed since last detail fetch
+    # comment_id order => a crash can resume after the last finished comment
+    resume_after = resume_parent(conn, repo_name, "comment_reactions")
+    rows = comments_needing_reactions(conn, repo_name, resume_after)
+    logging.info("Repo %s => comment_reactions => %d comment(s) with new reactions", repo_name, len(rows))
+
+    # newest stored reaction id of every comment => one grouped query
+    max_rids = load_max_ids(conn, "comment_reactions", ("comment_id",), "reaction_id", repo_name)
+    ops = []
 
-    for (issue_number, comment_id) in rows:
+    for idx, (issue_number, comment_id) in enumerate(rows, start=1):
         fetch_comment_reactions_single_thread(
             conn, repo_name,
             issue_number, comment_id,
             enabled,
             session, handle_rate_limit_func,
-            max_retries
+            max_retries,
+            highest_rid=max_rids.get(comment_id, 0)
         )
+        if idx % DRIVER_CHECKPOINT_EVERY == 0:
+            defer(ops, save_checkpoint, repo_name, "comment_reactions", 0, 1, comment_id)
+            submit(conn, ops)
+
+    defer(ops, mark_completed, repo_name, "comment_reactions", commit=False)
+    submit(conn, ops)
 
 def fetch_comment_reactions_single_thread(conn, repo_name,
                                          issue_number, comment_id,
                                          enabled,
                                          session,
                                          handle_rate_limit_func,
-                                         max_retries):
+                                         max_retries,
+                                         highest_rid=None):
     if enabled == 0:
         logging.info("%s => disabled => skip => comment_reactions => issue #%d => comment_id=%d",
                      repo_name, issue_number, comment_id)
         return
 
-    highest_rid = get_max_reaction_id_for_comment(conn, repo_name, issue_number, comment_id)
-    page = 1
+    if highest_rid is None:
+        highest_rid = get_max_reaction_id_for_comment(conn, repo_name, issue_number, comment_id)
+    start_page = resume_page(conn, repo_name, "comment_reactions", comment_id)
+    page = start_page
     last_page = None
+    # full pages before a resumed page count towards the synced total
+    seen_total = (start_page - 1) * 100
+    completed = False
+    ops = []
 
     # The endpoint => GET /repos/{owner}/{repo}/issues/comments/{comment_id}/reactions
     old_accept = session.headers.get("Accept","")
     session.headers["Accept"] = "application/vnd.github.squirrel-girl-preview+json"
 
     while True:
-        url = f"https://api.github.com/repos/{repo_name}/issues/comments/{comment_id}/reactions"
+        url = api_url(f"/repos/{repo_name}/issues/comments/{comment_id}/reactions")
         params = {"page": page, "per_page": 100}
         (resp, success) = robust_get_page(session, url, params, handle_rate_limit_func, max_retries)
         if not success:
@@ -127,7 +108,9 @@ def fetch_comment_reactions_single_thread(conn, repo_name,
             break
         data = resp.json()
         if not data:
+            completed = True
             break
+        seen_total += len(data)
 
         if last_page is None:
             last_page = get_last_page(resp)
@@ -137,7 +120,6 @@ def fetch_comment_reactions_single_thread(conn, repo_name,
                 f"[DEBUG] comment_reactions => page={page}/{last_page} => {progress:.3f}%% => {repo_name} => issue #{issue_number} => comment_id={comment_id}"
             )
 
-        new_count = 0
         for reac in data:
             reac_id = reac["id"]
             if reac_id <= highest_rid:
@@ -146,31 +128,36 @@ def fetch_comment_reactions_single_thread(conn, repo_name,
             cdt = None
             if cstr:
                 cdt = datetime.strptime(cstr, "%Y-%m-%dT%H:%M:%SZ")
-            insert_comment_reaction(conn, repo_name, issue_number, comment_id, reac_id, cdt, reac)
-            new_count += 1
+            defer(ops, insert_comment_reaction, repo_name, issue_number, comment_id, reac_id, cdt, reac, commit=False)
             if reac_id > highest_rid:
                 highest_rid = reac_id
 
         if len(data) < 100:
+            completed = True
             break
         page += 1
+        defer(ops, save_checkpoint, repo_name, "comment_reactions", comment_id, page, highest_rid)
+        submit(conn, ops)
 
     session.headers["Accept"] = old_accept
-
+    if completed:
+        # page rows of the last page + synced total => one submit
+        defer(ops, mark_comment_reactions_synced, repo_name, issue_number, comment_id, seen_total)
+    if page > start_page or start_page > 1:
+        defer(ops, clear_parent_checkpoint, repo_name, "comment_reactions", comment_id)
+    submit(conn, ops)
+
+@batched
 def insert_comment_reaction(conn, repo_name, issue_number, comment_id,
-                            reac_id, created_dt, reac_json):
-    import json
-    raw_str = json.dumps(reac_json, ensure_ascii=False)
-    c = conn.cursor()
-    sql = """
-    INSERT INTO comment_reactions
-      (repo_name, issue_number, comment_id, reaction_id, created_at, raw_json)
-    VALUES
-      (%s,%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      created_at=VALUES(created_at),
-      raw_json=VALUES(raw_json)
-    """
-    c.execute(sql, (repo_name, issue_number, comment_id, reac_id, created_dt, raw_str))
-    conn.commit()
-    c.close()
+                            reac_id, created_dt, reac_json, commit=True):
+    content = reac_json.get("content")
+    user_login = (reac_json.get("user") or {}).get("login")
+    raw_str = store_payload(conn, "comment_reactions",
+                            payload_key(repo_name, issue_number, comment_id, reac_id), reac_json)
+    row = (repo_name, issue_number, comment_id, reac_id, created_dt, content, user_login, raw_str)
+    if bulk_enabled():
+        spool_row(conn, "comment_reactions", row, commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn, "comment_reactions", row, repo_name, created_dt, commit=commit)
+    count_rows(repo_name)
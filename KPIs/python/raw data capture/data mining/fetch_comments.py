@@ -1,51 +1,23 @@
 # fetch_comments.py
 import logging
-import time
-import requests
 from datetime import datetime
+from github_http import api_url, get_last_page, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
 from repo_baselines import refresh_baseline_info_mid_run
-
-def get_last_page(resp):
-    link_header=resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts=link_header.split(',')
-    for p in parts:
-        if 'rel="last"' in p:
-            import re
-            m=re.search(r'[?&]page=(\d+)',p)
-            if m:
-                return int(m.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    mini_retry_attempts=3
-    for attempt in range(1,max_retries+1):
-        local_attempt=1
-        while local_attempt<=mini_retry_attempts:
-            try:
-                resp=session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code==200:
-                    return (resp,True)
-                elif resp.status_code in (403,429,500,502,503,504):
-                    logging.warning("HTTP %d => attempt %d/%d => retry => %s",
-                                    resp.status_code,attempt,max_retries,url)
-                    time.sleep(5)
-                else:
-                    logging.warning("HTTP %d => attempt %d => break => %s",
-                                    resp.status_code,attempt,url)
-                    return (resp,False)
-                break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s",url)
-                time.sleep(3)
-                local_attempt+=1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s",url)
-            return (None,False)
-    logging.warning("Exceeded max_retries => give up => %s",url)
-    return (None,False)
+from checkpoints import (
+    DRIVER_CHECKPOINT_EVERY,
+    resume_page,
+    resume_parent,
+    save_checkpoint,
+    mark_completed,
+    clear_parent_checkpoint
+)
+from payloads import store_text, payload_key, has_vote
+from reaction_summaries import reaction_summary, update_comment_reaction_summary
+from issue_sync import numbers_needing_sync, mark_synced_many
+from watermarks import load_max_ids
+from write_behind import defer, submit, batched, upsert_row
 
 def get_max_comment_id_for_issue(conn, repo_name, issue_num):
     c=conn.cursor()
@@ -67,35 +39,58 @@ def fetch_comments_for_all_issues(conn, owner, repo, enabled,
         logging.info("Repo %s/%s => disabled => skip all comments",owner,repo)
         return
     repo_name=f"{owner}/{repo}"
-    c=conn.cursor()
-    c.execute("SELECT issue_number FROM issues WHERE repo_name=%s",(repo_name,))
-    rows=c.fetchall()
-    c.close()
-    for (issue_num,) in rows:
-        list_issue_comments_single_thread(
+    resume_after=resume_parent(conn,repo_name,"comments")
+    # only issues updated since their last successful comments visit
+    rows=numbers_needing_sync(conn,"issues","comments_synced_at",repo_name,resume_after)
+    # newest stored comment id of every issue => one grouped query
+    max_cids=load_max_ids(conn,"issue_comments",("issue_number",),"comment_id",repo_name)
+    synced=[]
+    ops=[]
+    for idx,(issue_num,) in enumerate(rows,start=1):
+        if list_issue_comments_single_thread(
             conn, repo_name, issue_num,
             enabled, session,
             handle_rate_limit_func,
-            max_retries
-        )
+            max_retries,
+            highest_cid=max_cids.get(issue_num,0)
+        ):
+            synced.append(issue_num)
+        if idx%DRIVER_CHECKPOINT_EVERY==0:
+            # queued after the comments they cover => never ahead of the data
+            defer(ops,mark_synced_many,"issues","comments_synced_at",repo_name,list(synced))
+            defer(ops,save_checkpoint,repo_name,"comments",0,1,issue_num)
+            submit(conn,ops)
+            del synced[:]
+    defer(ops,mark_synced_many,"issues","comments_synced_at",repo_name,list(synced))
+    defer(ops,mark_completed,repo_name,"comments",commit=False)
+    submit(conn,ops)
 
 def list_issue_comments_single_thread(conn, repo_name, issue_num,
                                       enabled, session,
-                                      handle_rate_limit_func, max_retries):
+                                      handle_rate_limit_func, max_retries,
+                                      highest_cid=None):
+    """
+    highest_cid => preloaded newest stored comment id (None => look it up).
+    Returns True when every page was read.
+    """
     if enabled==0:
         logging.info("%s => disabled => skip => issue #%d => comments",repo_name,issue_num)
-        return
-    highest_cid=get_max_comment_id_for_issue(conn,repo_name,issue_num)
-    page=1
+        return False
+    if highest_cid is None:
+        highest_cid=get_max_comment_id_for_issue(conn,repo_name,issue_num)
+    start_page=resume_page(conn,repo_name,"comments",issue_num)
+    page=start_page
     last_page=None
+    ok=True
+    ops=[]
     while True:
-        old_val=highest_cid
-        url=f"https://api.github.com/repos/{repo_name}/issues/{issue_num}/comments"
+        url=api_url(f"/repos/{repo_name}/issues/{issue_num}/comments")
         params={"page":page,"per_page":50,"sort":"created","direction":"asc"}
         (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
         if not success:
             logging.warning("Comments => skip => page %d => %s => issue #%d",
                             page,repo_name,issue_num)
+            ok=False
             break
         data=resp.json()
         if not data:
@@ -106,37 +101,84 @@ def list_issue_comments_single_thread(conn, repo_name, issue_num,
             progress=(page/last_page)*100
             logging.debug(f"[DEBUG] issue_comments => page={page}/{last_page} => {progress:.3f}%% => {repo_name} => issue #{issue_num}")
 
-        new_count=0
         for cmt in data:
             cid=cmt["id"]
             if cid<=highest_cid:
+                # already stored => only refresh its embedded reaction counts
+                defer(ops,update_comment_reaction_summary,repo_name,issue_num,cid,cmt)
                 continue
             c_str=cmt.get("created_at")
             cdt=None
             if c_str:
                 cdt=datetime.strptime(c_str,"%Y-%m-%dT%H:%M:%SZ")
-            insert_comment_record(conn,repo_name,issue_num,cid,cdt,cmt)
-            new_count+=1
+            defer(ops,insert_comment_record,repo_name,issue_num,cid,cdt,cmt,commit=False)
             if cid>highest_cid:
                 highest_cid=cid
-        if new_count<50:
+        if len(data)<50:
+            submit(conn,ops)
             break
         page+=1
+        defer(ops,save_checkpoint,repo_name,"comments",issue_num,page,highest_cid)
+        submit(conn,ops)
+    if page>start_page or start_page>1:
+        defer(ops,clear_parent_checkpoint,repo_name,"comments",issue_num)
+        submit(conn,ops)
+    return ok
 
-def insert_comment_record(conn, repo_name, issue_num, comment_id, created_dt, cmt_json):
-    body=cmt_json.get("body","")
-    import json
-    raw_str=json.dumps(cmt_json,ensure_ascii=False)
-    c=conn.cursor()
-    sql="""
-    INSERT INTO issue_comments
-      (repo_name, issue_number, comment_id, created_at, body)
-    VALUES
-      (%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      created_at=VALUES(created_at),
-      body=VALUES(body)
+def refresh_comment_reaction_summaries(conn, owner, repo, enabled,
+                                       session, handle_rate_limit_func,
+                                       max_retries):
     """
-    c.execute(sql,(repo_name,issue_num,comment_id,created_dt,body))
-    conn.commit()
-    c.close()
+    Full reaction-summary pass => one repo-wide comment listing refreshes the
+    embedded reaction totals of every stored comment (reactions do not bump
+    the issue's updated_at, see issue_sync.py). Comments not stored yet are
+    left to fetch_comments_for_all_issues.
+    Returns True when every page was read.
+    """
+    if enabled==0:
+        logging.info("Repo %s/%s => disabled => skip comment_summaries",owner,repo)
+        return False
+    repo_name=f"{owner}/{repo}"
+    page=resume_page(conn,repo_name,"comment_summaries")
+    completed=False
+    ops=[]
+    while True:
+        url=api_url(f"/repos/{owner}/{repo}/issues/comments")
+        params={"sort":"created","direction":"asc","page":page,"per_page":100}
+        (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
+        if not success:
+            logging.warning("Comment summaries => page %d => skip => %s",page,repo_name)
+            break
+        data=resp.json()
+        if not data:
+            completed=True
+            break
+        logging.debug(f"[DEBUG] comment_summaries => page={page} => {repo_name}")
+        for cmt in data:
+            issue_num=int(cmt["issue_url"].rsplit("/",1)[1])
+            defer(ops,update_comment_reaction_summary,repo_name,issue_num,cmt["id"],cmt)
+        defer(ops,save_checkpoint,repo_name,"comment_summaries",0,page+1)
+        submit(conn,ops)
+        if len(data)<100:
+            completed=True
+            break
+        page+=1
+    if completed:
+        defer(ops,mark_completed,repo_name,"comment_summaries",commit=False)
+        submit(conn,ops)
+    return completed
+
+@batched
+def insert_comment_record(conn, repo_name, issue_num, comment_id, created_dt, cmt_json, commit=True):
+    body=cmt_json.get("body","")
+    body_has_vote=has_vote(body)
+    body=store_text(conn,"issue_comments",payload_key(repo_name,issue_num,comment_id),body)
+    reactions_total,reactions_summary=reaction_summary(cmt_json)
+    row=(repo_name,issue_num,comment_id,created_dt,body,body_has_vote,
+         reactions_total,reactions_summary)
+    if bulk_enabled():
+        spool_row(conn,"issue_comments",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"issue_comments",row,repo_name,created_dt,commit=commit)
+    count_rows(repo_name)
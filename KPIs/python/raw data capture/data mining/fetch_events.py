@@ -1,64 +1,65 @@
 # fetch_events.py
 
 import logging
-import time
-import requests
 from datetime import datetime
+from github_http import api_url, get_last_page, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
 from repo_baselines import refresh_baseline_info_mid_run
+from checkpoints import (
+    DRIVER_CHECKPOINT_EVERY,
+    resume_page,
+    resume_parent,
+    save_checkpoint,
+    mark_completed,
+    clear_parent_checkpoint
+)
+from payloads import store_payload, payload_key
+from issue_sync import numbers_needing_sync, mark_synced_many
+from watermarks import load_last_event_ids, flush_last_event_ids
+from write_behind import defer, submit, batched, upsert_row
 
-def get_last_page(resp):
-    link_header = resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts = link_header.split(',')
-    for part in parts:
-        if 'rel="last"' in part:
-            import re
-            match = re.search(r'[?&]page=(\d+)', part)
-            if match:
-                return int(match.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
+############################
+# 0) Tail-first paging
+############################
+
+def fetch_new_events_tail_first(session, url, last_eid,
+                                handle_rate_limit_func, max_retries):
     """
-    A function that attempts multiple times (max_retries) to GET a page from GitHub,
-    handling connection errors locally and rate-limit logic with handle_rate_limit_func.
+    Events newer than last_eid, oldest first, without re-reading old pages.
+    Page 1 gives rel="last"; then walk last, last-1, ... back until a page
+    reaches a known id (or page 1). Returns (events, ok); ok=False => a page
+    failed => nothing is returned so the caller's watermark can't skip a gap.
     """
-    mini_retry_attempts = 3
-    for attempt in range(1, max_retries + 1):
-        local_attempt = 1
-        while local_attempt <= mini_retry_attempts:
-            try:
-                resp = session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code == 200:
-                    return (resp, True)
-                elif resp.status_code in (403, 429, 500, 502, 503, 504):
-                    logging.warning(
-                        "HTTP %d => attempt %d/%d => retry => %s",
-                        resp.status_code, attempt, max_retries, url
-                    )
-                    time.sleep(5)
-                else:
-                    logging.warning(
-                        "HTTP %d => attempt %d => break => %s",
-                        resp.status_code, attempt, url
-                    )
-                    return (resp, False)
+    (resp, success) = robust_get_page(
+        session, url, {"page": 1, "per_page": 100}, handle_rate_limit_func, max_retries
+    )
+    if not success:
+        return ([], False)
+    first_data = resp.json() or []
+    last_page = get_last_page(resp)
+
+    pages = [first_data]
+    if last_page and last_page > 1:
+        tail = []
+        page = last_page
+        while page > 1:
+            (resp, success) = robust_get_page(
+                session, url, {"page": page, "per_page": 100}, handle_rate_limit_func, max_retries
+            )
+            if not success:
+                return ([], False)
+            data = resp.json() or []
+            tail.append(data)
+            if data and min(evt["id"] for evt in data) <= last_eid:
                 break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s", url)
-                time.sleep(3)
-                local_attempt += 1
-        if local_attempt > mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s", url)
-            return (None, False)
-    logging.warning("Exceeded max_retries => give up => %s", url)
-    return (None, False)
+            page -= 1
+        else:
+            tail.append(first_data)
+        pages = list(reversed(tail))
+        logging.debug(f"[DEBUG] events tail-first => {len(tail) + 1} request(s) of {last_page} page(s) => {url}")
 
-############################
-# 1) Issue Events
-############################
+    return ([evt for data in pages for evt in data if evt["id"] > last_eid], True)
 
 def get_last_event_id_for_issue(conn, repo_name, issue_num):
     c = conn.cursor()
@@ -72,7 +73,7 @@ def get_last_event_id_for_issue(conn, repo_name, issue_num):
         return row[0]
     return 0
 
-def set_last_event_id_for_issue(conn, repo_name, issue_num, new_val):
+def set_last_event_id_for_issue(conn, repo_name, issue_num, new_val, commit=True):
     c = conn.cursor()
     c.execute(
         """
@@ -82,7 +83,8 @@ def set_last_event_id_for_issue(conn, repo_name, issue_num, new_val):
         """,
         (new_val, repo_name, issue_num)
     )
-    conn.commit()
+    if commit:
+        conn.commit()
     c.close()
 
 def fetch_issue_events_for_all_issues(conn, owner, repo,
@@ -94,31 +96,82 @@ def fetch_issue_events_for_all_issues(conn, owner, repo,
         return
 
     repo_name = f"{owner}/{repo}"
-    c = conn.cursor()
-    c.execute("SELECT issue_number FROM issues WHERE repo_name=%s", (repo_name,))
-    rows = c.fetchall()
-    c.close()
-
-    for (issue_num,) in rows:
-        fetch_issue_events_single_thread(
+    resume_after = resume_parent(conn, repo_name, "issue_events")
+    # only issues updated since their last successful events visit
+    rows = numbers_needing_sync(conn, "issues", "events_synced_at", repo_name, resume_after)
+
+    # all watermarks of the repo in one go; changed ones are written back in batches
+    marks = load_last_event_ids(conn, repo_name, "issues", "issue_number", "issue_events")
+    pending_marks = {}
+    synced = []
+    ops = []
+
+    for idx, (issue_num,) in enumerate(rows, start=1):
+        last_eid = marks.get(issue_num, 0)
+        (ok, highest_eid) = fetch_issue_events_single_thread(
             conn, repo_name, issue_num, enabled,
-            session, handle_rate_limit_func, max_retries
+            session, handle_rate_limit_func, max_retries,
+            last_eid=last_eid
         )
+        if highest_eid > last_eid:
+            marks[issue_num] = pending_marks[issue_num] = highest_eid
+        if ok:
+            synced.append(issue_num)
+        if idx % DRIVER_CHECKPOINT_EVERY == 0:
+            # queued after the events they cover => never ahead of the data
+            defer(ops, flush_last_event_ids, "issues", "issue_number", repo_name, dict(pending_marks))
+            defer(ops, mark_synced_many, "issues", "events_synced_at", repo_name, list(synced))
+            defer(ops, save_checkpoint, repo_name, "issue_events", 0, 1, issue_num)
+            submit(conn, ops)
+            pending_marks.clear()
+            del synced[:]
+
+    defer(ops, flush_last_event_ids, "issues", "issue_number", repo_name, dict(pending_marks))
+    defer(ops, mark_synced_many, "issues", "events_synced_at", repo_name, list(synced))
+    defer(ops, mark_completed, repo_name, "issue_events", commit=False)
+    submit(conn, ops)
 
 def fetch_issue_events_single_thread(conn, repo_name, issue_num,
                                      enabled, session,
-                                     handle_rate_limit_func, max_retries):
+                                     handle_rate_limit_func, max_retries,
+                                    last_eid=None):
+    """
+    New events of one issue => (ok, highest event id). last_eid => preloaded
+    watermark (None => look it up); the caller writes the new one back.
+    """
+    if last_eid is None:
+        last_eid = get_last_event_id_for_issue(conn, repo_name, issue_num)
     if enabled == 0:
         logging.info("%s => disabled => skip => issue_events => #%d", repo_name, issue_num)
-        return
+        return (False, last_eid)
 
-    last_eid = get_last_event_id_for_issue(conn, repo_name, issue_num)
     highest_eid = last_eid
-    page = 1
+    start_page = resume_page(conn, repo_name, "issue_events", issue_num)
+    ops = []
+    page = start_page
     last_page = None
 
+    if last_eid and start_page == 1:
+        # known issue => only the tail can hold new events
+        url = api_url(f"/repos/{repo_name}/issues/{issue_num}/events")
+        (new_events, ok) = fetch_new_events_tail_first(
+            session, url, last_eid, handle_rate_limit_func, max_retries
+        )
+        if not ok:
+            logging.warning("Issue Events => tail fetch failed => issue #%d => %s", issue_num, repo_name)
+            return (False, last_eid)
+        for evt in new_events:
+            cstr = evt.get("created_at")
+            cdt = datetime.strptime(cstr, "%Y-%m-%dT%H:%M:%SZ") if cstr else None
+            defer(ops, insert_issue_event_record, repo_name, issue_num, evt["id"], cdt, evt, commit=False)
+            if evt["id"] > highest_eid:
+                highest_eid = evt["id"]
+        submit(conn, ops)
+        return (True, highest_eid)
+
+    ok = True
     while True:
-        url = f"https://api.github.com/repos/{repo_name}/issues/{issue_num}/events"
+        url = api_url(f"/repos/{repo_name}/issues/{issue_num}/events")
         params = {"page": page, "per_page": 100}
 
         (resp, success) = robust_get_page(
@@ -129,6 +182,7 @@ def fetch_issue_events_single_thread(conn, repo_name, issue_num,
                 "Issue Events => can't fetch page %d => issue #%d => %s",
                 page, issue_num, repo_name
             )
+            ok = False
             break
 
         data = resp.json()
@@ -143,7 +197,6 @@ def fetch_issue_events_single_thread(conn, repo_name, issue_num,
                 f"[DEBUG] issue_events => page={page}/{last_page} => {progress:.3f}%% => {repo_name} => issue #{issue_num}"
             )
 
-        new_count = 0
         for evt in data:
             eid = evt["id"]
             if eid <= last_eid:
@@ -152,33 +205,37 @@ def fetch_issue_events_single_thread(conn, repo_name, issue_num,
             cdt = None
             if cstr:
                 cdt = datetime.strptime(cstr, "%Y-%m-%dT%H:%M:%SZ")
-            insert_issue_event_record(conn, repo_name, issue_num, eid, cdt, evt)
-            new_count += 1
+            defer(ops, insert_issue_event_record, repo_name, issue_num, eid, cdt, evt, commit=False)
             if eid > highest_eid:
                 highest_eid = eid
 
-        if new_count < 100:
+        # page rows (+ cursor if more pages follow) => one commit
+        if len(data) < 100:
+            submit(conn, ops)
             break
 
         page += 1
+        defer(ops, save_checkpoint, repo_name, "issue_events", issue_num, page, highest_eid)
+        submit(conn, ops)
 
-    if highest_eid > last_eid:
-        set_last_event_id_for_issue(conn, repo_name, issue_num, highest_eid)
+    if page > start_page or start_page > 1:
+        defer(ops, clear_parent_checkpoint, repo_name, "issue_events", issue_num)
+        submit(conn, ops)
+    return (ok, highest_eid)
 
+@batched
 def insert_issue_event_record(conn, repo_name, issue_num, event_id,
-                              created_dt, evt_json):
-    import json
-    raw_str = json.dumps(evt_json, ensure_ascii=False)
-    c = conn.cursor()
-    sql = """
-    INSERT INTO issue_events
-      (repo_name, issue_number, event_id, created_at, raw_json)
-    VALUES
-      (%s,%s,%s,%s,%s)
-    """
-    c.execute(sql, (repo_name, issue_num, event_id, created_dt, raw_str))
-    conn.commit()
-    c.close()
+                              created_dt, evt_json, commit=True):
+    event = evt_json.get("event")
+    actor_login = (evt_json.get("actor") or {}).get("login")
+    raw_str = store_payload(conn, "issue_events", payload_key(repo_name, issue_num, event_id), evt_json)
+    row = (repo_name, issue_num, event_id, created_dt, event, actor_login, raw_str)
+    if bulk_enabled():
+        spool_row(conn, "issue_events", row, commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn, "issue_events", row, repo_name, created_dt, event_flag=(issue_num, event), commit=commit)
+    count_rows(repo_name)
 
 ############################
 # 2) Pull Events
@@ -196,7 +253,7 @@ def get_last_event_id_for_pull(conn, repo_name, pull_num):
         return row[0]
     return 0
 
-def set_last_event_id_for_pull(conn, repo_name, pull_num, new_val):
+def set_last_event_id_for_pull(conn, repo_name, pull_num, new_val, commit=True):
     c = conn.cursor()
     c.execute(
         """
@@ -206,7 +263,8 @@ def set_last_event_id_for_pull(conn, repo_name, pull_num, new_val):
         """,
         (new_val, repo_name, pull_num)
     )
-    conn.commit()
+    if commit:
+        conn.commit()
     c.close()
 
 def fetch_pull_events_for_all_pulls(conn, owner, repo,
@@ -218,31 +276,82 @@ def fetch_pull_events_for_all_pulls(conn, owner, repo,
         return
 
     repo_name = f"{owner}/{repo}"
-    c = conn.cursor()
-    c.execute("SELECT pull_number FROM pulls WHERE repo_name=%s", (repo_name,))
-    rows = c.fetchall()
-    c.close()
-
-    for (pull_num,) in rows:
-        fetch_pull_events_single_thread(
+    resume_after = resume_parent(conn, repo_name, "pull_events")
+    # only pulls updated since their last successful events visit
+    rows = numbers_needing_sync(conn, "pulls", "events_synced_at", repo_name, resume_after)
+
+    # all watermarks of the repo in one go; changed ones are written back in batches
+    marks = load_last_event_ids(conn, repo_name, "pulls", "pull_number", "pull_events")
+    pending_marks = {}
+    synced = []
+    ops = []
+
+    for idx, (pull_num,) in enumerate(rows, start=1):
+        last_eid = marks.get(pull_num, 0)
+        (ok, highest_eid) = fetch_pull_events_single_thread(
             conn, repo_name, pull_num, enabled,
-            session, handle_rate_limit_func, max_retries
+            session, handle_rate_limit_func, max_retries,
+            last_eid=last_eid
         )
+        if highest_eid > last_eid:
+            marks[pull_num] = pending_marks[pull_num] = highest_eid
+        if ok:
+            synced.append(pull_num)
+        if idx % DRIVER_CHECKPOINT_EVERY == 0:
+            # queued after the events they cover => never ahead of the data
+            defer(ops, flush_last_event_ids, "pulls", "pull_number", repo_name, dict(pending_marks))
+            defer(ops, mark_synced_many, "pulls", "events_synced_at", repo_name, list(synced))
+            defer(ops, save_checkpoint, repo_name, "pull_events", 0, 1, pull_num)
+            submit(conn, ops)
+            pending_marks.clear()
+            del synced[:]
+
+    defer(ops, flush_last_event_ids, "pulls", "pull_number", repo_name, dict(pending_marks))
+    defer(ops, mark_synced_many, "pulls", "events_synced_at", repo_name, list(synced))
+    defer(ops, mark_completed, repo_name, "pull_events", commit=False)
+    submit(conn, ops)
 
 def fetch_pull_events_single_thread(conn, repo_name, pull_num,
                                     enabled, session,
-                                    handle_rate_limit_func, max_retries):
+                                    handle_rate_limit_func, max_retries,
+                                    last_eid=None):
+    """
+    New events of one pull => (ok, highest event id). last_eid => preloaded
+    watermark (None => look it up); the caller writes the new one back.
+    """
+    if last_eid is None:
+        last_eid = get_last_event_id_for_pull(conn, repo_name, pull_num)
     if enabled == 0:
         logging.info("%s => disabled => skip => pull_events => #%d", repo_name, pull_num)
-        return
+        return (False, last_eid)
 
-    last_eid = get_last_event_id_for_pull(conn, repo_name, pull_num)
     highest_eid = last_eid
-    page = 1
+    start_page = resume_page(conn, repo_name, "pull_events", pull_num)
+    ops = []
+    page = start_page
     last_page = None
 
+    if last_eid and start_page == 1:
+        # known pull => only the tail can hold new events
+        url = api_url(f"/repos/{repo_name}/issues/{pull_num}/events")
+        (new_events, ok) = fetch_new_events_tail_first(
+            session, url, last_eid, handle_rate_limit_func, max_retries
+        )
+        if not ok:
+            logging.warning("Pull Events => tail fetch failed => PR #%d => %s", pull_num, repo_name)
+            return (False, last_eid)
+        for evt in new_events:
+            cstr = evt.get("created_at")
+            cdt = datetime.strptime(cstr, "%Y-%m-%dT%H:%M:%SZ") if cstr else None
+            defer(ops, insert_pull_event_record, repo_name, pull_num, evt["id"], cdt, evt, commit=False)
+            if evt["id"] > highest_eid:
+                highest_eid = evt["id"]
+        submit(conn, ops)
+        return (True, highest_eid)
+
+    ok = True
     while True:
-        url = f"https://api.github.com/repos/{repo_name}/issues/{pull_num}/events"
+        url = api_url(f"/repos/{repo_name}/issues/{pull_num}/events")
         params = {"page": page, "per_page": 100}
 
         (resp, success) = robust_get_page(
@@ -253,6 +362,7 @@ def fetch_pull_events_single_thread(conn, repo_name, pull_num,
                 "Pull Events => can't fetch page %d => PR #%d => %s",
                 page, pull_num, repo_name
             )
+            ok = False
             break
 
         data = resp.json()
@@ -267,7 +377,6 @@ def fetch_pull_events_single_thread(conn, repo_name, pull_num,
                 f"[DEBUG] pull_events => page={page}/{last_page} => {progress:.3f}%% => {repo_name} => PR #{pull_num}"
             )
 
-        new_count = 0
         for evt in data:
             eid = evt["id"]
             if eid <= last_eid:
@@ -276,30 +385,34 @@ def fetch_pull_events_single_thread(conn, repo_name, pull_num,
             cdt = None
             if cstr:
                 cdt = datetime.strptime(cstr, "%Y-%m-%dT%H:%M:%SZ")
-            insert_pull_event_record(conn, repo_name, pull_num, eid, cdt, evt)
-            new_count += 1
+            defer(ops, insert_pull_event_record, repo_name, pull_num, eid, cdt, evt, commit=False)
             if eid > highest_eid:
                 highest_eid = eid
 
-        if new_count < 100:
+        # page rows (+ cursor if more pages follow) => one commit
+        if len(data) < 100:
+            submit(conn, ops)
             break
 
         page += 1
+        defer(ops, save_checkpoint, repo_name, "pull_events", pull_num, page, highest_eid)
+        submit(conn, ops)
 
-    if highest_eid > last_eid:
-        set_last_event_id_for_pull(conn, repo_name, pull_num, highest_eid)
+    if page > start_page or start_page > 1:
+        defer(ops, clear_parent_checkpoint, repo_name, "pull_events", pull_num)
+        submit(conn, ops)
+    return (ok, highest_eid)
 
+@batched
 def insert_pull_event_record(conn, repo_name, pull_num, event_id,
-                             created_dt, evt_json):
-    import json
-    raw_str = json.dumps(evt_json, ensure_ascii=False)
-    c = conn.cursor()
-    sql = """
-    INSERT INTO pull_events
-      (repo_name, pull_number, event_id, created_at, raw_json)
-    VALUES
-      (%s,%s,%s,%s,%s)
-    """
-    c.execute(sql, (repo_name, pull_num, event_id, created_dt, raw_str))
-    conn.commit()
-    c.close()
+                             created_dt, evt_json, commit=True):
+    event = evt_json.get("event")
+    actor_login = (evt_json.get("actor") or {}).get("login")
+    raw_str = store_payload(conn, "pull_events", payload_key(repo_name, pull_num, event_id), evt_json)
+    row = (repo_name, pull_num, event_id, created_dt, event, actor_login, raw_str)
+    if bulk_enabled():
+        spool_row(conn, "pull_events", row, commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn, "pull_events", row, repo_name, created_dt, event_flag=(pull_num, event), commit=commit)
+    count_rows(repo_name)
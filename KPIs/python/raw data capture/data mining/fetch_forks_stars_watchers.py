@@ -1,51 +1,13 @@
 # fetch_forks_stars_watchers.py
 import logging
-import time
-import requests
 from datetime import datetime
-from repo_baselines import refresh_baseline_info_mid_run
-
-def get_last_page(resp):
-    link_header=resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts=link_header.split(',')
-    for p in parts:
-        if 'rel="last"' in p:
-            import re
-            m=re.search(r'[?&]page=(\d+)',p)
-            if m:
-                return int(m.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    mini_retry_attempts=3
-    for attempt in range(1,max_retries+1):
-        local_attempt=1
-        while local_attempt<=mini_retry_attempts:
-            try:
-                resp=session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code==200:
-                    return (resp,True)
-                elif resp.status_code in (403,429,500,502,503,504):
-                    logging.warning("HTTP %d => attempt %d/%d => retry => %s",
-                                    resp.status_code,attempt,max_retries,url)
-                    time.sleep(5)
-                else:
-                    logging.warning("HTTP %d => attempt %d => break => %s",
-                                    resp.status_code,attempt,url)
-                    return (resp,False)
-                break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s",url)
-                time.sleep(3)
-                local_attempt+=1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s",url)
-            return (None,False)
-    logging.warning("Exceeded max_retries => give up => %s",url)
-    return (None,False)
+from github_http import api_url, get_last_page, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
+from repo_baselines import is_repo_enabled_cached
+from checkpoints import resume_page, save_checkpoint, mark_completed
+from payloads import store_payload, payload_key
+from write_behind import defer, submit, batched, upsert_row
 
 def list_watchers_single_thread(conn, owner, repo, enabled,
                                 session, handle_rate_limit_func,
@@ -53,11 +15,13 @@ def list_watchers_single_thread(conn, owner, repo, enabled,
     if enabled==0:
         logging.info("Repo %s/%s => disabled => skip watchers",owner,repo)
         return
-    page=1
-    last_page=None
     repo_name=f"{owner}/{repo}"
+    page=resume_page(conn,repo_name,"watchers")
+    last_page=None
+    completed=False
+    ops=[]
     while True:
-        url=f"https://api.github.com/repos/{owner}/{repo}/subscribers"
+        url=api_url(f"/repos/{owner}/{repo}/subscribers")
         params={"page":page,"per_page":100}
         (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
         if not success:
@@ -65,6 +29,7 @@ def list_watchers_single_thread(conn, owner, repo, enabled,
             break
         data=resp.json()
         if not data:
+            completed=True
             break
         if last_page is None:
             last_page=get_last_page(resp)
@@ -73,25 +38,28 @@ def list_watchers_single_thread(conn, owner, repo, enabled,
             logging.debug(f"[DEBUG] watchers => page={page}/{last_page} => {progress:.3f}%% => {repo_name}")
 
         for user_obj in data:
-            insert_watcher_record(conn,repo_name,user_obj)
+            defer(ops,insert_watcher_record,repo_name,user_obj,commit=False)
+        defer(ops,save_checkpoint,repo_name,"watchers",0,page+1)
+        submit(conn,ops)
         if len(data)<100:
+            completed=True
             break
         page+=1
+    if completed:
+        defer(ops,mark_completed,repo_name,"watchers",commit=False)
+        submit(conn,ops)
 
-def insert_watcher_record(conn, repo_name, user_obj):
-    import json
-    raw_str=json.dumps(user_obj,ensure_ascii=False)
+@batched
+def insert_watcher_record(conn, repo_name, user_obj, commit=True):
     user_login=user_obj["login"]
-    c=conn.cursor()
-    sql="""
-    INSERT INTO watchers (repo_name, user_login, raw_json)
-    VALUES (%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      raw_json=VALUES(raw_json)
-    """
-    c.execute(sql,(repo_name,user_login,raw_str))
-    conn.commit()
-    c.close()
+    raw_str=store_payload(conn,"watchers",payload_key(repo_name,user_login),user_obj)
+    row=(repo_name,user_login,raw_str)
+    if bulk_enabled():
+        spool_row(conn,"watchers",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"watchers",row,repo_name,commit=commit)
+    count_rows(repo_name)
 
 def list_forks_single_thread(conn, owner, repo, enabled,
                              session, handle_rate_limit_func,
@@ -99,17 +67,18 @@ def list_forks_single_thread(conn, owner, repo, enabled,
     if enabled==0:
         logging.info("Repo %s/%s => disabled => skip forks",owner,repo)
         return
-    page=1
-    last_page=None
     repo_name=f"{owner}/{repo}"
+    page=resume_page(conn,repo_name,"forks")
+    last_page=None
+    completed=False
+    ops=[]
     while True:
-        old_en=enabled
-        new_base,new_en=refresh_baseline_info_mid_run(conn,owner,repo,None,old_en)
-        if new_en==0:
+        # cached control-plane read => no SELECT per page
+        if not is_repo_enabled_cached(conn,owner,repo):
             logging.info("Repo %s/%s => toggled disabled => stop forks mid-run",owner,repo)
             break
 
-        url=f"https://api.github.com/repos/{owner}/{repo}/forks"
+        url=api_url(f"/repos/{owner}/{repo}/forks")
         params={"sort":"oldest","page":page,"per_page":100}
         (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
         if not success:
@@ -117,6 +86,7 @@ def list_forks_single_thread(conn, owner, repo, enabled,
             break
         data=resp.json()
         if not data:
+            completed=True
             break
         if last_page is None:
             last_page=get_last_page(resp)
@@ -124,32 +94,36 @@ def list_forks_single_thread(conn, owner, repo, enabled,
             progress=(page/last_page)*100
             logging.debug(f"[DEBUG] forks => page={page}/{last_page} => {progress:.3f}%% => {repo_name}")
 
+        high_id=0
         for fk in data:
-            insert_fork_record(conn,repo_name,fk)
+            defer(ops,insert_fork_record,repo_name,fk,commit=False)
+            high_id=max(high_id,fk["id"])
+        defer(ops,save_checkpoint,repo_name,"forks",0,page+1,high_id)
+        submit(conn,ops)
         if len(data)<100:
+            completed=True
             break
         page+=1
+    if completed:
+        defer(ops,mark_completed,repo_name,"forks",commit=False)
+        submit(conn,ops)
 
-def insert_fork_record(conn, repo_name, fork_obj):
-    import json
-    raw_str=json.dumps(fork_obj,ensure_ascii=False)
+@batched
+def insert_fork_record(conn, repo_name, fork_obj, commit=True):
     fork_id=fork_obj["id"]
     cstr=fork_obj.get("created_at")
     cdt=None
     if cstr:
         cdt=datetime.strptime(cstr,"%Y-%m-%dT%H:%M:%SZ")
-    c=conn.cursor()
-    sql="""
-    INSERT INTO forks (repo_name, fork_id, created_at, raw_json)
-    VALUES
-      (%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      created_at=VALUES(created_at),
-      raw_json=VALUES(raw_json)
-    """
-    c.execute(sql,(repo_name,fork_id,cdt,raw_str))
-    conn.commit()
-    c.close()
+    owner_login=(fork_obj.get("owner") or {}).get("login")
+    raw_str=store_payload(conn,"forks",payload_key(repo_name,fork_id),fork_obj)
+    row=(repo_name,fork_id,cdt,owner_login,raw_str)
+    if bulk_enabled():
+        spool_row(conn,"forks",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"forks",row,repo_name,cdt,commit=commit)
+    count_rows(repo_name)
 
 def list_stars_single_thread(conn, owner, repo, enabled,
                              baseline_dt,
@@ -161,16 +135,27 @@ def list_stars_single_thread(conn, owner, repo, enabled,
     repo_name=f"{owner}/{repo}"
     old_accept=session.headers.get("Accept","")
     session.headers["Accept"]="application/vnd.github.v3.star+json"
-    page=1
+    page=resume_page(conn,repo_name,"stars")
     last_page=None
+    completed=False
+    ops=[]
+    if page==1:
+        tail_result=sync_stars_tail(conn,owner,repo,baseline_dt,session,handle_rate_limit_func,max_retries)
+        if tail_result is not False:
+            # True => synced from the tail; None => fetch failed => retry next run
+            session.headers["Accept"]=old_accept
+            if tail_result:
+                defer(ops,mark_completed,repo_name,"stars",commit=False)
+                submit(conn,ops)
+            return
+    data=[]
     while True:
-        old_en=enabled
-        new_base,new_en=refresh_baseline_info_mid_run(conn,owner,repo,None,old_en)
-        if new_en==0:
+        # cached control-plane read => no SELECT per page
+        if not is_repo_enabled_cached(conn,owner,repo):
             logging.info("Repo %s/%s => toggled disabled => stop stars mid-run",owner,repo)
             break
 
-        url=f"https://api.github.com/repos/{owner}/{repo}/stargazers"
+        url=api_url(f"/repos/{owner}/{repo}/stargazers")
         params={"page":page,"per_page":100}
         (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
         if not success:
@@ -178,6 +163,7 @@ def list_stars_single_thread(conn, owner, repo, enabled,
             break
         data=resp.json()
         if not data:
+            completed=True
             break
         if last_page is None:
             last_page=get_last_page(resp)
@@ -185,7 +171,6 @@ def list_stars_single_thread(conn, owner, repo, enabled,
             progress=(page/last_page)*100
             logging.debug(f"[DEBUG] stars => page={page}/{last_page} => {progress:.3f}%% => {repo_name}")
 
-        import json
         for stargazer in data:
             starred_at_str=stargazer.get("starred_at")
             if not starred_at_str:
@@ -195,23 +180,121 @@ def list_stars_single_thread(conn, owner, repo, enabled,
                 # skip older
                 continue
             user_login=stargazer["user"]["login"]
-            raw_str=json.dumps(stargazer,ensure_ascii=False)
-            insert_star_record(conn,repo_name,user_login,sdt,raw_str)
+            defer(ops,insert_star_record,repo_name,user_login,sdt,stargazer,commit=False)
 
+        defer(ops,save_checkpoint,repo_name,"stars",0,page+1)
+        submit(conn,ops)
         if len(data)<100:
+            completed=True
             break
         page+=1
     session.headers["Accept"]=old_accept
+    if completed:
+        # list length now => next run can check the tail against it
+        defer(ops,set_star_listed_total,repo_name,(page-1)*100+len(data),commit=False)
+        defer(ops,mark_completed,repo_name,"stars",commit=False)
+        submit(conn,ops)
 
-def insert_star_record(conn, repo_name, user_login, starred_dt, raw_str):
-    c=conn.cursor()
-    sql="""
-    INSERT INTO stars (repo_name, user_login, starred_at, raw_json)
-    VALUES (%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      starred_at=VALUES(starred_at),
-      raw_json=VALUES(raw_json)
+def get_star_watermark(conn, repo_name):
     """
-    c.execute(sql,(repo_name,user_login,starred_dt,raw_str))
-    conn.commit()
+    (MAX(starred_at), COUNT(*)) of the stored stars => idx_stars_repo_starred.
+    """
+    c=conn.cursor()
+    c.execute("SELECT MAX(starred_at), COUNT(*) FROM stars WHERE repo_name=%s",(repo_name,))
+    row=c.fetchone()
     c.close()
+    return (row[0],row[1]) if row else (None,0)
+
+def get_star_listed_total(conn, repo_name):
+    c=conn.cursor()
+    c.execute("SELECT listed_total FROM star_sync WHERE repo_name=%s",(repo_name,))
+    row=c.fetchone()
+    c.close()
+    return row[0] if row else None
+
+def set_star_listed_total(conn, repo_name, listed_total, commit=True):
+    c=conn.cursor()
+    c.execute("""
+    INSERT INTO star_sync (repo_name, listed_total, synced_at)
+    VALUES (%s,%s,NOW())
+    ON DUPLICATE KEY UPDATE listed_total=VALUES(listed_total), synced_at=NOW()
+    """,(repo_name,listed_total))
+    if commit:
+        conn.commit()
+    c.close()
+
+def sync_stars_tail(conn, owner, repo, baseline_dt,
+                    session, handle_rate_limit_func, max_retries):
+    """
+    Incremental star sync. Stargazers are listed oldest first, so new stars
+    can only be on the last pages => page 1 for rel="last", then walk back
+    from the last page until a page reaches the stored MAX(starred_at).
+    The list length must equal the previous length + the new stars; otherwise
+    (unstars, first run, ...) return False => caller does the full rescan.
+    Returns True when synced, None if a page failed.
+    """
+    repo_name=f"{owner}/{repo}"
+    (max_starred,stored_count)=get_star_watermark(conn,repo_name)
+    prev_total=get_star_listed_total(conn,repo_name)
+    if not stored_count or max_starred is None or prev_total is None:
+        return False
+
+    url=api_url(f"/repos/{owner}/{repo}/stargazers")
+    (resp,success)=robust_get_page(session,url,{"page":1,"per_page":100},handle_rate_limit_func,max_retries)
+    if not success:
+        logging.warning("Stars => tail sync => can't get page 1 => %s",repo_name)
+        return None
+    first_data=resp.json() or []
+    last_page=get_last_page(resp) or 1
+
+    def starred(star):
+        sstr=star.get("starred_at")
+        return datetime.strptime(sstr,"%Y-%m-%dT%H:%M:%SZ") if sstr else None
+
+    tail=[]
+    page=last_page
+    while page>1:
+        (resp,success)=robust_get_page(session,url,{"page":page,"per_page":100},handle_rate_limit_func,max_retries)
+        if not success:
+            logging.warning("Stars => tail sync => can't get page %d => %s",page,repo_name)
+            return None
+        data=resp.json() or []
+        tail.append(data)
+        dts=[sdt for sdt in map(starred,data) if sdt]
+        if dts and min(dts)<=max_starred:
+            break
+        page-=1
+    else:
+        tail.append(first_data)
+
+    last_data=tail[0] if last_page>1 else first_data
+    listed_total=(last_page-1)*100+len(last_data)
+    candidates=[(starred(st),st) for data in reversed(tail) for st in data]
+    # same-second stars are re-upserted (idempotent) but only strictly newer ones count
+    new_count=sum(1 for (sdt,_st) in candidates if sdt and sdt>max_starred)
+    if prev_total+new_count!=listed_total:
+        logging.info("Stars => %s => listed %d != previous %d + %d new => full rescan",
+                     repo_name,listed_total,prev_total,new_count)
+        return False
+
+    ops=[]
+    for (sdt,stargazer) in candidates:
+        if not sdt or sdt<max_starred or sdt<baseline_dt:
+            continue
+        defer(ops,insert_star_record,repo_name,stargazer["user"]["login"],sdt,stargazer,commit=False)
+    defer(ops,set_star_listed_total,repo_name,listed_total,commit=False)
+    submit(conn,ops)
+    logging.info("Stars => %s => tail sync => %d new => %d request(s) instead of %d",
+                 repo_name,new_count,len(tail)+1,last_page)
+    return True
+
+@batched
+def insert_star_record(conn, repo_name, user_login, starred_dt, star_obj, commit=True):
+    raw_str=store_payload(conn,"stars",payload_key(repo_name,user_login,starred_dt),star_obj)
+    row=(repo_name,user_login,starred_dt,raw_str)
+    if bulk_enabled():
+        spool_row(conn,"stars",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"stars",row,repo_name,starred_dt,commit=commit)
+    count_rows(repo_name)
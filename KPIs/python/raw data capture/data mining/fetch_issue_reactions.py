@@ -1,51 +1,22 @@
 # fetch_issue_reactions.py
 import logging
-import time
-import requests
 from datetime import datetime
+from github_http import api_url, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
 from repo_baselines import refresh_baseline_info_mid_run
-
-def get_last_page(resp):
-    link_header=resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts=link_header.split(',')
-    for p in parts:
-        if 'rel="last"' in p:
-            import re
-            m=re.search(r'[?&]page=(\d+)',p)
-            if m:
-                return int(m.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    mini_retry_attempts=3
-    for attempt in range(1,max_retries+1):
-        local_attempt=1
-        while local_attempt<=mini_retry_attempts:
-            try:
-                resp=session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code==200:
-                    return (resp,True)
-                elif resp.status_code in (403,429,500,502,503,504):
-                    logging.warning("HTTP %d => attempt %d/%d => retry => %s",
-                                    resp.status_code,attempt,max_retries,url)
-                    time.sleep(5)
-                else:
-                    logging.warning("HTTP %d => attempt %d => break => %s",
-                                    resp.status_code,attempt,url)
-                    return (resp,False)
-                break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s",url)
-                time.sleep(3)
-                local_attempt+=1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s",url)
-            return (None,False)
-    logging.warning("Exceeded max_retries => give up => %s",url)
-    return (None,False)
+from checkpoints import (
+    DRIVER_CHECKPOINT_EVERY,
+    resume_page,
+    resume_parent,
+    save_checkpoint,
+    mark_completed,
+    clear_parent_checkpoint
+)
+from payloads import store_payload, payload_key
+from reaction_summaries import issues_needing_reactions, mark_issue_reactions_synced
+from watermarks import load_max_ids
+from write_behind import defer, submit, batched, upsert_row
 
 def get_max_reaction_id_for_issue(conn, repo_name, issue_num):
     c=conn.cursor()
@@ -67,66 +38,96 @@ def fetch_issue_reactions_for_all_issues(conn, owner, repo, enabled,
         logging.info("Repo %s/%s => disabled => skip issue_reactions",owner,repo)
         return
     repo_name=f"{owner}/{repo}"
-    c=conn.cursor()
-    c.execute("SELECT issue_number FROM issues WHERE repo_name=%s",(repo_name,))
-    rows=c.fetchall()
-    c.close()
-    for (issue_num,) in rows:
+    resume_after=resume_parent(conn,repo_name,"issue_reactions")
+    # only issues whose listed reaction total is non-zero and changed since last detail fetch
+    rows=issues_needing_reactions(conn,repo_name,resume_after)
+    logging.info("Repo %s => issue_reactions => %d issue(s) with new reactions",repo_name,len(rows))
+    # newest stored reaction id of every issue => one grouped query
+    max_rids=load_max_ids(conn,"issue_reactions",("issue_number",),"reaction_id",repo_name)
+    ops=[]
+    for idx,(issue_num,) in enumerate(rows,start=1):
         fetch_issue_reactions_single_thread(conn,repo_name,issue_num,
                                             enabled,session,
                                             handle_rate_limit_func,
-                                            max_retries)
+                                            max_retries,
+                                            old_val=max_rids.get(issue_num,0))
+        if idx%DRIVER_CHECKPOINT_EVERY==0:
+            defer(ops,save_checkpoint,repo_name,"issue_reactions",0,1,issue_num)
+            submit(conn,ops)
+    defer(ops,mark_completed,repo_name,"issue_reactions",commit=False)
+    submit(conn,ops)
 
 def fetch_issue_reactions_single_thread(conn, repo_name, issue_num,
                                         enabled, session,
                                         handle_rate_limit_func,
-                                        max_retries):
+                                        max_retries,
+                                        old_val=None):
     if enabled==0:
         logging.info("%s => disabled => skip => issue_reactions => #%d",repo_name,issue_num)
         return
-    old_val=get_max_reaction_id_for_issue(conn,repo_name,issue_num)
+    if old_val is None:
+        old_val=get_max_reaction_id_for_issue(conn,repo_name,issue_num)
     highest_rid=old_val
+    start_page=resume_page(conn,repo_name,"issue_reactions",issue_num)
+    page=start_page
+    # full pages before a resumed page count towards the synced total
+    seen_total=(start_page-1)*100
+    completed=False
+    ops=[]
 
     old_accept=session.headers.get("Accept","")
     session.headers["Accept"]="application/vnd.github.squirrel-girl-preview+json"
-    url=f"https://api.github.com/repos/{repo_name}/issues/{issue_num}/reactions"
-    (resp,success)=robust_get_page(session,url,{},handle_rate_limit_func,max_retries)
-    session.headers["Accept"]=old_accept
-    if not success:
-        logging.warning("Issue Reactions => skip => %s => #%d",repo_name,issue_num)
-        return
-    data=resp.json()
-    if not data:
-        return
+    url=api_url(f"/repos/{repo_name}/issues/{issue_num}/reactions")
+    while True:
+        (resp,success)=robust_get_page(session,url,{"page":page,"per_page":100},
+                                      handle_rate_limit_func,max_retries)
+        if not success:
+            logging.warning("Issue Reactions => skip => page=%d => %s => #%d",page,repo_name,issue_num)
+            break
+        data=resp.json()
+        if not data:
+            completed=True
+            break
+        seen_total+=len(data)
+        logging.debug(f"[DEBUG] issue_reactions => page={page} => {repo_name} => issue #{issue_num}")
+
+        for reac in data:
+            rid=reac["id"]
+            if rid<=old_val:
+                continue
+            cstr=reac.get("created_at")
+            cdt=None
+            if cstr:
+                cdt=datetime.strptime(cstr,"%Y-%m-%dT%H:%M:%SZ")
+            defer(ops,insert_issue_reaction,repo_name,issue_num,rid,cdt,reac,commit=False)
+            if rid>highest_rid:
+                highest_rid=rid
 
-    logging.debug(f"[DEBUG] issue_reactions => 100.000% => {repo_name} => issue #{issue_num}")
+        if len(data)<100:
+            completed=True
+            break
+        page+=1
+        defer(ops,save_checkpoint,repo_name,"issue_reactions",issue_num,page,highest_rid)
+        submit(conn,ops)
 
-    for reac in data:
-        rid=reac["id"]
-        if rid<=old_val:
-            continue
-        cstr=reac.get("created_at")
-        cdt=None
-        if cstr:
-            cdt=datetime.strptime(cstr,"%Y-%m-%dT%H:%M:%SZ")
-        insert_issue_reaction(conn,repo_name,issue_num,rid,cdt,reac)
-        if rid>highest_rid:
-            highest_rid=rid
+    session.headers["Accept"]=old_accept
+    if completed:
+        # only a fully read list may mark the issue synced => a failed page is retried next run
+        defer(ops,mark_issue_reactions_synced,repo_name,issue_num,seen_total)
+    if page>start_page or start_page>1:
+        defer(ops,clear_parent_checkpoint,repo_name,"issue_reactions",issue_num)
+    submit(conn,ops)
 
+@batched
 def insert_issue_reaction(conn, repo_name, issue_num, reac_id,
-                          created_dt, reac_json):
-    import json
-    raw_str=json.dumps(reac_json,ensure_ascii=False)
-    c=conn.cursor()
-    sql="""
-    INSERT INTO issue_reactions
-      (repo_name, issue_number, reaction_id, created_at, raw_json)
-    VALUES
-      (%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      created_at=VALUES(created_at),
-      raw_json=VALUES(raw_json)
-    """
-    c.execute(sql,(repo_name,issue_num,reac_id,created_dt,raw_str))
-    conn.commit()
-    c.close()
+                          created_dt, reac_json, commit=True):
+    content=reac_json.get("content")
+    user_login=(reac_json.get("user") or {}).get("login")
+    raw_str=store_payload(conn,"issue_reactions",payload_key(repo_name,issue_num,reac_id),reac_json)
+    row=(repo_name,issue_num,reac_id,created_dt,content,user_login,raw_str)
+    if bulk_enabled():
+        spool_row(conn,"issue_reactions",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"issue_reactions",row,repo_name,created_dt,commit=commit)
+    count_rows(repo_name)
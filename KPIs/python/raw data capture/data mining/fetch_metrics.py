@@ -0,0 +1,245 @@
+# fetch_metrics.py
+"""
+Fetch telemetry => where ingestion time and API quota go.
+
+Per (repo, endpoint) series, fed by the shared HTTP path (github_http) and
+the insert_* helpers:
+  requests, bytes received, rows written, latency histogram,
+  retries, 304 (not modified) hits
+plus a rate-limit remaining gauge per token (token_pool).
+
+The endpoint is the API path with the repo and numbers folded away, e.g.
+  /repos/ni/nimi-python/issues/12/events => issues/{n}/events
+Rows are attributed to the endpoint of the last request made on the same
+thread, i.e. the page they came from.
+
+start_metrics_writer() rewrites a Prometheus text file every interval;
+print_metrics_summary() prints the per-endpoint table at the end of a run.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from token_pool import budget_snapshot
+
+# Latency histogram upper bounds (seconds)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_lock = threading.Lock()
+_series = {}
+_current = threading.local()
+_started_at = time.monotonic()
+_writer_stop = threading.Event()
+_writer_thread = None
+
+def _new_series():
+    return {
+        "requests": 0,
+        "bytes": 0,
+        "rows": 0,
+        "retries": 0,
+        "not_modified": 0,
+        "errors": 0,
+        "latency_sum": 0.0,
+        "latency_buckets": [0] * len(LATENCY_BUCKETS)
+    }
+
+def endpoint_for_url(url):
+    """
+    -> (repo_name or '-', endpoint)
+    """
+    path = urlsplit(url).path
+    m = re.match(r"^/repos/([^/]+)/([^/]+)(/.*)?$", path)
+    if not m:
+        return ("-", path.strip("/") or "root")
+    rest = (m.group(3) or "").strip("/")
+    endpoint = re.sub(r"(^|/)\d+(?=/|$)", r"\1{n}", rest) or "repo"
+    return (f"{m.group(1)}/{m.group(2)}", endpoint)
+
+def _get(repo_name, endpoint):
+    key = (repo_name, endpoint)
+    s = _series.get(key)
+    if s is None:
+        s = _series[key] = _new_series()
+    return s
+
+def observe_request(url, status, nbytes, seconds, repo_name=None):
+    """
+    One HTTP response. repo_name overrides the one parsed from the URL (GraphQL).
+    """
+    (parsed_repo, endpoint) = endpoint_for_url(url)
+    repo_name = repo_name or parsed_repo
+    _current.key = (repo_name, endpoint)
+    with _lock:
+        s = _get(repo_name, endpoint)
+        s["requests"] += 1
+        s["bytes"] += nbytes
+        s["latency_sum"] += seconds
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le:
+                s["latency_buckets"][i] += 1
+                break
+        if status == 304:
+            s["not_modified"] += 1
+        elif status != 200:
+            s["errors"] += 1
+
+def observe_retry(url, repo_name=None):
+    (parsed_repo, endpoint) = endpoint_for_url(url)
+    with _lock:
+        _get(repo_name or parsed_repo, endpoint)["retries"] += 1
+
+def count_rows(repo_name, n=1):
+    """
+    Rows written for the page last fetched on this thread.
+    """
+    key = getattr(_current, "key", None)
+    endpoint = key[1] if key else "unknown"
+    with _lock:
+        _get(repo_name, endpoint)["rows"] += n
+
+def current_key():
+    """
+    (repo, endpoint) of the last request on this thread => handed to the ingest writer.
+    """
+    return getattr(_current, "key", None)
+
+def use_key(key):
+    """
+    Attribute the next count_rows() calls on this thread to key (write_behind writer).
+    """
+    _current.key = key
+
+def _snapshot():
+    with _lock:
+        return {k: dict(v, latency_buckets=list(v["latency_buckets"])) for k, v in _series.items()}
+
+def _labels(repo_name, endpoint, extra=""):
+    return f'repo="{repo_name}",endpoint="{endpoint}"{extra}'
+
+def render_prometheus():
+    snap = _snapshot()
+    lines = []
+    counters = (
+        ("gh_fetch_requests_total", "requests", "HTTP responses received"),
+        ("gh_fetch_received_bytes_total", "bytes", "Response body bytes received"),
+        ("gh_fetch_rows_written_total", "rows", "Rows inserted from fetched pages"),
+        ("gh_fetch_retries_total", "retries", "Retried requests (403/429/5xx, connection errors)"),
+        ("gh_fetch_not_modified_total", "not_modified", "304 Not Modified responses"),
+        ("gh_fetch_errors_total", "errors", "Non-200 responses")
+    )
+    for (name, field, help_text) in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (repo_name, endpoint), s in sorted(snap.items()):
+            lines.append(f"{name}{{{_labels(repo_name, endpoint)}}} {s[field]}")
+
+    name = "gh_fetch_request_seconds"
+    lines.append(f"# HELP {name} Request latency")
+    lines.append(f"# TYPE {name} histogram")
+    for (repo_name, endpoint), s in sorted(snap.items()):
+        cumulative = 0
+        for le, cnt in zip(LATENCY_BUCKETS, s["latency_buckets"]):
+            cumulative += cnt
+            le_label = ',le="%s"' % ("+Inf" if le == float("inf") else repr(le))
+            lines.append(f"{name}_bucket{{{_labels(repo_name, endpoint, le_label)}}} {cumulative}")
+        lines.append(f"{name}_sum{{{_labels(repo_name, endpoint)}}} {s['latency_sum']:.6f}")
+        lines.append(f"{name}_count{{{_labels(repo_name, endpoint)}}} {s['requests']}")
+
+    lines.append("# HELP gh_token_rate_limit_remaining Remaining core requests per token")
+    lines.append("# TYPE gh_token_rate_limit_remaining gauge")
+    for (idx, remaining, reset_ts, used) in budget_snapshot():
+        if remaining is not None:
+            lines.append(f'gh_token_rate_limit_remaining{{token="{idx}"}} {remaining}')
+    lines.append("# HELP gh_token_requests_used_total Requests made with each token this run")
+    lines.append("# TYPE gh_token_requests_used_total counter")
+    for (idx, remaining, reset_ts, used) in budget_snapshot():
+        lines.append(f'gh_token_requests_used_total{{token="{idx}"}} {used}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+def _writer_loop(path, interval):
+    while not _writer_stop.wait(interval):
+        try:
+            write_prometheus(path)
+        except OSError as e:
+            logging.warning("Metrics file %s => write failed => %s", path, e)
+
+def start_metrics_writer(path, interval):
+    """
+    Background thread rewriting the Prometheus text file every interval seconds.
+    """
+    global _writer_thread
+    if not path:
+        return
+    _writer_stop.clear()
+    _writer_thread = threading.Thread(target=_writer_loop, args=(path, interval),
+                                      name="metrics-writer", daemon=True)
+    _writer_thread.start()
+    logging.info("Fetch metrics => %s every %ds", path, interval)
+
+def stop_metrics_writer(path):
+    """
+    Stop the writer and flush the final numbers.
+    """
+    global _writer_thread
+    if _writer_thread is None:
+        return
+    _writer_stop.set()
+    _writer_thread.join()
+    _writer_thread = None
+    write_prometheus(path)
+
+def _approx_quantile(buckets, q):
+    total = sum(buckets)
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for le, cnt in zip(LATENCY_BUCKETS, buckets):
+        seen += cnt
+        if seen >= rank:
+            return le
+    return LATENCY_BUCKETS[-1]
+
+def print_metrics_summary():
+    snap = _snapshot()
+    per_endpoint = {}
+    for (repo_name, endpoint), s in snap.items():
+        agg = per_endpoint.setdefault(endpoint, _new_series())
+        for field in ("requests", "bytes", "rows", "retries", "not_modified", "errors", "latency_sum"):
+            agg[field] += s[field]
+        agg["latency_buckets"] = [a + b for a, b in zip(agg["latency_buckets"], s["latency_buckets"])]
+
+    elapsed = max(time.monotonic() - _started_at, 1e-6)
+    header = (f"{'Endpoint':28s}  {'Requests':>8s}  {'MB':>8s}  {'Rows':>8s}  {'Rows/Req':>8s}  "
+              f"{'Retries':>7s}  {'304':>5s}  {'Errors':>6s}  {'AvgMs':>7s}  {'p95<=s':>6s}")
+    print("")
+    print("========== FETCH TELEMETRY (per endpoint) ==========")
+    print(header)
+    print("-"*len(header))
+    tot_req = tot_rows = 0
+    for endpoint, s in sorted(per_endpoint.items(), key=lambda kv: -kv[1]["requests"]):
+        req = s["requests"]
+        tot_req += req
+        tot_rows += s["rows"]
+        avg_ms = (s["latency_sum"] / req * 1000) if req else 0.0
+        p95 = _approx_quantile(s["latency_buckets"], 0.95)
+        p95_str = "-" if p95 is None else ("inf" if p95 == float("inf") else f"{p95:g}")
+        rows_per_req = (s["rows"] / req) if req else 0.0
+        print(f"{endpoint[:28]:28s}  {req:>8d}  {s['bytes']/1048576:>8.2f}  {s['rows']:>8d}  {rows_per_req:>8.1f}  "
+              f"{s['retries']:>7d}  {s['not_modified']:>5d}  {s['errors']:>6d}  {avg_ms:>7.1f}  {p95_str:>6s}")
+    print("-"*len(header))
+    print(f"Elapsed {elapsed:.0f}s => {tot_req/elapsed:.2f} req/s => {tot_rows/elapsed:.2f} rows/s")
+    for (idx, remaining, reset_ts, used) in budget_snapshot():
+        print(f"Token idx {idx} => used={used} => remaining={remaining}")
+    print("====================================================")
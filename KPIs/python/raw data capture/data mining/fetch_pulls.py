@@ -1,51 +1,13 @@
 # fetch_pulls.py
 import logging
-import time
-import requests
 from datetime import datetime
-from repo_baselines import refresh_baseline_info_mid_run
-
-def get_last_page(resp):
-    link_header=resp.headers.get("Link")
-    if not link_header:
-        return None
-    parts=link_header.split(',')
-    for part in parts:
-        if 'rel="last"' in part:
-            import re
-            match=re.search(r'[?&]page=(\d+)',part)
-            if match:
-                return int(match.group(1))
-    return None
-
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    mini_retry_attempts=3
-    for attempt in range(1,max_retries+1):
-        local_attempt=1
-        while local_attempt<=mini_retry_attempts:
-            try:
-                resp=session.get(url, params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code==200:
-                    return (resp,True)
-                elif resp.status_code in (403,429,500,502,503,504):
-                    logging.warning("HTTP %d => attempt %d/%d => retry => %s",
-                                    resp.status_code,attempt,max_retries,url)
-                    time.sleep(5)
-                else:
-                    logging.warning("HTTP %d => attempt %d => break => %s",
-                                    resp.status_code,attempt,url)
-                    return (resp,False)
-                break
-            except requests.exceptions.ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s",url)
-                time.sleep(3)
-                local_attempt+=1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s",url)
-            return (None,False)
-    logging.warning("Exceeded max_retries => give up => %s",url)
-    return (None,False)
+from github_http import api_url, get_last_page, robust_get_page
+from fetch_metrics import count_rows
+from bulk_load import bulk_enabled, spool_row
+from repo_baselines import is_repo_enabled_cached
+from checkpoints import resume_page, resume_cursor, save_checkpoint, mark_completed
+from write_behind import defer, submit, batched, upsert_row
+from issue_sync import listing_since, load_known_numbers
 
 def get_max_pull_number(conn, repo_name):
     c=conn.cursor()
@@ -63,25 +25,36 @@ def list_pulls_single_thread(conn, owner, repo, enabled,
         logging.info("Repo %s/%s => disabled => skip pulls",owner,repo)
         return
     repo_name=f"{owner}/{repo}"
-    highest_known=get_max_pull_number(conn,repo_name)
-    page=1
+    known=load_known_numbers(conn,"pulls",repo_name)
+
+    # sort=updated + since => only PRs touched since the newest stored updated_at
+    page=resume_page(conn,repo_name,"pulls")
+    since_str=resume_cursor(conn,repo_name,"pulls") if page>1 else None
+    if since_str is None:
+        page=1
+        since_dt=listing_since(conn,"pulls",repo_name)
+        since_str=since_dt.strftime("%Y-%m-%dT%H:%M:%SZ") if since_dt else ""
+
     last_page=None
+    completed=False
+    ops=[]
     while True:
-        old_val=highest_known
-        old_en=enabled
-        new_base,new_en=refresh_baseline_info_mid_run(conn,owner,repo,None,old_en)
-        if new_en==0:
+        # cached control-plane read => no SELECT per page
+        if not is_repo_enabled_cached(conn,owner,repo):
             logging.info("Repo %s/%s => toggled disabled => stop pulls mid-run",owner,repo)
             break
 
-        url=f"https://api.github.com/repos/{owner}/{repo}/issues"
-        params={"state":"all","sort":"created","direction":"asc","page":page,"per_page":100}
+        url=api_url(f"/repos/{owner}/{repo}/issues")
+        params={"state":"all","sort":"updated","direction":"asc","page":page,"per_page":100}
+        if since_str:
+            params["since"]=since_str
         (resp,success)=robust_get_page(session,url,params,handle_rate_limit_func,max_retries)
         if not success:
             logging.warning("Pulls => page %d => skip => %s",page,repo_name)
             break
         data=resp.json()
         if not data:
+            completed=True
             break
 
         if last_page is None:
@@ -90,33 +63,52 @@ def list_pulls_single_thread(conn, owner, repo, enabled,
             progress=(page/last_page)*100
             logging.debug(f"[DEBUG] pulls => page={page}/{last_page} => {progress:.3f}%% => {repo_name}")
 
-        new_count=0
         for item in data:
             if "pull_request" not in item:
                 continue
             pull_num=item["number"]
-            if pull_num<=highest_known:
+            if pull_num in known:
+                defer(ops,refresh_pull_record,repo_name,pull_num,item)
                 continue
             cstr=item.get("created_at")
             cdt=None
             if cstr:
                 cdt=datetime.strptime(cstr,"%Y-%m-%dT%H:%M:%SZ")
-            insert_pull_record(conn,repo_name,pull_num,cdt)
-            new_count+=1
-            if pull_num>highest_known:
-                highest_known=pull_num
-        if new_count<100:
+            defer(ops,insert_pull_record,repo_name,pull_num,cdt,commit=False,item=item)
+            known.add(pull_num)
+        defer(ops,save_checkpoint,repo_name,"pulls",0,page+1,cursor_val=since_str)
+        submit(conn,ops)
+        if len(data)<100:
+            completed=True
             break
         page+=1
+    if completed:
+        defer(ops,mark_completed,repo_name,"pulls",commit=False)
+        submit(conn,ops)
 
-def insert_pull_record(conn, repo_name, pull_number, created_dt):
-    c=conn.cursor()
-    sql="""
-    INSERT INTO pulls (repo_name, pull_number, created_at)
-    VALUES (%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      created_at=VALUES(created_at)
+def _parse_dt(val):
+    return datetime.strptime(val,"%Y-%m-%dT%H:%M:%SZ") if val else None
+
+@batched
+def insert_pull_record(conn, repo_name, pull_number, created_dt, commit=True, item=None):
+    item=item or {}
+    row=(repo_name,pull_number,created_dt,_parse_dt(item.get("updated_at")),
+         item.get("state"),item.get("comments"))
+    if bulk_enabled():
+        spool_row(conn,"pulls",row,commit)
+        count_rows(repo_name)
+        return
+    upsert_row(conn,"pulls",row,repo_name,created_dt,commit=commit)
+    count_rows(repo_name)
+
+def refresh_pull_record(conn, repo_name, pull_number, item):
     """
-    c.execute(sql,(repo_name,pull_number,created_dt))
-    conn.commit()
+    Known PR listed again => it was updated. Caller commits.
+    """
+    c=conn.cursor()
+    c.execute("""
+      UPDATE pulls SET updated_at=%s, state=%s, comments_count=%s
+      WHERE repo_name=%s AND pull_number=%s
+    """,(_parse_dt(item.get("updated_at")),item.get("state"),item.get("comments"),
+         repo_name,pull_number))
     c.close()
@@ -0,0 +1,154 @@
+# github_http.py
+"""
+Shared HTTP path for every data-mining fetcher.
+
+  - api_url()          => GitHub base URL, overridable (api_base_url in config.yaml)
+                          so the fetchers can be pointed at replay_server.py
+  - robust_get_page()  => the retrying GET all fetchers use
+  - get_last_page()    => rel="last" page number from the Link header
+  - telemetry          => every response / retry is counted in fetch_metrics
+  - recorder           => when record_fixtures_dir is set, every response
+                          (status, Link / rate-limit headers, body) is saved as a
+                          gzip JSON fixture that replay_server.py can serve
+  - archive            => when archive_dir is set, every 200 page is appended
+                          to the raw page archive (page_archive.py) for rebuilds
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlencode, parse_qsl
+
+import requests
+
+from fetch_metrics import observe_request, observe_retry
+from page_archive import archive_page
+
+DEFAULT_API_BASE_URL = "https://api.github.com"
+# Response headers kept in fixtures => what the fetchers / token pool read
+RECORDED_HEADERS = (
+    "Link", "ETag", "Content-Type",
+    "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset",
+    "X-RateLimit-Used", "X-RateLimit-Resource", "Retry-After"
+)
+
+_api_base_url = DEFAULT_API_BASE_URL
+_record_dir = None
+_record_lock = threading.Lock()
+
+def set_api_base_url(url):
+    global _api_base_url
+    _api_base_url = (url or DEFAULT_API_BASE_URL).rstrip("/")
+    if _api_base_url != DEFAULT_API_BASE_URL:
+        logging.info("GitHub API base URL => %s", _api_base_url)
+
+def api_url(path):
+    return f"{_api_base_url}{path}"
+
+def set_recorder(record_dir):
+    """
+    Start saving every response as a fixture under record_dir (None => off).
+    """
+    global _record_dir
+    _record_dir = record_dir or None
+    if _record_dir:
+        os.makedirs(_record_dir, exist_ok=True)
+        logging.info("Recording GitHub responses => %s", _record_dir)
+
+def fixture_key(method, path, query, body=None):
+    """
+    Stable key for a request => same on record and replay side.
+    query => raw query string; body => request body bytes (GraphQL POST)
+    """
+    canon_query = urlencode(sorted(parse_qsl(query or "", keep_blank_values=True)))
+    h = hashlib.sha1()
+    h.update(f"{method.upper()} {path}?{canon_query}".encode("utf-8"))
+    if body:
+        h.update(b"\n")
+        h.update(body if isinstance(body, bytes) else body.encode("utf-8"))
+    return h.hexdigest()
+
+def kept_headers(resp):
+    return {h: resp.headers[h] for h in RECORDED_HEADERS if h in resp.headers}
+
+def record_response(resp):
+    """
+    Save one response as <record_dir>/<key>.json.gz. No-op unless recording.
+    """
+    if not _record_dir or resp is None or resp.request is None:
+        return
+    req = resp.request
+    parts = urlsplit(req.url)
+    key = fixture_key(req.method, parts.path, parts.query, req.body)
+    fixture = {
+        "method": req.method,
+        "path": parts.path,
+        "query": parts.query,
+        "status": resp.status_code,
+        "headers": kept_headers(resp),
+        "body": resp.text
+    }
+    out_path = os.path.join(_record_dir, f"{key}.json.gz")
+    with _record_lock:
+        with gzip.open(out_path, "wt", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False)
+
+def get_last_page(resp):
+    link_header = resp.headers.get("Link")
+    if not link_header:
+        return None
+    parts = link_header.split(',')
+    for part in parts:
+        if 'rel="last"' in part:
+            match = re.search(r'[?&]page=(\d+)', part)
+            if match:
+                return int(match.group(1))
+    return None
+
+def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
+    """
+    A function that attempts multiple times (max_retries) to GET a page from GitHub,
+    handling connection errors locally and rate-limit logic with handle_rate_limit_func.
+    """
+    mini_retry_attempts = 3
+    for attempt in range(1, max_retries + 1):
+        local_attempt = 1
+        while local_attempt <= mini_retry_attempts:
+            try:
+                started = time.monotonic()
+                resp = session.get(url, params=params)
+                observe_request(url, resp.status_code, len(resp.content), time.monotonic() - started)
+                record_response(resp)
+                handle_rate_limit_func(resp)
+                if resp.status_code == 200:
+                    archive_page(resp, params, kept_headers(resp))
+                    return (resp, True)
+                elif resp.status_code in (403, 429, 500, 502, 503, 504):
+                    logging.warning(
+                        "HTTP %d => attempt %d/%d => retry => %s",
+                        resp.status_code, attempt, max_retries, url
+                    )
+                    observe_retry(url)
+                    time.sleep(5)
+                else:
+                    logging.warning(
+                        "HTTP %d => attempt %d => break => %s",
+                        resp.status_code, attempt, url
+                    )
+                    return (resp, False)
+                break
+            except requests.exceptions.ConnectionError:
+                logging.warning("Connection error => local mini-retry => %s", url)
+                observe_retry(url)
+                time.sleep(3)
+                local_attempt += 1
+        if local_attempt > mini_retry_attempts:
+            logging.warning("Exhausted local mini-retry => break => %s", url)
+            return (None, False)
+    logging.warning("Exceeded max_retries => give up => %s", url)
+    return (None, False)
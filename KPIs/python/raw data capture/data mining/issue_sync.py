@@ -0,0 +1,119 @@
+# issue_sync.py
+"""
+updated_at-driven refresh => incremental runs scale with activity, not history.
+
+The issue/pull listers store each item's updated_at, state and comment count
+and ask GitHub only for items updated since the newest updated_at already
+stored (sort=updated&since=...). A new event or comment bumps an issue's
+updated_at, so the per-issue child fetchers only visit rows whose updated_at
+is newer than their own <child>_synced_at:
+
+  issues.events_synced_at    => fetch_events (issue_events)
+  issues.comments_synced_at  => fetch_comments
+  pulls.events_synced_at     => fetch_events (pull_events)
+
+A child stamps <child>_synced_at = updated_at after a successful visit, so a
+failed visit is retried on the next run. Both lookups use the
+(repo_name, updated_at) index.
+
+Reactions do NOT bump updated_at, so the incremental listing never sees a
+reaction added to an old issue or comment. Every full_sync_max_age_days a
+full reaction-summary pass re-lists all issues (since omitted) and all
+comments of the repo (one repo-wide listing) to refresh the embedded
+totals; the reaction fetchers then visit whatever changed (see
+reaction_summaries.py). repo_snapshots.reactions_full_at records the pass.
+"""
+
+from datetime import datetime, timedelta
+
+# table => number column
+PARENT_TABLES = {"issues": "issue_number", "pulls": "pull_number"}
+
+def listing_since(conn, table, repo_name):
+    """
+    'since' for the lister => newest stored updated_at, or None when a full
+    listing is needed (nothing stored yet, or rows from before updated_at was kept).
+    """
+    c=conn.cursor()
+    c.execute(f"""
+      SELECT MAX(updated_at), SUM(updated_at IS NULL), COUNT(*)
+      FROM {table} WHERE repo_name=%s
+    """,(repo_name,))
+    (max_upd,missing,total)=c.fetchone()
+    c.close()
+    if not total or missing or max_upd is None:
+        return None
+    # 'since' is inclusive => items sharing that second are re-listed (idempotent)
+    return max_upd - timedelta(seconds=1)
+
+def reaction_pass_due(conn, repo_name, max_age_days):
+    """
+    True when the last full reaction-summary pass is missing or older than max_age_days.
+    """
+    c=conn.cursor()
+    c.execute("SELECT reactions_full_at FROM repo_snapshots WHERE repo_name=%s",(repo_name,))
+    row=c.fetchone()
+    c.close()
+    return not row or row[0] is None or datetime.now()-row[0]>timedelta(days=max_age_days)
+
+def mark_reaction_pass(conn, repo_name):
+    c=conn.cursor()
+    c.execute("""
+      INSERT INTO repo_snapshots (repo_name, reactions_full_at) VALUES (%s,NOW())
+      ON DUPLICATE KEY UPDATE reactions_full_at=NOW()
+    """,(repo_name,))
+    conn.commit()
+    c.close()
+
+def load_known_numbers(conn, table, repo_name):
+    number_col=PARENT_TABLES[table]
+    c=conn.cursor()
+    c.execute(f"SELECT {number_col} FROM {table} WHERE repo_name=%s",(repo_name,))
+    known={row[0] for row in c.fetchall()}
+    c.close()
+    return known
+
+def numbers_needing_sync(conn, table, synced_col, repo_name, after=0):
+    """
+    Parents whose updated_at moved past their last successful <child> visit.
+    Rows without updated_at (listed by an older version) are always due.
+    """
+    number_col=PARENT_TABLES[table]
+    c=conn.cursor()
+    c.execute(f"""
+      SELECT {number_col} FROM {table}
+      WHERE repo_name=%s AND {number_col}>%s
+        AND ({synced_col} IS NULL OR updated_at IS NULL OR updated_at>{synced_col})
+      ORDER BY {number_col}
+    """,(repo_name,after))
+    rows=c.fetchall()
+    c.close()
+    return rows
+
+def mark_synced(conn, table, synced_col, repo_name, number):
+    """
+    Child visit succeeded => <child>_synced_at = updated_at. Caller commits.
+    """
+    number_col=PARENT_TABLES[table]
+    c=conn.cursor()
+    c.execute(f"""
+      UPDATE {table} SET {synced_col}=COALESCE(updated_at,NOW())
+      WHERE repo_name=%s AND {number_col}=%s
+    """,(repo_name,number))
+    c.close()
+
+def mark_synced_many(conn, table, synced_col, repo_name, numbers, chunk=500):
+    """
+    Batched mark_synced => one UPDATE per chunk, then clears numbers. Caller commits.
+    """
+    number_col=PARENT_TABLES[table]
+    c=conn.cursor()
+    for i in range(0,len(numbers),chunk):
+        part=numbers[i:i+chunk]
+        in_list=",".join(["%s"]*len(part))
+        c.execute(f"""
+          UPDATE {table} SET {synced_col}=COALESCE(updated_at,NOW())
+          WHERE repo_name=%s AND {number_col} IN ({in_list})
+        """,[repo_name]+list(part))
+    c.close()
+    del numbers[:]
@@ -4,6 +4,8 @@
 import os
 import sys
 import time
+import argparse
+import functools
 import logging
 import yaml
 from logging.handlers import TimedRotatingFileHandler
@@ -18,13 +20,41 @@ from requests.adapters import HTTPAdapter, Retry
 import mysql.connector
 
 from db import connect_db, create_tables
-from repo_baselines import get_baseline_info, set_baseline_date
+from repo_baselines import get_baseline_info, set_baseline_date, bump_control_version
 from repos import get_repo_list
+from scheduler import order_repos, run_repo_pool
+from payloads import set_storage_mode
+from github_http import api_url, robust_get_page, set_api_base_url, set_recorder
+from fetch_metrics import start_metrics_writer, stop_metrics_writer, print_metrics_summary
+from write_behind import start_write_behind, stop_write_behind, barrier
+from page_archive import set_archive_dir
+from bulk_load import bulk_enabled, start_bulk, finish_bulk, recount_bulk_repo
+from repo_snapshots import (
+    ALL_RESOURCES,
+    fetch_repo_metadata,
+    get_repo_snapshot,
+    save_repo_snapshot,
+    resources_due,
+    log_changes
+)
+from repo_stats import begin_repo_stats, end_repo_stats, get_repo_stats_rebuilt
+from issue_sync import reaction_pass_due, mark_reaction_pass
+from checkpoints import (
+    set_resume_mode,
+    resume_enabled,
+    reset_checkpoints,
+    is_completed,
+    completed_this_run,
+    mark_completed
+)
 
-TOKENS = []
-CURRENT_TOKEN_INDEX = 0
-session = None
-token_info = {}
+from token_pool import (
+    init_token_pool,
+    set_request_budget,
+    submit_idle_work,
+    run_idle_work,
+    budget_snapshot
+)
 
 def load_config():
     cfg = {}
@@ -46,6 +76,46 @@ def load_config():
     # The number of days we add to earliest GH commit date => final baseline
     cfg.setdefault("days_to_capture",1)
     cfg.setdefault("max_retries",20)
+    # Repo-level worker pool => each worker gets its own DB connection + session
+    cfg.setdefault("workers",4)
+    # Total API requests across all workers for one run (0 => unlimited)
+    cfg.setdefault("max_requests_per_run",0)
+    # Scheduled first, in this order; then repos of priority_owners; then the rest (small first)
+    cfg.setdefault("priority_repos",[])
+    cfg.setdefault("priority_owners",["ni"])
+    # raw_json / comment body storage => full | projected | compressed (see payloads.py)
+    cfg.setdefault("payload_storage","full")
+    # issue/pull events => one GraphQL request per batch of issues instead of REST per issue
+    cfg.setdefault("events_via_graphql",False)
+    # Point the fetchers at replay_server.py (e.g. http://127.0.0.1:8765) for offline runs
+    cfg.setdefault("api_base_url","https://api.github.com")
+    # Directory => save every response as a replay fixture (None => off)
+    cfg.setdefault("record_fixtures_dir",None)
+    # Prometheus text file with per-endpoint fetch telemetry (None => summary only)
+    cfg.setdefault("metrics_file","fetch_metrics.prom")
+    cfg.setdefault("metrics_interval_seconds",30)
+    # Pre-flight GET /repos/{o}/{r} => skip listers whose counters did not change
+    cfg.setdefault("skip_unchanged_repos",True)
+    # ...but run everything at least this often (activity that moves no counter),
+    # incl. a full reaction-summary pass (reactions do not bump updated_at)
+    cfg.setdefault("full_sync_max_age_days",7)
+    # Fetchers queue page writes to one writer thread (own connection) => HTTP and DB overlap
+    cfg.setdefault("write_behind",True)
+    # Pages the queue holds before fetchers block (backpressure)
+    cfg.setdefault("write_behind_queue_pages",200)
+    # Writer commits after this many queued writes or this many seconds
+    cfg.setdefault("write_behind_commit_every",2000)
+    cfg.setdefault("write_behind_commit_seconds",2)
+    # Directory => append every fetched page as gzip JSONL for rebuild.py (None => off)
+    cfg.setdefault("archive_dir",None)
+    # First-time backfill => spool rows to TSV and LOAD DATA them per commit (needs local_infile=ON)
+    cfg.setdefault("bulk_load",False)
+    # ...and drop the rebuildable secondary indexes until the run ends (fresh DB only)
+    cfg.setdefault("bulk_defer_indexes",False)
+    # Spooled rows that force a load before the next commit
+    cfg.setdefault("bulk_flush_rows",50000)
+    # Spool directory (None => a temp dir)
+    cfg.setdefault("bulk_spool_dir",None)
     return cfg
 
 def setup_logging(cfg):
@@ -85,119 +155,233 @@ def setup_session_with_retry():
     s.mount("https://",adapter)
     return s
 
-def rotate_token():
-    global CURRENT_TOKEN_INDEX, TOKENS, session
-    if not TOKENS:
-        return
-    old_idx = CURRENT_TOKEN_INDEX
-    CURRENT_TOKEN_INDEX = (CURRENT_TOKEN_INDEX + 1) % len(TOKENS)
-    new_token = TOKENS[CURRENT_TOKEN_INDEX]
-    session.headers["Authorization"] = f"token {new_token}"
-    logging.info("Rotated token from idx %d to %d => not showing partial token", old_idx, CURRENT_TOKEN_INDEX)
+def parse_args():
+    parser = argparse.ArgumentParser(description="GitHub data mining => MySQL")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from fetch_checkpoints => skip finished repos/resources, restart paging at the stored page.")
+    parser.add_argument("--api-base-url", default=None,
+                        help="Override api_base_url => e.g. the local replay server.")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="Record every GitHub response as a replay fixture under DIR.")
+    parser.add_argument("--archive", metavar="DIR", default=None,
+                        help="Append every fetched page to the raw page archive under DIR (see rebuild.py).")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Bulk mode for an initial backfill => LOAD DATA instead of row-by-row upserts.")
+    return parser.parse_args()
 
 def main():
-    global TOKENS, session, token_info, CURRENT_TOKEN_INDEX
+    args = parse_args()
     cfg = load_config()
     setup_logging(cfg)
-    logging.info("Starting => watchers=full => numeric issues/pulls => skip older stars => single-thread => ALWAYS baseline=earliest GH commit + days_to_capture")
+    set_resume_mode(args.resume)
+    set_storage_mode(cfg["payload_storage"])
+    set_api_base_url(args.api_base_url or cfg["api_base_url"])
+    set_recorder(args.record or cfg["record_fixtures_dir"])
+    set_archive_dir(args.archive or cfg["archive_dir"])
+    if args.bulk:
+        cfg["bulk_load"] = True
+    logging.info("Starting => watchers=full => numeric issues/pulls => skip older stars => %d worker(s) => ALWAYS baseline=earliest GH commit + days_to_capture",
+                 cfg["workers"])
 
     conn = connect_db(cfg, create_db_if_missing=True)
     create_tables(conn)
+    start_bulk(cfg, conn)
 
-    TOKENS = cfg["tokens"]
-    session = setup_session_with_retry()
-    token_info = {}
+    init_token_pool(cfg["tokens"])
+    set_request_budget(cfg["max_requests_per_run"])
+    start_metrics_writer(cfg["metrics_file"], cfg["metrics_interval_seconds"])
+    start_write_behind(cfg)
 
-    if TOKENS:
-        session.headers["Authorization"] = f"token {TOKENS[0]}"
+    all_repos = order_repos(conn, get_repo_list(), cfg["priority_repos"], cfg["priority_owners"])
+    conn.close()
+
+    summary_data = []
+    not_done = run_repo_pool(cfg, all_repos,
+                             functools.partial(process_repo, summary_data=summary_data),
+                             setup_session_with_retry)
+    for (owner,repo) in not_done:
+        logging.warning("Repo %s/%s => not completed this run", owner, repo)
+
+    stop_write_behind()
+    conn = connect_db(cfg, create_db_if_missing=False)
+    finish_bulk(conn)
+    conn.close()
+    run_idle_work()
+    stop_metrics_writer(cfg["metrics_file"])
+    log_token_budgets()
+    logging.info("All done => printing final summary table & multiline details...\n")
+    print_final_summary_table(summary_data)
+    print_metrics_summary()
+    print_detailed_repo_summaries(summary_data)
+    logging.info("Finished completely.")
 
+def process_repo(cfg, conn, owner, repo, session, handle_rate_limit_func, summary_data):
+    """
+    Full fetch for one repo. Runs on a scheduler worker => conn/session are that worker's own.
+    """
     max_retries = cfg["max_retries"]
     days_to_capture = cfg["days_to_capture"]
+    repo_name = f"{owner}/{repo}"
+
+    if not resume_enabled():
+        reset_checkpoints(conn, repo_name)
+    elif is_completed(conn, repo_name, "repo"):
+        logging.info("Repo %s/%s => completed in the interrupted run => skip (resume)", owner, repo)
+        stats=gather_repo_stats(conn,owner,repo,"resume_done",None,None,True)
+        stats["fetched_min_dt"]=None
+        stats["fetched_max_dt"]=None
+        summary_data.append(stats)
+        return
 
-    summary_data = []
-    all_repos = get_repo_list()
-    for (owner,repo) in all_repos:
-        # 1) get earliest GH commit => if none => skip entire
-        earliest_gh_date = get_earliest_gh_commit_date(owner,repo,session,handle_rate_limit_func,max_retries)
-        if not earliest_gh_date:
-            logging.warning("Repo %s/%s => no earliest GH commit => skip",owner,repo)
-            skip_reason="no_earliest_gh_commit"
-            stats=gather_repo_stats(conn,owner,repo,skip_reason,None,None,False)
-            stats["fetched_min_dt"]=None
-            stats["fetched_max_dt"]=None
-            summary_data.append(stats)
-            continue
-
-        # 2) baseline_date = earliestGhCommit + days_to_capture
-        baseline_dt = earliest_gh_date + timedelta(days=days_to_capture)
-        # store in repo_baselines => enabled=1
-        update_repo_baseline(conn, owner, repo, baseline_dt)
-
-        # 3) check earliest DB date => if it's beyond baseline => skip
-        earliest_db_dt = get_minmax_earliest_db_date(conn,owner,repo)
-        skip_reason="None"
-        if earliest_db_dt and earliest_db_dt>baseline_dt:
-            skip_reason="earliest_in_db_newer_than_baseline"
-            logging.info("Repo %s/%s => earliest DB item %s > baseline=%s => skip entire repo",
-                         owner,repo,earliest_db_dt,baseline_dt)
-            stats=gather_repo_stats(conn,owner,repo,skip_reason,earliest_db_dt,baseline_dt,True)
-            stats["fetched_min_dt"]=None
-            stats["fetched_max_dt"]=None
-            summary_data.append(stats)
-            continue
-
-        logging.info("Repo %s/%s => watchers => full => numeric issues/pulls => final baseline_date=%s => proceed",
-                     owner,repo,baseline_dt)
-
-        # normal fetch watchers/forks/stars/issues/pulls...
-        from fetch_forks_stars_watchers import (
-            list_watchers_single_thread,
-            list_forks_single_thread,
-            list_stars_single_thread
-        )
+    # 0) pre-flight => one call => listers whose counters did not move are skipped
+    meta=None
+    if cfg["skip_unchanged_repos"]:
+        meta=fetch_repo_metadata(owner,repo,session,handle_rate_limit_func,max_retries)
+    snapshot=get_repo_snapshot(conn,repo_name) if meta else None
+    due=resources_due(snapshot,meta,cfg["full_sync_max_age_days"])
+    log_changes(repo_name,snapshot,meta)
+    # reactions leave updated_at and every counter alone => periodic full summary pass
+    reaction_pass=reaction_pass_due(conn,repo_name,cfg["full_sync_max_age_days"])
+    if reaction_pass:
+        logging.info("Repo %s/%s => full reaction-summary pass due",owner,repo)
+        due.add("issues")
+    if not due:
+        logging.info("Repo %s/%s => no counter changed since last run => skip",owner,repo)
+        save_repo_snapshot(conn,repo_name,meta,False)
+        stats=gather_repo_stats(conn,owner,repo,"unchanged",None,None,True)
+        stats["fetched_min_dt"]=None
+        stats["fetched_max_dt"]=None
+        summary_data.append(stats)
+        return
+    # events/comments/reactions hang off the issue & pull lists
+    children_due=("issues" in due or "pulls" in due)
+
+    # 1) get earliest GH commit => if none => skip entire
+    earliest_gh_date = get_earliest_gh_commit_date(owner,repo,session,handle_rate_limit_func,max_retries)
+    if not earliest_gh_date:
+        logging.warning("Repo %s/%s => no earliest GH commit => skip",owner,repo)
+        skip_reason="no_earliest_gh_commit"
+        stats=gather_repo_stats(conn,owner,repo,skip_reason,None,None,False)
+        stats["fetched_min_dt"]=None
+        stats["fetched_max_dt"]=None
+        summary_data.append(stats)
+        return
+
+    # 2) baseline_date = earliestGhCommit + days_to_capture
+    baseline_dt = earliest_gh_date + timedelta(days=days_to_capture)
+    # store in repo_baselines => enabled=1
+    update_repo_baseline(conn, owner, repo, baseline_dt)
+
+    # 3) check earliest DB date => if it's beyond baseline => skip
+    earliest_db_dt = get_minmax_earliest_db_date(conn,owner,repo)
+    skip_reason="None"
+    if earliest_db_dt and earliest_db_dt>baseline_dt:
+        skip_reason="earliest_in_db_newer_than_baseline"
+        logging.info("Repo %s/%s => earliest DB item %s > baseline=%s => skip entire repo",
+                     owner,repo,earliest_db_dt,baseline_dt)
+        stats=gather_repo_stats(conn,owner,repo,skip_reason,earliest_db_dt,baseline_dt,True)
+        stats["fetched_min_dt"]=None
+        stats["fetched_max_dt"]=None
+        summary_data.append(stats)
+        return
+
+    logging.info("Repo %s/%s => watchers => full => numeric issues/pulls => final baseline_date=%s => proceed",
+                 owner,repo,baseline_dt)
+
+    # normal fetch watchers/forks/stars/issues/pulls...
+    # in --resume mode every stage already marked completed is skipped
+    # inserts bump the repo_stats counters => no COUNT(*) pass afterwards
+    begin_repo_stats(conn,repo_name)
+    from fetch_forks_stars_watchers import (
+        list_watchers_single_thread,
+        list_forks_single_thread,
+        list_stars_single_thread
+    )
+    if "watchers" in due and not is_completed(conn,repo_name,"watchers"):
         list_watchers_single_thread(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+    if "forks" in due and not is_completed(conn,repo_name,"forks"):
         list_forks_single_thread(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+    if "stars" in due and not is_completed(conn,repo_name,"stars"):
         list_stars_single_thread(conn,owner,repo,1,baseline_dt,session,handle_rate_limit_func,max_retries)
 
-        from fetch_issues import list_issues_single_thread
-        list_issues_single_thread(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+    from fetch_issues import list_issues_single_thread
+    if "issues" in due and not is_completed(conn,repo_name,"issues"):
+        list_issues_single_thread(conn,owner,repo,1,session,handle_rate_limit_func,max_retries,
+                                  full=reaction_pass)
 
-        from fetch_pulls import list_pulls_single_thread
+    from fetch_pulls import list_pulls_single_thread
+    if "pulls" in due and not is_completed(conn,repo_name,"pulls"):
         list_pulls_single_thread(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
 
-        from fetch_events import (
-            fetch_issue_events_for_all_issues,
-            fetch_pull_events_for_all_pulls
-        )
-        fetch_issue_events_for_all_issues(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
-        fetch_pull_events_for_all_pulls(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+    # children read the issue/pull lists => wait for the queued lister writes
+    barrier(conn)
+    if cfg["events_via_graphql"]:
+        from fetch_timeline_graphql import fetch_timeline_events_graphql
+        if children_due and not is_completed(conn,repo_name,"issue_events"):
+            fetch_timeline_events_graphql(conn,owner,repo,"issue",session,handle_rate_limit_func,max_retries)
+        if children_due and not is_completed(conn,repo_name,"pull_events"):
+            fetch_timeline_events_graphql(conn,owner,repo,"pull",session,handle_rate_limit_func,max_retries)
+    else:
+        if children_due and not is_completed(conn,repo_name,"issue_events"):
+            fetch_issue_events_for_all_issues(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+        if children_due and not is_completed(conn,repo_name,"pull_events"):
+            fetch_pull_events_for_all_pulls(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
 
-        from fetch_comments import fetch_comments_for_all_issues
+    from fetch_comments import fetch_comments_for_all_issues, refresh_comment_reaction_summaries
+    if children_due and not is_completed(conn,repo_name,"comments"):
         fetch_comments_for_all_issues(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+    if reaction_pass and not is_completed(conn,repo_name,"comment_summaries"):
+        refresh_comment_reaction_summaries(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
 
-        from fetch_issue_reactions import fetch_issue_reactions_for_all_issues
+    from fetch_issue_reactions import fetch_issue_reactions_for_all_issues
+    if children_due and not is_completed(conn,repo_name,"issue_reactions"):
         fetch_issue_reactions_for_all_issues(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
 
-        # if comment_reactions => do them here
-
+    # comment reactions => only comments whose embedded reaction total changed
+    barrier(conn)
+    from fetch_comment_reactions import fetch_comment_reactions_for_all_comments
+    if children_due and not is_completed(conn,repo_name,"comment_reactions"):
+        fetch_comment_reactions_for_all_comments(conn,owner,repo,1,session,handle_rate_limit_func,max_retries)
+
+    barrier(conn)
+    end_repo_stats(conn,repo_name)
+    if bulk_enabled():
+        recount_bulk_repo(conn,repo_name)
+    mark_completed(conn,repo_name,"repo")
+    if reaction_pass and all(completed_this_run(conn,repo_name,r) for r in ("issues","comment_summaries")):
+        mark_reaction_pass(conn,repo_name)
+    # only remember counters we actually caught up with => unfinished listers retry next run
+    if meta and all(completed_this_run(conn,repo_name,r) for r in due):
+        save_repo_snapshot(conn,repo_name,meta,due==set(ALL_RESOURCES))
+
+    # DB-only => queued so a worker that runs out of API budget can do it instead of sleeping
+    submit_idle_work(collect_fetched_repo_stats,cfg,owner,repo,earliest_db_dt,baseline_dt,summary_data)
+
+def collect_fetched_repo_stats(cfg, owner, repo, earliest_db_dt, baseline_dt, summary_data):
+    """
+    Idle job => stats for a repo that was fetched. Opens its own connection
+    because it may run on whichever worker happens to be out of budget.
+    """
+    conn=connect_db(cfg, create_db_if_missing=False)
+    try:
         stats=gather_repo_stats(conn,owner,repo,"None",earliest_db_dt,baseline_dt,True)
         min_dt,max_dt = get_minmax_all_tables(conn,f"{owner}/{repo}")
         stats["fetched_min_dt"]=min_dt
         stats["fetched_max_dt"]=max_dt
         summary_data.append(stats)
+    finally:
+        conn.close()
 
-    conn.close()
-    logging.info("All done => printing final summary table & multiline details...\n")
-    print_final_summary_table(summary_data)
-    print_detailed_repo_summaries(summary_data)
-    logging.info("Finished completely.")
+def log_token_budgets():
+    for (idx, remaining, reset_ts, used) in budget_snapshot():
+        logging.info("Token idx %d => used=%d => remaining=%s => reset=%s", idx, used, remaining, reset_ts)
 
 def get_earliest_gh_commit_date(owner, repo, session, handle_rate_limit_func, max_retries):
     """
     Single call to /repos/{owner}/{repo}/commits?sort=committer-date&direction=asc&per_page=1
     Return datetime or None => skip
     """
-    url=f"https://api.github.com/repos/{owner}/{repo}/commits"
+    url=api_url(f"/repos/{owner}/{repo}/commits")
     params={
         "sort":"committer-date",
         "direction":"asc",
@@ -219,107 +403,25 @@ def get_earliest_gh_commit_date(owner, repo, session, handle_rate_limit_func, ma
     except ValueError:
         return None
 
-def robust_get_page(session, url, params, handle_rate_limit_func, max_retries=20):
-    import requests
-    from requests.exceptions import ConnectionError
-    mini_retry_attempts=3
-    for attempt in range(1,max_retries+1):
-        local_attempt=1
-        while local_attempt<=mini_retry_attempts:
-            try:
-                resp=session.get(url,params=params)
-                handle_rate_limit_func(resp)
-                if resp.status_code==200:
-                    return (resp,True)
-                elif resp.status_code in (403,429,500,502,503,504):
-                    logging.warning("HTTP %d => attempt %d/%d => retry => %s",
-                                    resp.status_code,attempt,max_retries,url)
-                    time.sleep(5)
-                else:
-                    logging.warning("HTTP %d => attempt %d => break => %s",
-                                    resp.status_code,attempt,url)
-                    return (resp,False)
-                break
-            except ConnectionError:
-                logging.warning("Connection error => local mini-retry => %s",url)
-                time.sleep(3)
-                local_attempt+=1
-        if local_attempt>mini_retry_attempts:
-            logging.warning("Exhausted local mini-retry => break => %s",url)
-            return (None,False)
-    logging.warning("Exceeded max_retries => give up => %s",url)
-    return (None,False)
-
 def get_minmax_earliest_db_date(conn, owner, repo):
     """
-    Return earliest date from union across forks/stars/issues/pulls/events/comments/reactions
-    watchers => no date
+    Return earliest date across forks/stars/issues/pulls/events/comments/reactions
+    (repo_stats.min_dt). watchers => no date
     If none => None
     """
-    repo_name=f"{owner}/{repo}"
-    c=conn.cursor()
-    c.execute("""
-    SELECT MIN(dt)
-    FROM (
-      SELECT created_at as dt FROM forks WHERE repo_name=%s
-      UNION ALL
-      SELECT starred_at as dt FROM stars WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issues WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM pulls WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_events WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM pull_events WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_comments WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM comment_reactions WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_reactions WHERE repo_name=%s
-    ) sub
-    """,(repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name))
-    row=c.fetchone()
-    c.close()
-    if row and row[0]:
-        return row[0]
-    return None
+    stats=get_repo_stats_rebuilt(conn,f"{owner}/{repo}")
+    return stats["min_dt"] if stats else None
 
 def get_minmax_all_tables(conn, repo_name):
     """
     Return (min_dt, max_dt) across forks,stars,issues,pulls,events,comments,comment_reactions,issue_reactions
-    watchers => no date
+    (repo_stats.min_dt/max_dt). watchers => no date
     If none => (None,None)
     """
-    c=conn.cursor()
-    c.execute("""
-    SELECT MIN(dt), MAX(dt)
-    FROM (
-      SELECT created_at as dt FROM forks WHERE repo_name=%s
-      UNION ALL
-      SELECT starred_at as dt FROM stars WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issues WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM pulls WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_events WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM pull_events WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_comments WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM comment_reactions WHERE repo_name=%s
-      UNION ALL
-      SELECT created_at as dt FROM issue_reactions WHERE repo_name=%s
-    ) sub
-    """,(repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name,repo_name))
-    row=c.fetchone()
-    c.close()
-    if row and (row[0] or row[1]):
-        return (row[0], row[1])
-    return (None,None)
+    stats=get_repo_stats_rebuilt(conn,repo_name)
+    if not stats:
+        return (None,None)
+    return (stats["min_dt"], stats["max_dt"])
 
 def update_repo_baseline(conn, owner, repo, baseline_dt):
     """
@@ -335,6 +437,7 @@ def update_repo_baseline(conn, owner, repo, baseline_dt):
       updated_at=NOW()
     """
     c.execute(sql,(owner,repo,baseline_dt))
+    bump_control_version(conn)
     conn.commit()
     c.close()
 
@@ -370,78 +473,29 @@ def gather_repo_stats(conn, owner, repo,
         stats_dict["merged_pulls"] = 0
         return stats_dict
 
-    repo_name=f"{owner}/{repo}"
-    c=conn.cursor()
-
-    c.execute("SELECT COUNT(*) FROM issue_reactions WHERE repo_name=%s",(repo_name,))
-    stats_dict["reactions_in_issues"]=c.fetchone()[0]
-
-    c.execute("SELECT COUNT(*) FROM issues WHERE repo_name=%s",(repo_name,))
-    stats_dict["issues_count"]=c.fetchone()[0]
+    # one row kept current by the inserts (see repo_stats.py)
+    row=get_repo_stats_rebuilt(conn,f"{owner}/{repo}")
 
+    stats_dict["reactions_in_issues"]=row["issue_reactions_count"]
+    stats_dict["issues_count"]=row["issues_count"]
     stats_dict["reactions_in_pulls"]=0
-
-    c.execute("SELECT COUNT(*) FROM pulls WHERE repo_name=%s",(repo_name,))
-    stats_dict["pulls_count"]=c.fetchone()[0]
-
-    c.execute("SELECT COUNT(*) FROM issue_comments WHERE repo_name=%s",(repo_name,))
-    stats_dict["comments_issues"]=c.fetchone()[0]
-
+    stats_dict["pulls_count"]=row["pulls_count"]
+    stats_dict["comments_issues"]=row["comments_count"]
     stats_dict["comments_pulls"]=0
-
-    c.execute("""
-      SELECT COUNT(*)
-      FROM comment_reactions cr
-      JOIN issue_comments ic ON
-        cr.repo_name=ic.repo_name
-        AND cr.issue_number=ic.issue_number
-        AND cr.comment_id=ic.comment_id
-      WHERE cr.repo_name=%s
-    """,(repo_name,))
-    stats_dict["reactions_comments_issues"]=c.fetchone()[0]
-
+    # comment_reactions rows always hang off a stored comment => no JOIN needed
+    stats_dict["reactions_comments_issues"]=row["comment_reactions_count"]
     stats_dict["reactions_comments_pulls"]=0
-
-    c.execute("SELECT COUNT(*) FROM stars WHERE repo_name=%s",(repo_name,))
-    stats_dict["stars_count"]=c.fetchone()[0]
-
-    c.execute("SELECT COUNT(*) FROM forks WHERE repo_name=%s",(repo_name,))
-    stats_dict["forks_count"]=c.fetchone()[0]
-
-    c.execute("SELECT COUNT(*) FROM watchers WHERE repo_name=%s",(repo_name,))
-    stats_dict["watchers_count"]=c.fetchone()[0]
+    stats_dict["stars_count"]=row["stars_count"]
+    stats_dict["forks_count"]=row["forks_count"]
+    stats_dict["watchers_count"]=row["watchers_count"]
 
     stats_dict["opened_issues"]=stats_dict["issues_count"]
     stats_dict["opened_pulls"]=stats_dict["pulls_count"]
 
-    c.execute("""
-      SELECT COUNT(DISTINCT issue_number)
-      FROM issue_events
-      WHERE repo_name=%s
-        AND JSON_EXTRACT(raw_json,'$.event')='closed'
-    """,(repo_name,))
-    row=c.fetchone()
-    stats_dict["closed_issues"]=row[0] if row and row[0] else 0
-
-    c.execute("""
-      SELECT COUNT(DISTINCT pull_number)
-      FROM pull_events
-      WHERE repo_name=%s
-        AND JSON_EXTRACT(raw_json,'$.event')='closed'
-    """,(repo_name,))
-    row=c.fetchone()
-    stats_dict["closed_pulls"]=row[0] if row and row[0] else 0
-
-    c.execute("""
-      SELECT COUNT(DISTINCT pull_number)
-      FROM pull_events
-      WHERE repo_name=%s
-        AND JSON_EXTRACT(raw_json,'$.event')='merged'
-    """,(repo_name,))
-    row=c.fetchone()
-    stats_dict["merged_pulls"]=row[0] if row and row[0] else 0
-
-    c.close()
+    # distinct parents with a 'closed' / 'merged' event
+    stats_dict["closed_issues"]=row["closed_issues"]
+    stats_dict["closed_pulls"]=row["closed_pulls"]
+    stats_dict["merged_pulls"]=row["merged_pulls"]
     return stats_dict
 
 def print_final_summary_table(summary_data):
@@ -500,82 +554,5 @@ def print_detailed_repo_summaries(summary_data):
         print(f"    FetchedMaxDt: {row.get('fetched_max_dt',None)}")
         print("")
 
-def handle_rate_limit_func(resp):
-    global TOKENS, CURRENT_TOKEN_INDEX, session, token_info
-    if not TOKENS:
-        return
-    update_token_info(CURRENT_TOKEN_INDEX, resp)
-    info=token_info.get(CURRENT_TOKEN_INDEX)
-    if info and info["remaining"]<5:
-        old_idx=CURRENT_TOKEN_INDEX
-        rotate_token()
-        if CURRENT_TOKEN_INDEX==old_idx:
-            if get_all_tokens_near_limit():
-                sleep_until_earliest_reset()
-    if resp.status_code in (403,429):
-        logging.warning("HTTP %d => forcibly rotate or sleep", resp.status_code)
-        old_idx=CURRENT_TOKEN_INDEX
-        rotate_token()
-        if CURRENT_TOKEN_INDEX==old_idx:
-            if get_all_tokens_near_limit():
-                sleep_until_earliest_reset()
-            else:
-                do_sleep_based_on_reset()
-
-def update_token_info(token_idx, resp):
-    global token_info
-    rem_str = resp.headers.get("X-RateLimit-Remaining","")
-    rst_str = resp.headers.get("X-RateLimit-Reset","")
-    try:
-        remaining=int(rem_str)
-    except ValueError:
-        remaining=None
-    try:
-        reset_ts=int(rst_str)
-    except ValueError:
-        reset_ts=None
-    if remaining is not None and reset_ts is not None:
-        token_info[token_idx]={"remaining":remaining,"reset":reset_ts}
-
-def get_all_tokens_near_limit():
-    global token_info,TOKENS
-    if not TOKENS:
-        return False
-    for idx in range(len(TOKENS)):
-        info=token_info.get(idx)
-        if not info or info["remaining"]>=5:
-            return False
-    return True
-
-def sleep_until_earliest_reset():
-    import time
-    global token_info,TOKENS
-    if not TOKENS:
-        return
-    earliest=None
-    now_ts=int(time.time())
-    for idx in range(len(TOKENS)):
-        info=token_info.get(idx)
-        if info:
-            rst=info.get("reset")
-            if rst and (earliest is None or rst<earliest):
-                earliest=rst
-    if earliest is None:
-        logging.warning("No valid reset => fallback => sleep 3600s")
-        time.sleep(3600)
-        return
-    delta=earliest-now_ts+30
-    if delta>0:
-        logging.warning("Sleeping %d seconds => earliest token resets at %d (now=%d)",
-                        delta,earliest,now_ts)
-        time.sleep(delta)
-    else:
-        logging.warning("Earliest reset is in the past => no sleep needed")
-
-def do_sleep_based_on_reset():
-    import time
-    logging.warning("Cannot parse reset => fallback => sleep 3600s")
-    time.sleep(3600)
-
 if __name__=="__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,112 @@
+# page_archive.py
+"""
+Raw page archive => a schema change is rebuilt from disk instead of re-fetched.
+
+When archive_dir is set, every successful API page (REST GET and GraphQL
+POST) is appended as one JSON line
+  {"ts", "method", "url", "params", "headers", "body"}
+to
+  <archive_dir>/<owner>__<repo>/<resource>/<YYYY-MM-DD>.jsonl.gz
+resource => the fetch_metrics endpoint with numbers folded and '/' => '_',
+e.g. issues_n_events, issues_comments_n_reactions, graphql.
+
+Every append is its own gzip member => a crash loses at most the page being
+written, and gzip readers see the members as one stream.
+
+rebuild.py streams the files back (iter_archived_pages) through the insert_*
+helpers, in REBUILD_ORDER so parents land before their children.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from fetch_metrics import endpoint_for_url
+
+# Listers first, then the per-issue children (comment reactions need their comments)
+REBUILD_ORDER = (
+    "subscribers",
+    "forks",
+    "stargazers",
+    "issues",
+    "issues_n_events",
+    "graphql",
+    "issues_n_comments",
+    "issues_n_reactions",
+    "issues_comments_n_reactions"
+)
+
+_archive_dir = None
+_lock = threading.Lock()
+
+def set_archive_dir(archive_dir):
+    """
+    Start archiving every successful page under archive_dir (None => off).
+    """
+    global _archive_dir
+    _archive_dir = archive_dir or None
+    if _archive_dir:
+        os.makedirs(_archive_dir, exist_ok=True)
+        logging.info("Archiving raw pages => %s", _archive_dir)
+
+def resource_for_endpoint(endpoint):
+    return endpoint.replace("{n}", "n").replace("/", "_")
+
+def archive_page(resp, params, headers, repo_name=None):
+    """
+    Append one 200 response. headers => the response headers worth keeping.
+    repo_name overrides the one parsed from the URL (GraphQL).
+    """
+    if not _archive_dir or resp is None or resp.request is None:
+        return
+    req = resp.request
+    (parsed_repo, endpoint) = endpoint_for_url(req.url)
+    repo_name = repo_name or parsed_repo
+    now = datetime.now(timezone.utc)
+    record = {
+        "ts": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "method": req.method,
+        "url": req.url.split("?", 1)[0],
+        "params": params or {},
+        "headers": headers,
+        "body": resp.text
+    }
+    out_dir = os.path.join(_archive_dir, repo_name.replace("/", "__"), resource_for_endpoint(endpoint))
+    out_path = os.path.join(out_dir, now.strftime("%Y-%m-%d") + ".jsonl.gz")
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _lock:
+        os.makedirs(out_dir, exist_ok=True)
+        with gzip.open(out_path, "at", encoding="utf-8") as f:
+            f.write(line)
+
+def archived_repos(archive_dir):
+    """
+    owner/repo names that have an archive directory.
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(d.replace("__", "/", 1) for d in os.listdir(archive_dir)
+                  if os.path.isdir(os.path.join(archive_dir, d)) and "__" in d)
+
+def iter_archived_pages(archive_dir, repo_name, resource):
+    """
+    Records of one repo/resource, oldest date file first, in append order.
+    """
+    res_dir = os.path.join(archive_dir, repo_name.replace("/", "__"), resource)
+    if not os.path.isdir(res_dir):
+        return
+    for name in sorted(os.listdir(res_dir)):
+        if not name.endswith(".jsonl.gz"):
+            continue
+        path = os.path.join(res_dir, name)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except (OSError, EOFError, ValueError) as e:
+            # truncated last member after a crash => keep what was read
+            logging.warning("Archive %s => read stopped => %s", path, e)
@@ -0,0 +1,128 @@
+# payloads.py
+"""
+Storage of the raw GitHub payloads (raw_json columns, comment bodies).
+
+The fields analytics actually reads are extracted into typed columns by the
+insert_* functions (event, actor_login, content, body_has_vote, ...). What is
+kept of the rest depends on the configured payload_storage mode:
+
+  full       => raw_json holds the payload as returned (old behaviour)
+  projected  => raw_json holds the payload minus URL / node_id noise
+  compressed => raw_json is NULL; the full payload is zlib-compressed into
+                the raw_payloads side table, keyed by (table_name, row_key).
+                issue_comments.body is stored there too.
+
+Use load_payload() to read a payload back regardless of the mode it was written in.
+"""
+
+import json
+import logging
+import zlib
+
+STORAGE_MODES = ("full", "projected", "compressed")
+# Keys dropped by the projection => hypermedia links GitHub embeds in every object
+DROP_KEYS = ("node_id", "gravatar_id")
+
+_storage_mode = "full"
+
+def set_storage_mode(mode):
+    global _storage_mode
+    if mode not in STORAGE_MODES:
+        logging.warning("Unknown payload_storage=%s => using 'full'", mode)
+        mode = "full"
+    _storage_mode = mode
+    logging.info("Payload storage mode => %s", _storage_mode)
+
+def storage_mode():
+    return _storage_mode
+
+def payload_key(*parts):
+    return "|".join(str(p) for p in parts)
+
+def project_payload(obj):
+    """
+    Recursively strip 'url', '*_url', node_id and gravatar_id keys.
+    """
+    if isinstance(obj, dict):
+        return {
+            k: project_payload(v)
+            for k, v in obj.items()
+            if k != "url" and not k.endswith("_url") and k not in DROP_KEYS
+        }
+    if isinstance(obj, list):
+        return [project_payload(v) for v in obj]
+    return obj
+
+def compress_payload(obj):
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+def decompress_payload(blob):
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def store_payload(conn, table_name, row_key, obj):
+    """
+    Return the value for the row's raw_json column, writing the side-table
+    copy first in compressed mode. Caller commits.
+    """
+    if _storage_mode == "full":
+        return json.dumps(obj, ensure_ascii=False)
+    if _storage_mode == "projected":
+        return json.dumps(project_payload(obj), ensure_ascii=False)
+    store_blob(conn, table_name, row_key, compress_payload(obj))
+    return None
+
+def store_text(conn, table_name, row_key, text):
+    """
+    Same idea for a large text column (comment body) => text or None.
+    """
+    if _storage_mode != "compressed" or text is None:
+        return text
+    store_blob(conn, table_name, row_key, zlib.compress(text.encode("utf-8"), 6))
+    return None
+
+def store_blob(conn, table_name, row_key, blob):
+    c = conn.cursor()
+    c.execute("""
+    INSERT INTO raw_payloads (table_name, row_key, payload)
+    VALUES (%s,%s,%s)
+    ON DUPLICATE KEY UPDATE payload=VALUES(payload)
+    """, (table_name, row_key, blob))
+    c.close()
+
+def load_payload(conn, table_name, row_key, raw_json=None):
+    """
+    Decoder for reads => dict from raw_json if present, else from raw_payloads.
+    """
+    if raw_json:
+        return json.loads(raw_json) if isinstance(raw_json, (str, bytes)) else raw_json
+    c = conn.cursor()
+    c.execute("SELECT payload FROM raw_payloads WHERE table_name=%s AND row_key=%s",
+              (table_name, row_key))
+    row = c.fetchone()
+    c.close()
+    if not row:
+        return None
+    return decompress_payload(row[0])
+
+def load_text(conn, table_name, row_key, text=None):
+    if text is not None:
+        return text
+    c = conn.cursor()
+    c.execute("SELECT payload FROM raw_payloads WHERE table_name=%s AND row_key=%s",
+              (table_name, row_key))
+    row = c.fetchone()
+    c.close()
+    if not row:
+        return None
+    return zlib.decompress(row[0]).decode("utf-8")
+
+def has_vote(body):
+    """
+    Same test analytics used on the body => LIKE '%+1%' OR LIKE '%-1%'.
+    """
+    if not body:
+        return 0
+    return 1 if ("+1" in body or "-1" in body) else 0
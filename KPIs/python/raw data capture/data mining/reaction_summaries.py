@@ -0,0 +1,100 @@
+# reaction_summaries.py
+"""
+Embedded reaction summaries => skip reaction detail calls that can't find anything.
+
+Issue and comment payloads already carry
+  "reactions": {"total_count": N, "+1": .., "-1": .., "laugh": .., ...}
+The listers store total_count (reactions_total) and the per-type counts
+(reactions_summary). The detail fetchers only visit items whose total is
+non-zero and differs from reactions_synced_total, the total seen the last
+time their /reactions were fetched. Rows listed before summaries existed
+have reactions_total NULL and are visited once.
+"""
+
+import json
+
+REACTION_TYPES = ("+1", "-1", "laugh", "hooray", "confused", "heart", "rocket", "eyes")
+
+def reaction_summary(item):
+    """
+    (total_count, per-type JSON string) from an issue/comment payload, or (None, None).
+    """
+    reac = item.get("reactions")
+    if not isinstance(reac, dict) or "total_count" not in reac:
+        return (None, None)
+    counts = {k: reac.get(k, 0) for k in REACTION_TYPES if reac.get(k)}
+    return (reac["total_count"], json.dumps(counts))
+
+def update_issue_reaction_summary(conn, repo_name, issue_num, item):
+    """
+    Refresh the summary of an already stored issue. Caller commits.
+    """
+    total, summary = reaction_summary(item)
+    if total is None:
+        return
+    c = conn.cursor()
+    c.execute("""
+      UPDATE issues SET reactions_total=%s, reactions_summary=%s
+      WHERE repo_name=%s AND issue_number=%s
+    """, (total, summary, repo_name, issue_num))
+    c.close()
+
+def update_comment_reaction_summary(conn, repo_name, issue_num, comment_id, item):
+    total, summary = reaction_summary(item)
+    if total is None:
+        return
+    c = conn.cursor()
+    c.execute("""
+      UPDATE issue_comments SET reactions_total=%s, reactions_summary=%s
+      WHERE repo_name=%s AND issue_number=%s AND comment_id=%s
+    """, (total, summary, repo_name, issue_num, comment_id))
+    c.close()
+
+def issues_needing_reactions(conn, repo_name, after_issue=0):
+    c = conn.cursor()
+    c.execute("""
+      SELECT issue_number FROM issues
+      WHERE repo_name=%s AND issue_number>%s
+        AND (reactions_total IS NULL
+             OR (reactions_total>0 AND reactions_total<>COALESCE(reactions_synced_total,-1)))
+      ORDER BY issue_number
+    """, (repo_name, after_issue))
+    rows = c.fetchall()
+    c.close()
+    return rows
+
+def comments_needing_reactions(conn, repo_name, after_comment=0):
+    c = conn.cursor()
+    c.execute("""
+      SELECT issue_number, comment_id FROM issue_comments
+      WHERE repo_name=%s AND comment_id>%s
+        AND (reactions_total IS NULL
+             OR (reactions_total>0 AND reactions_total<>COALESCE(reactions_synced_total,-1)))
+      ORDER BY comment_id
+    """, (repo_name, after_comment))
+    rows = c.fetchall()
+    c.close()
+    return rows
+
+def mark_issue_reactions_synced(conn, repo_name, issue_num, seen_total):
+    """
+    Detail fetch done => synced total = listed total (or what we saw if never listed). Caller commits.
+    """
+    c = conn.cursor()
+    c.execute("""
+      UPDATE issues
+      SET reactions_total=COALESCE(reactions_total,%s),
+          reactions_synced_total=COALESCE(reactions_total,%s)
+      WHERE repo_name=%s AND issue_number=%s
+    """, (seen_total, seen_total, repo_name, issue_num))
+    c.close()
+
+def mark_comment_reactions_synced(conn, repo_name, issue_num, comment_id, seen_total):
+    c = conn.cursor()
+    c.execute("""
+      UPDATE issue_comments
+      SET reactions_total=COALESCE(reactions_total,%s),
+          reactions_synced_total=COALESCE(reactions_total,%s)
+      WHERE repo_name=%s AND issue_number=%s AND comment_id=%s
+    """, (seen_total, seen_total, repo_name, issue_num, comment_id))
+    c.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# rebuild.py
+"""
+Rebuild the mining tables from the raw page archive (page_archive.py)
+=> no GitHub requests, disk speed.
+
+    python rebuild.py [--archive DIR] [--repo owner/repo ...]
+
+Archived pages go through the same insert_* helpers, payload storage and
+write-behind queue as a live run, so after a schema change (new extracted
+column, different payload_storage, ...) the tables are refilled from what
+was fetched before. Rows already stored are upserted or skipped, so it can
+run against the live DB as well as an empty one.
+
+Issue and PR numbers share one namespace => /issues/{n}/events pages and
+GraphQL timeline aliases go to pull_events when n is a stored pull.
+"""
+
+import argparse
+import json
+import logging
+import re
+import time
+from datetime import datetime
+
+from main import load_config, setup_logging
+from db import connect_db, create_tables
+from payloads import set_storage_mode
+from page_archive import REBUILD_ORDER, archived_repos, iter_archived_pages
+from repo_baselines import get_baseline_info
+from repo_stats import begin_repo_stats, end_repo_stats
+from issue_sync import load_known_numbers
+from watermarks import load_last_event_ids, flush_last_event_ids
+from bulk_load import bulk_enabled, start_bulk, finish_bulk, recount_bulk_repo
+from write_behind import defer, submit, barrier, start_write_behind, stop_write_behind
+from fetch_forks_stars_watchers import insert_watcher_record, insert_fork_record, insert_star_record
+from fetch_issues import insert_issue_record, refresh_issue_record
+from fetch_pulls import insert_pull_record, refresh_pull_record
+from fetch_events import insert_issue_event_record, insert_pull_event_record
+from fetch_comments import insert_comment_record
+from fetch_issue_reactions import insert_issue_reaction
+from fetch_comment_reactions import insert_comment_reaction
+from fetch_timeline_graphql import ISSUE_EVENT_TYPES, PULL_EVENT_TYPES, timeline_events
+
+def _parse_dt(val):
+    return datetime.strptime(val, "%Y-%m-%dT%H:%M:%SZ") if val else None
+
+def _url_number(url, pattern):
+    m = re.search(pattern, url)
+    return int(m.group(1)) if m else None
+
+def _load_event_ids(conn, table, number_col, repo_name):
+    c = conn.cursor()
+    c.execute(f"SELECT {number_col}, event_id FROM {table} WHERE repo_name=%s", (repo_name,))
+    seen = set(c.fetchall())
+    c.close()
+    return seen
+
+def _load_comment_issues(conn, repo_name):
+    c = conn.cursor()
+    c.execute("SELECT comment_id, issue_number FROM issue_comments WHERE repo_name=%s", (repo_name,))
+    found = dict(c.fetchall())
+    c.close()
+    return found
+
+def _event_ops(ops, ctx, repo_name, num, eid, cdt, evt):
+    """
+    One event => issue_events or pull_events, once per (number, event id).
+    """
+    if num in ctx["pulls"]:
+        (table, insert_func) = ("pull_events", insert_pull_event_record)
+    else:
+        (table, insert_func) = ("issue_events", insert_issue_event_record)
+    if (num, eid) in ctx[table]:
+        return
+    ctx[table].add((num, eid))
+    defer(ops, insert_func, repo_name, num, eid, cdt, evt, commit=False)
+    marks = ctx["marks_" + table]
+    if eid > marks.get(num, 0):
+        marks[num] = ctx["pending_" + table][num] = eid
+
+def rebuild_page(ops, ctx, repo_name, resource, record):
+    """
+    One archived page => deferred writes. Same row extraction as the fetchers.
+    """
+    body = json.loads(record["body"])
+    url = record["url"]
+    if resource == "subscribers":
+        for user_obj in body:
+            defer(ops, insert_watcher_record, repo_name, user_obj, commit=False)
+    elif resource == "forks":
+        for fk in body:
+            defer(ops, insert_fork_record, repo_name, fk, commit=False)
+    elif resource == "stargazers":
+        for stargazer in body:
+            sdt = _parse_dt(stargazer.get("starred_at"))
+            if not sdt or (ctx["baseline"] and sdt < ctx["baseline"]):
+                continue
+            defer(ops, insert_star_record, repo_name, stargazer["user"]["login"], sdt, stargazer, commit=False)
+    elif resource == "issues":
+        # the issue and pull listers both page /issues
+        for item in body:
+            num = item["number"]
+            is_pull = "pull_request" in item
+            known = ctx["pulls"] if is_pull else ctx["issues"]
+            if num in known:
+                defer(ops, refresh_pull_record if is_pull else refresh_issue_record, repo_name, num, item)
+                continue
+            insert_func = insert_pull_record if is_pull else insert_issue_record
+            defer(ops, insert_func, repo_name, num, _parse_dt(item.get("created_at")), commit=False, item=item)
+            known.add(num)
+    elif resource == "issues_n_events":
+        num = _url_number(url, r"/issues/(\d+)/events$")
+        for evt in body:
+            _event_ops(ops, ctx, repo_name, num, evt["id"], _parse_dt(evt.get("created_at")), evt)
+    elif resource == "graphql":
+        for (alias, node) in ((body.get("data") or {}).get("repository") or {}).items():
+            if not node or not alias.startswith("n") or "timelineItems" not in node:
+                continue
+            num = int(alias[1:])
+            event_types = PULL_EVENT_TYPES if num in ctx["pulls"] else ISSUE_EVENT_TYPES
+            for (eid, cdt, evt) in timeline_events(node["timelineItems"], event_types):
+                _event_ops(ops, ctx, repo_name, num, eid, cdt, evt)
+    elif resource == "issues_n_comments":
+        num = _url_number(url, r"/issues/(\d+)/comments$")
+        for cmt in body:
+            defer(ops, insert_comment_record, repo_name, num, cmt["id"],
+                  _parse_dt(cmt.get("created_at")), cmt, commit=False)
+    elif resource == "issues_n_reactions":
+        num = _url_number(url, r"/issues/(\d+)/reactions$")
+        for reac in body:
+            defer(ops, insert_issue_reaction, repo_name, num, reac["id"],
+                  _parse_dt(reac.get("created_at")), reac, commit=False)
+    elif resource == "issues_comments_n_reactions":
+        comment_id = _url_number(url, r"/issues/comments/(\d+)/reactions$")
+        issue_num = ctx["comment_issues"].get(comment_id)
+        if issue_num is None:
+            return
+        for reac in body:
+            defer(ops, insert_comment_reaction, repo_name, issue_num, comment_id, reac["id"],
+                  _parse_dt(reac.get("created_at")), reac, commit=False)
+
+def rebuild_repo(conn, archive_dir, repo_name):
+    owner, repo = repo_name.split("/", 1)
+    started = time.monotonic()
+    begin_repo_stats(conn, repo_name)
+    ctx = {
+        "baseline": get_baseline_info(conn, owner, repo)[0],
+        "issues": load_known_numbers(conn, "issues", repo_name),
+        "pulls": load_known_numbers(conn, "pulls", repo_name),
+        "issue_events": _load_event_ids(conn, "issue_events", "issue_number", repo_name),
+        "pull_events": _load_event_ids(conn, "pull_events", "pull_number", repo_name),
+        "marks_issue_events": load_last_event_ids(conn, repo_name, "issues", "issue_number", "issue_events"),
+        "marks_pull_events": load_last_event_ids(conn, repo_name, "pulls", "pull_number", "pull_events"),
+        "pending_issue_events": {},
+        "pending_pull_events": {}
+    }
+    ops = []
+    pages = 0
+    for resource in REBUILD_ORDER:
+        if resource == "issues_comments_n_reactions":
+            barrier(conn)
+            ctx["comment_issues"] = _load_comment_issues(conn, repo_name)
+        for record in iter_archived_pages(archive_dir, repo_name, resource):
+            rebuild_page(ops, ctx, repo_name, resource, record)
+            submit(conn, ops)
+            pages += 1
+    defer(ops, flush_last_event_ids, "issues", "issue_number", repo_name, ctx["pending_issue_events"])
+    defer(ops, flush_last_event_ids, "pulls", "pull_number", repo_name, ctx["pending_pull_events"])
+    submit(conn, ops)
+    barrier(conn)
+    end_repo_stats(conn, repo_name)
+    if bulk_enabled():
+        recount_bulk_repo(conn, repo_name)
+    logging.info("Rebuild => %s => %d archived page(s) => %.1fs", repo_name, pages, time.monotonic() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the mining tables from the raw page archive")
+    parser.add_argument("--archive", default=None, help="Archive directory (default: archive_dir in config.yaml)")
+    parser.add_argument("--repo", action="append", default=[], help="owner/repo to rebuild (repeatable; default: all archived)")
+    parser.add_argument("--bulk", action="store_true", help="LOAD DATA bulk mode (see bulk_load.py)")
+    args = parser.parse_args()
+
+    cfg = load_config()
+    if args.bulk:
+        cfg["bulk_load"] = True
+    setup_logging(cfg)
+    archive_dir = args.archive or cfg["archive_dir"]
+    if not archive_dir:
+        parser.error("no archive directory => --archive or archive_dir in config.yaml")
+    set_storage_mode(cfg["payload_storage"])
+
+    conn = connect_db(cfg, create_db_if_missing=True)
+    create_tables(conn)
+    start_bulk(cfg, conn)
+    start_write_behind(cfg)
+    try:
+        for repo_name in (args.repo or archived_repos(archive_dir)):
+            rebuild_repo(conn, archive_dir, repo_name)
+    finally:
+        stop_write_behind()
+        finish_bulk(conn)
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# replay_server.py
+"""
+Local GitHub API stand-in => replays fixtures recorded with main.py --record DIR.
+
+  python replay_server.py --fixtures DIR --port 8765 --latency-ms 80
+  python main.py --api-base-url http://127.0.0.1:8765
+
+Lets us measure fetcher throughput, concurrency and backoff offline:
+  --latency-ms / --jitter-ms  => per-response delay
+  --rate-limit / --reset-window => per-token X-RateLimit-* budget; 403 once a
+                                   token is out until its window resets
+  --error-rate / --error-status => inject 403/429 (Retry-After + reset headers)
+  --seed                        => same injected errors on every run
+
+Link headers are rewritten to point back at this server. Unknown requests get
+404. GET /_replay/stats returns the served / missed / injected counters.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+from github_http import fixture_key, DEFAULT_API_BASE_URL
+
+class ReplayState:
+    def __init__(self, fixtures, base_url, args):
+        self.fixtures = fixtures
+        self.base_url = base_url
+        self.latency = args.latency_ms / 1000.0
+        self.jitter = args.jitter_ms / 1000.0
+        self.rate_limit = args.rate_limit
+        self.reset_window = args.reset_window
+        self.error_rate = args.error_rate
+        self.error_status = args.error_status
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        # token => (remaining, reset_epoch)
+        self.budgets = {}
+        self.stats = {"served": 0, "missing": 0, "injected": 0, "rate_limited": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def take_budget(self, token):
+        """
+        -> (remaining after this request, reset epoch, allowed)
+        """
+        now = int(time.time())
+        with self.lock:
+            remaining, reset_ts = self.budgets.get(token, (self.rate_limit, now + self.reset_window))
+            if now >= reset_ts:
+                remaining, reset_ts = self.rate_limit, now + self.reset_window
+            allowed = remaining > 0
+            if allowed:
+                remaining -= 1
+            self.budgets[token] = (remaining, reset_ts)
+            return (remaining, reset_ts, allowed)
+
+    def should_inject(self):
+        with self.lock:
+            return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    def delay(self):
+        with self.lock:
+            extra = self.rng.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for name in os.listdir(fixtures_dir):
+        if not name.endswith(".json.gz"):
+            continue
+        with gzip.open(os.path.join(fixtures_dir, name), "rt", encoding="utf-8") as f:
+            fixtures[name[:-len(".json.gz")]] = json.load(f)
+    return fixtures
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "GitHubReplay/1.0"
+    state = None
+
+    def log_message(self, fmt, *args):
+        logging.debug("%s => " + fmt, self.address_string(), *args)
+
+    def do_GET(self):
+        self._replay(None)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._replay(self.rfile.read(length) if length else None)
+
+    def _send(self, status, headers, body):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _replay(self, body):
+        st = self.state
+        parts = urlsplit(self.path)
+        if parts.path == "/_replay/stats":
+            with st.lock:
+                payload = json.dumps(st.stats)
+            self._send(200, {"Content-Type": "application/json"}, payload)
+            return
+
+        st.delay()
+        token = self.headers.get("Authorization") or "anonymous"
+        remaining, reset_ts, allowed = st.take_budget(token)
+        rl_headers = {
+            "X-RateLimit-Limit": str(st.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset_ts),
+            "X-RateLimit-Used": str(st.rate_limit - remaining),
+            "X-RateLimit-Resource": "graphql" if parts.path == "/graphql" else "core",
+            "Content-Type": "application/json; charset=utf-8"
+        }
+
+        if not allowed:
+            st.count("rate_limited")
+            self._send(403, rl_headers, json.dumps({"message": "API rate limit exceeded (replay)"}))
+            return
+        if st.should_inject():
+            st.count("injected")
+            status = st.rng.choice(st.error_status)
+            hdrs = dict(rl_headers)
+            hdrs["Retry-After"] = "1"
+            if status == 403:
+                hdrs["X-RateLimit-Remaining"] = "0"
+            self._send(status, hdrs, json.dumps({"message": f"Injected {status} (replay)"}))
+            return
+
+        fixture = st.fixtures.get(fixture_key(self.command, parts.path, parts.query, body))
+        if fixture is None:
+            st.count("missing")
+            logging.info("No fixture => %s %s", self.command, self.path)
+            self._send(404, rl_headers, json.dumps({"message": "Not Found (no fixture)"}))
+            return
+
+        st.count("served")
+        hdrs = dict(rl_headers)
+        for (k, v) in fixture["headers"].items():
+            if k.startswith("X-RateLimit-"):
+                continue  # simulated budget wins over the recorded one
+            if k == "Link":
+                v = v.replace(DEFAULT_API_BASE_URL, st.base_url)
+            hdrs[k] = v
+        self._send(fixture["status"], hdrs, fixture["body"])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded GitHub API fixtures")
+    parser.add_argument("--fixtures", required=True, help="Directory written by main.py --record")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Requests per token per window")
+    parser.add_argument("--reset-window", type=int, default=3600, help="Seconds until a token's budget resets")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an injected error")
+    parser.add_argument("--error-status", type=int, nargs="+", default=[403, 429])
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    fixtures = load_fixtures(args.fixtures)
+    base_url = f"http://{args.host}:{args.port}"
+    ReplayHandler.state = ReplayState(fixtures, base_url, args)
+    server = ThreadingHTTPServer((args.host, args.port), ReplayHandler)
+    logging.info("Replaying %d fixture(s) from %s => %s", len(fixtures), args.fixtures, base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("Replay stats => %s", ReplayHandler.state.stats)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,20 @@
 # repo_baselines.py
 import logging
+import threading
+import time
+
+# Control-plane cache => (baseline_date, enabled) for every repo, shared by all workers.
+# Every CONTROL_TTL_SECONDS one cheap PK lookup polls control_plane.version; the
+# whole repo_baselines table is reloaded only when the version moved, or at least
+# every CONTROL_FULL_RELOAD_SECONDS so hand-edited rows are still picked up.
+CONTROL_TTL_SECONDS = 30
+CONTROL_FULL_RELOAD_SECONDS = 600
+
+_cache_lock = threading.Lock()
+_cache = {}
+_cache_version = None
+_last_poll = 0.0
+_last_reload = 0.0
 
 def get_baseline_info(conn, owner, repo):
     c=conn.cursor()
@@ -11,13 +26,65 @@ def get_baseline_info(conn, owner, repo):
         return (None,1)
     return (row[0], row[1])
 
+def bump_control_version(conn):
+    """
+    Tell every worker's cache that repo_baselines changed. Caller commits.
+    """
+    c=conn.cursor()
+    c.execute("""
+    INSERT INTO control_plane (id, version, updated_at) VALUES (1,1,NOW())
+    ON DUPLICATE KEY UPDATE version=version+1, updated_at=NOW()
+    """)
+    c.close()
+
+def _poll_control_version(conn):
+    c=conn.cursor()
+    c.execute("SELECT version FROM control_plane WHERE id=1")
+    row=c.fetchone()
+    c.close()
+    return row[0] if row else 0
+
+def _reload_cache(conn):
+    c=conn.cursor()
+    c.execute("SELECT owner, repo, baseline_date, enabled FROM repo_baselines")
+    rows=c.fetchall()
+    c.close()
+    return {(ow,rp): (bdt,en) for (ow,rp,bdt,en) in rows}
+
+def get_baseline_info_cached(conn, owner, repo):
+    """
+    Same result as get_baseline_info(), served from the control-plane cache.
+    """
+    global _cache, _cache_version, _last_poll, _last_reload
+    now=time.monotonic()
+    with _cache_lock:
+        if now-_last_poll>=CONTROL_TTL_SECONDS:
+            version=_poll_control_version(conn)
+            if version!=_cache_version or now-_last_reload>=CONTROL_FULL_RELOAD_SECONDS:
+                _cache=_reload_cache(conn)
+                _cache_version=version
+                _last_reload=now
+            _last_poll=now
+        return _cache.get((owner,repo),(None,1))
+
+def invalidate_control_cache():
+    global _last_poll
+    with _cache_lock:
+        _last_poll=0.0
+
 def refresh_baseline_info_mid_run(conn, owner, repo, old_base, old_en):
-    new_base,new_en=get_baseline_info(conn,owner,repo)
-    if new_en!=old_en or new_base!=old_base:
+    new_base,new_en=get_baseline_info_cached(conn,owner,repo)
+    if new_en!=old_en or (old_base is not None and new_base!=old_base):
         logging.info("Repo %s/%s => baseline changed mid-run from (%s,%s) to (%s,%s)",
                      owner,repo,old_base,old_en,new_base,new_en)
     return (new_base,new_en)
 
+def is_repo_enabled_cached(conn, owner, repo):
+    """
+    Mid-run pause check for the paging loops => no DB round trip per page.
+    """
+    return get_baseline_info_cached(conn,owner,repo)[1]!=0
+
 def set_baseline_date(conn, owner, repo, new_date):
     c=conn.cursor()
     c.execute("""
@@ -25,5 +92,20 @@ def set_baseline_date(conn, owner, repo, new_date):
     VALUES (%s,%s,%s,1,NOW())
     ON DUPLICATE KEY UPDATE baseline_date=VALUES(baseline_date), updated_at=NOW()
     """,(owner,repo,new_date))
+    bump_control_version(conn)
+    conn.commit()
+    c.close()
+
+def set_repo_enabled(conn, owner, repo, enabled):
+    """
+    Pause (0) / resume (1) a repo => running listers stop within CONTROL_TTL_SECONDS.
+    """
+    c=conn.cursor()
+    c.execute("""
+    INSERT INTO repo_baselines (owner, repo, enabled, updated_at)
+    VALUES (%s,%s,%s,NOW())
+    ON DUPLICATE KEY UPDATE enabled=VALUES(enabled), updated_at=NOW()
+    """,(owner,repo,enabled))
+    bump_control_version(conn)
     conn.commit()
     c.close()
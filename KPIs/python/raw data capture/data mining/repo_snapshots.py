@@ -0,0 +1,114 @@
+# repo_snapshots.py
+"""
+Pre-flight change detection => one GET /repos/{owner}/{repo} per repo.
+
+The repo object's counters are compared with the snapshot stored after the
+last completed run:
+  subscribers_count  => watchers
+  forks_count        => forks
+  stargazers_count   => stars
+  pushed_at / updated_at / open_issues_count => issues, pulls and the
+                        per-issue children (events, comments, reactions)
+Listers whose counters did not move are skipped; a repo where nothing moved
+costs this single request.
+
+Activity that leaves every counter alone (a new comment on an old issue)
+is only caught by the periodic full pass => full_sync_max_age_days.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from github_http import api_url, robust_get_page
+
+COUNTER_RESOURCES = {
+    "subscribers_count": ("watchers",),
+    "forks_count": ("forks",),
+    "stargazers_count": ("stars",),
+    "open_issues_count": ("issues", "pulls"),
+    "pushed_at": ("issues", "pulls"),
+    "updated_at": ("issues", "pulls")
+}
+SNAPSHOT_FIELDS = ("pushed_at", "updated_at", "stargazers_count", "forks_count",
+                   "subscribers_count", "open_issues_count")
+ALL_RESOURCES = ("watchers", "forks", "stars", "issues", "pulls")
+
+def _parse_dt(val):
+    return datetime.strptime(val, "%Y-%m-%dT%H:%M:%SZ") if val else None
+
+def fetch_repo_metadata(owner, repo, session, handle_rate_limit_func, max_retries):
+    """
+    -> {field: value} for the snapshot fields, or None if the call failed.
+    """
+    url = api_url(f"/repos/{owner}/{repo}")
+    (resp, success) = robust_get_page(session, url, {}, handle_rate_limit_func, max_retries)
+    if not success or not resp:
+        return None
+    data = resp.json()
+    return {
+        "pushed_at": _parse_dt(data.get("pushed_at")),
+        "updated_at": _parse_dt(data.get("updated_at")),
+        "stargazers_count": data.get("stargazers_count"),
+        "forks_count": data.get("forks_count"),
+        "subscribers_count": data.get("subscribers_count"),
+        "open_issues_count": data.get("open_issues_count")
+    }
+
+def get_repo_snapshot(conn, repo_name):
+    c = conn.cursor()
+    c.execute("""
+      SELECT pushed_at, updated_at, stargazers_count, forks_count,
+             subscribers_count, open_issues_count, full_synced_at
+      FROM repo_snapshots WHERE repo_name=%s
+    """, (repo_name,))
+    row = c.fetchone()
+    c.close()
+    if row is None:
+        return None
+    return dict(zip(SNAPSHOT_FIELDS + ("full_synced_at",), row))
+
+def save_repo_snapshot(conn, repo_name, meta, full_sync):
+    """
+    Store the counters the run just caught up with. full_sync => every lister ran.
+    """
+    c = conn.cursor()
+    c.execute("""
+    INSERT INTO repo_snapshots
+      (repo_name, pushed_at, updated_at, stargazers_count, forks_count,
+       subscribers_count, open_issues_count, checked_at, full_synced_at)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,NOW(),IF(%s,NOW(),NULL))
+    ON DUPLICATE KEY UPDATE
+      pushed_at=VALUES(pushed_at), updated_at=VALUES(updated_at),
+      stargazers_count=VALUES(stargazers_count), forks_count=VALUES(forks_count),
+      subscribers_count=VALUES(subscribers_count), open_issues_count=VALUES(open_issues_count),
+      checked_at=NOW(),
+      full_synced_at=IF(%s,NOW(),full_synced_at)
+    """, (repo_name, meta["pushed_at"], meta["updated_at"], meta["stargazers_count"],
+          meta["forks_count"], meta["subscribers_count"], meta["open_issues_count"],
+          full_sync, full_sync))
+    conn.commit()
+    c.close()
+
+def resources_due(snapshot, meta, full_sync_max_age_days):
+    """
+    Set of listers to run this time. Everything when there is no usable
+    snapshot, no metadata, or the last full pass is too old.
+    """
+    if not snapshot or not meta:
+        return set(ALL_RESOURCES)
+    full_at = snapshot.get("full_synced_at")
+    if not full_at or datetime.now() - full_at > timedelta(days=full_sync_max_age_days):
+        return set(ALL_RESOURCES)
+    due = set()
+    for field, resources in COUNTER_RESOURCES.items():
+        if meta.get(field) != snapshot.get(field):
+            due.update(resources)
+    return due
+
+def log_changes(repo_name, snapshot, meta):
+    if not snapshot or not meta:
+        return
+    changed = [f"{f}: {snapshot.get(f)} -> {meta.get(f)}"
+               for f in COUNTER_RESOURCES if meta.get(f) != snapshot.get(f)]
+    if changed:
+        logging.info("Repo %s => changed since last run => %s", repo_name, "; ".join(changed))
@@ -0,0 +1,189 @@
+# repo_stats.py
+"""
+Per-repo counters => one repo_stats row read by the summary and the skip
+checks, instead of a dozen COUNT(*) queries and a nine-way UNION per repo.
+
+The insert_* helpers write through write_behind.upsert_row(), which calls
+note_row() for every row that was really new (its unique key was not stored
+yet => not an upsert of an existing row). Deltas and min/max dates are kept
+in memory per repo and added to the row by flush_repo_stats().
+
+closed_issues / closed_pulls / merged_pulls count distinct parents; a
+'closed'/'merged' event flips issues.closed_seen / pulls.closed_seen /
+pulls.merged_seen once (note_event_flag) and only that flip is counted.
+
+Crash safety: begin_repo_stats() marks the row dirty before fetching and
+end_repo_stats() flushes and clears it. A row still dirty at the next start
+(or missing) is recounted from the tables once by rebuild_repo_stats().
+"""
+
+import logging
+import threading
+
+# insert table => (repo_stats counter, date column used for min/max)
+STAT_TABLES = {
+    "issues": ("issues_count", "created_at"),
+    "pulls": ("pulls_count", "created_at"),
+    "issue_events": ("issue_events_count", "created_at"),
+    "pull_events": ("pull_events_count", "created_at"),
+    "issue_comments": ("comments_count", "created_at"),
+    "issue_reactions": ("issue_reactions_count", "created_at"),
+    "comment_reactions": ("comment_reactions_count", "created_at"),
+    "stars": ("stars_count", "starred_at"),
+    "forks": ("forks_count", "created_at"),
+    "watchers": ("watchers_count", None)
+}
+# (events table, event) => (parent table, number column, flag column, repo_stats counter)
+EVENT_FLAGS = {
+    ("issue_events", "closed"): ("issues", "issue_number", "closed_seen", "closed_issues"),
+    ("pull_events", "closed"): ("pulls", "pull_number", "closed_seen", "closed_pulls"),
+    ("pull_events", "merged"): ("pulls", "pull_number", "merged_seen", "merged_pulls")
+}
+COUNTERS = tuple(col for (col, _dt) in STAT_TABLES.values()) + ("closed_issues", "closed_pulls", "merged_pulls")
+
+_lock = threading.Lock()
+_pending = {}
+# repos between begin_repo_stats() and end_repo_stats() in this process
+_active = set()
+
+def _pending_for(repo_name):
+    p = _pending.get(repo_name)
+    if p is None:
+        p = _pending[repo_name] = {"counts": {}, "min_dt": None, "max_dt": None}
+    return p
+
+def note_row(repo_name, table, dt=None, n=1):
+    """
+    n new rows in table (key not stored before the insert). dt => their date for min/max.
+    """
+    counter = STAT_TABLES[table][0]
+    with _lock:
+        p = _pending_for(repo_name)
+        p["counts"][counter] = p["counts"].get(counter, 0) + n
+        if dt is not None:
+            if p["min_dt"] is None or dt < p["min_dt"]:
+                p["min_dt"] = dt
+            if p["max_dt"] is None or dt > p["max_dt"]:
+                p["max_dt"] = dt
+
+def note_event_flag(conn, repo_name, events_table, number, event):
+    """
+    First 'closed'/'merged' event of a parent => count it. Caller commits.
+    """
+    flag = EVENT_FLAGS.get((events_table, event))
+    if not flag:
+        return
+    (parent_table, number_col, flag_col, counter) = flag
+    c = conn.cursor()
+    c.execute(f"""
+      UPDATE {parent_table} SET {flag_col}=1
+      WHERE repo_name=%s AND {number_col}=%s AND COALESCE({flag_col},0)=0
+    """, (repo_name, number))
+    flipped = c.rowcount
+    c.close()
+    if flipped:
+        with _lock:
+            p = _pending_for(repo_name)
+            p["counts"][counter] = p["counts"].get(counter, 0) + flipped
+
+def flush_repo_stats(conn, repo_name):
+    """
+    Add the in-memory deltas to the repo_stats row. Caller commits.
+    """
+    with _lock:
+        p = _pending.pop(repo_name, None)
+    if not p or (not p["counts"] and p["min_dt"] is None):
+        return
+    cols = list(COUNTERS)
+    vals = [p["counts"].get(col, 0) for col in cols]
+    updates = ", ".join(f"{col}={col}+VALUES({col})" for col in cols)
+    c = conn.cursor()
+    c.execute(f"""
+    INSERT INTO repo_stats (repo_name, {", ".join(cols)}, min_dt, max_dt, dirty, updated_at)
+    VALUES (%s, {", ".join(["%s"] * len(cols))}, %s, %s, 1, NOW())
+    ON DUPLICATE KEY UPDATE {updates},
+      min_dt=IF(min_dt IS NULL OR VALUES(min_dt)<min_dt, VALUES(min_dt), min_dt),
+      max_dt=IF(max_dt IS NULL OR VALUES(max_dt)>max_dt, VALUES(max_dt), max_dt),
+      updated_at=NOW()
+    """, [repo_name] + vals + [p["min_dt"], p["max_dt"]])
+    c.close()
+
+def rebuild_repo_stats(conn, repo_name):
+    """
+    Recount everything for one repo from the tables (first run, or after a crash).
+    """
+    logging.info("Repo %s => rebuilding repo_stats from the tables", repo_name)
+    with _lock:
+        _pending.pop(repo_name, None)
+    c = conn.cursor()
+    values = {}
+    for table, (counter, _dt_col) in STAT_TABLES.items():
+        c.execute(f"SELECT COUNT(*) FROM {table} WHERE repo_name=%s", (repo_name,))
+        values[counter] = c.fetchone()[0]
+    for (parent_table, number_col, flag_col, counter) in EVENT_FLAGS.values():
+        c.execute(f"SELECT COUNT(*) FROM {parent_table} WHERE repo_name=%s AND {flag_col}=1", (repo_name,))
+        values[counter] = c.fetchone()[0]
+    min_dt = max_dt = None
+    for table, (_counter, dt_col) in STAT_TABLES.items():
+        if not dt_col:
+            continue
+        c.execute(f"SELECT MIN({dt_col}), MAX({dt_col}) FROM {table} WHERE repo_name=%s", (repo_name,))
+        (lo, hi) = c.fetchone()
+        if lo is not None and (min_dt is None or lo < min_dt):
+            min_dt = lo
+        if hi is not None and (max_dt is None or hi > max_dt):
+            max_dt = hi
+    cols = list(COUNTERS)
+    c.execute(f"""
+    REPLACE INTO repo_stats (repo_name, {", ".join(cols)}, min_dt, max_dt, dirty, updated_at, rebuilt_at)
+    VALUES (%s, {", ".join(["%s"] * len(cols))}, %s, %s, 0, NOW(), NOW())
+    """, [repo_name] + [values[col] for col in cols] + [min_dt, max_dt])
+    conn.commit()
+    c.close()
+
+def get_repo_stats(conn, repo_name):
+    """
+    dict(counters..., min_dt, max_dt, dirty) or None.
+    """
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(COUNTERS)}, min_dt, max_dt, dirty FROM repo_stats WHERE repo_name=%s",
+              (repo_name,))
+    row = c.fetchone()
+    c.close()
+    if row is None:
+        return None
+    return dict(zip(COUNTERS + ("min_dt", "max_dt", "dirty"), row))
+
+def get_repo_stats_rebuilt(conn, repo_name):
+    """
+    get_repo_stats(), recounting first if the row is missing or was left dirty.
+    """
+    stats = get_repo_stats(conn, repo_name)
+    if stats is None or (stats["dirty"] and repo_name not in _active):
+        rebuild_repo_stats(conn, repo_name)
+        stats = get_repo_stats(conn, repo_name)
+    return stats
+
+def begin_repo_stats(conn, repo_name):
+    """
+    Before fetching => make sure the row is trustworthy, then mark it dirty.
+    """
+    get_repo_stats_rebuilt(conn, repo_name)
+    with _lock:
+        _active.add(repo_name)
+    c = conn.cursor()
+    c.execute("UPDATE repo_stats SET dirty=1 WHERE repo_name=%s", (repo_name,))
+    conn.commit()
+    c.close()
+
+def end_repo_stats(conn, repo_name):
+    """
+    All stages done => add the deltas and clear the dirty flag in one commit.
+    """
+    flush_repo_stats(conn, repo_name)
+    c = conn.cursor()
+    c.execute("UPDATE repo_stats SET dirty=0 WHERE repo_name=%s", (repo_name,))
+    conn.commit()
+    c.close()
+    with _lock:
+        _active.discard(repo_name)
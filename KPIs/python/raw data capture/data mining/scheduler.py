@@ -0,0 +1,128 @@
+# scheduler.py
+"""
+Repo-level scheduler for the data-mining run.
+
+Repos are ordered so the ones we report on (priority list) and the small
+ones go first, then handed to a fixed pool of worker threads. Each worker
+owns its own DB connection and its own requests.Session (with a token from
+the shared pool), so one huge repo only ties up one worker instead of the
+whole run.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from db import connect_db
+from token_pool import (
+    assign_token,
+    make_rate_limit_handler,
+    request_budget_left,
+    RequestBudgetExhausted
+)
+
+_worker_state = threading.local()
+_worker_conns = []
+_worker_conns_lock = threading.Lock()
+
+def estimate_repo_sizes(conn):
+    """
+    One grouped query => {repo_name: issues+pulls already stored}.
+    Repos never fetched are missing => treated as small.
+    """
+    c=conn.cursor()
+    c.execute("""
+    SELECT repo_name, SUM(cnt)
+    FROM (
+      SELECT repo_name, COUNT(*) AS cnt FROM issues GROUP BY repo_name
+      UNION ALL
+      SELECT repo_name, COUNT(*) AS cnt FROM pulls GROUP BY repo_name
+    ) sub
+    GROUP BY repo_name
+    """)
+    sizes={row[0]: int(row[1] or 0) for row in c.fetchall()}
+    c.close()
+    return sizes
+
+def order_repos(conn, repos, priority_repos, priority_owners):
+    """
+    Sort (owner,repo) pairs => priority repos first (in config order),
+    then priority owners, then everything else; smallest first inside each group.
+    """
+    sizes=estimate_repo_sizes(conn)
+    prio_index={name.lower(): i for i, name in enumerate(priority_repos)}
+    owners={o.lower() for o in priority_owners}
+
+    def sort_key(pair):
+        owner,repo=pair
+        full=f"{owner}/{repo}"
+        if full.lower() in prio_index:
+            group=(0, prio_index[full.lower()])
+        elif owner.lower() in owners:
+            group=(1, 0)
+        else:
+            group=(2, 0)
+        return (group, sizes.get(full, 0))
+
+    ordered=sorted(repos, key=sort_key)
+    logging.info("Repo order => %s", ", ".join(f"{o}/{r}" for o,r in ordered))
+    return ordered
+
+def get_worker_context(cfg, session_factory):
+    """
+    Lazily build (conn, session, handle_rate_limit_func) for the current worker thread.
+    """
+    ctx=getattr(_worker_state, "ctx", None)
+    if ctx is None:
+        conn=connect_db(cfg, create_db_if_missing=False)
+        session=session_factory()
+        assign_token(session)
+        handler=make_rate_limit_handler(session)
+        ctx=(conn, session, handler)
+        _worker_state.ctx=ctx
+        with _worker_conns_lock:
+            _worker_conns.append(conn)
+    return ctx
+
+def run_repo_pool(cfg, repos, process_repo_func, session_factory):
+    """
+    Run process_repo_func(cfg, conn, owner, repo, session, handle_rate_limit_func)
+    for every repo on a pool of cfg["workers"] threads, in the given order.
+    Returns the list of (owner, repo) that were not completed.
+    """
+    workers=max(1, int(cfg["workers"]))
+    not_done=[]
+
+    def run_one(owner, repo):
+        if not request_budget_left():
+            logging.warning("Repo %s/%s => run request budget spent => not started", owner, repo)
+            return False
+        conn,session,handler=get_worker_context(cfg, session_factory)
+        try:
+            process_repo_func(cfg, conn, owner, repo, session, handler)
+        except RequestBudgetExhausted:
+            logging.warning("Repo %s/%s => run request budget spent mid-repo => stop", owner, repo)
+            return False
+        return True
+
+    logging.info("Scheduler => %d repos on %d worker(s)", len(repos), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repo-worker") as pool:
+        futures={pool.submit(run_one, owner, repo): (owner, repo) for (owner, repo) in repos}
+        for fut in as_completed(futures):
+            owner,repo=futures[fut]
+            try:
+                ok=fut.result()
+            except Exception:
+                logging.exception("Repo %s/%s => worker failed", owner, repo)
+                ok=False
+            if not ok:
+                not_done.append((owner, repo))
+
+    with _worker_conns_lock:
+        for conn in _worker_conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _worker_conns.clear()
+    return not_done
@@ -0,0 +1,258 @@
+# token_pool.py
+"""
+Shared GitHub token pool.
+
+Each token keeps its own remaining budget and reset time, read from the
+X-RateLimit-Remaining / X-RateLimit-Reset headers of every response made
+with it. Workers ask the pool for a token and get one picked in proportion
+to the budget it has left, so N tokens are drained evenly and sustained
+throughput approaches N x 5000 requests/hour.
+
+When no token has budget left, a worker does not sleep straight away:
+it first drains the idle-work queue (DB-only jobs, or requests that are
+expected to answer 304 and therefore cost no quota), and only sleeps once
+that queue is empty.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+# A token is treated as exhausted below this many remaining requests
+LOW_WATERMARK = 5
+# Assumed budget for a token we haven't seen a response for yet
+DEFAULT_BUDGET = 5000
+# Longest single sleep while waiting for a reset => re-check idle work after
+MAX_SLEEP_SLICE = 60
+
+_lock = threading.Lock()
+_tokens = []
+_idle_work = deque()
+# Global per-run request budget shared by all workers (None => unlimited)
+_request_budget = None
+_requests_made = 0
+
+class RequestBudgetExhausted(Exception):
+    """
+    Raised from the rate-limit handler once the per-run request budget is spent.
+    """
+    pass
+
+def init_token_pool(tokens):
+    """
+    (Re)initialize the pool with the configured token strings.
+    """
+    global _tokens
+    with _lock:
+        _tokens = [
+            {"token": t, "remaining": None, "reset": None, "used": 0}
+            for t in tokens
+        ]
+        _idle_work.clear()
+    logging.info("Token pool => %d token(s) loaded", len(_tokens))
+
+def set_request_budget(max_requests):
+    """
+    Cap the total requests made by all workers in this run. 0/None => unlimited.
+    """
+    global _request_budget, _requests_made
+    with _lock:
+        _request_budget = max_requests or None
+        _requests_made = 0
+
+def request_budget_left():
+    with _lock:
+        if _request_budget is None:
+            return True
+        return _requests_made < _request_budget
+
+def _count_request():
+    global _requests_made
+    with _lock:
+        _requests_made += 1
+        if _request_budget is not None and _requests_made > _request_budget:
+            return False
+    return True
+
+def token_count():
+    return len(_tokens)
+
+def auth_header(token_idx):
+    return f"token {_tokens[token_idx]['token']}"
+
+def token_index_for_response(resp):
+    """
+    Map a response back to the pool index of the token that made it,
+    using the Authorization header of the request that was sent.
+    """
+    req = getattr(resp, "request", None)
+    if req is None:
+        return None
+    auth = req.headers.get("Authorization", "")
+    for idx, info in enumerate(_tokens):
+        if auth == f"token {info['token']}":
+            return idx
+    return None
+
+def update_from_response(resp):
+    """
+    Record remaining/reset for the token that made this request.
+    Return the token index, or None if it isn't one of ours.
+    """
+    idx = token_index_for_response(resp)
+    if idx is None:
+        return None
+    resource = resp.headers.get("X-RateLimit-Resource", "core")
+    if resource != "core":
+        # graphql/search have their own budgets => don't mix them into the REST one
+        with _lock:
+            _tokens[idx]["used"] += 1
+        return idx
+    rem_str = resp.headers.get("X-RateLimit-Remaining", "")
+    rst_str = resp.headers.get("X-RateLimit-Reset", "")
+    with _lock:
+        info = _tokens[idx]
+        info["used"] += 1
+        try:
+            info["remaining"] = int(rem_str)
+        except ValueError:
+            pass
+        try:
+            info["reset"] = int(rst_str)
+        except ValueError:
+            pass
+        if resp.status_code in (403, 429) and info["remaining"] is None:
+            # secondary limit without headers => treat as empty until reset
+            info["remaining"] = 0
+    return idx
+
+def _effective_budget(info, now_ts):
+    rem = info["remaining"]
+    if rem is None:
+        return DEFAULT_BUDGET
+    if info["reset"] and info["reset"] <= now_ts:
+        # window rolled over since we last saw it
+        return DEFAULT_BUDGET
+    return rem
+
+def pick_token_index(exclude=None):
+    """
+    Pick a token with probability proportional to its remaining budget.
+    Return None when every token is below LOW_WATERMARK.
+    """
+    now_ts = int(time.time())
+    with _lock:
+        candidates = []
+        weights = []
+        for idx, info in enumerate(_tokens):
+            if idx == exclude and len(_tokens) > 1:
+                continue
+            budget = _effective_budget(info, now_ts)
+            if budget >= LOW_WATERMARK:
+                candidates.append(idx)
+                weights.append(budget)
+    if not candidates:
+        return None
+    return random.choices(candidates, weights=weights, k=1)[0]
+
+def has_budget(token_idx):
+    now_ts = int(time.time())
+    with _lock:
+        return _effective_budget(_tokens[token_idx], now_ts) >= LOW_WATERMARK
+
+def earliest_reset():
+    with _lock:
+        resets = [info["reset"] for info in _tokens if info["reset"]]
+    if not resets:
+        return None
+    return min(resets)
+
+def assign_token(session, exclude=None):
+    """
+    Point this session at a token picked from the pool.
+    Blocks (running idle work first) until some token has budget.
+    """
+    if not _tokens:
+        return None
+    while True:
+        idx = pick_token_index(exclude)
+        if idx is not None:
+            session.headers["Authorization"] = auth_header(idx)
+            return idx
+        wait_for_budget()
+
+def submit_idle_work(func, *args, **kwargs):
+    """
+    Queue a job that costs no API quota (DB-only, or conditional requests
+    answered by 304). Workers without budget run these instead of sleeping.
+    """
+    _idle_work.append((func, args, kwargs))
+
+def run_idle_work(max_jobs=None):
+    """
+    Run queued idle jobs; return how many ran.
+    """
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        try:
+            func, args, kwargs = _idle_work.popleft()
+        except IndexError:
+            break
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logging.exception("Idle job %s failed => continue", getattr(func, "__name__", func))
+        ran += 1
+    return ran
+
+def wait_for_budget():
+    """
+    Called when no token has budget. Do one idle job if there is one,
+    otherwise sleep towards the earliest reset in short slices so newly
+    queued idle work is still picked up.
+    """
+    if run_idle_work(max_jobs=1):
+        return
+    now_ts = int(time.time())
+    rst = earliest_reset()
+    if rst is None:
+        delta = MAX_SLEEP_SLICE
+        logging.warning("Token pool => no budget & no reset known => sleep %ds", delta)
+    else:
+        delta = max(1, min(MAX_SLEEP_SLICE, rst - now_ts + 30))
+        logging.warning("Token pool => all tokens exhausted => earliest reset at %d (now=%d) => sleep %ds",
+                        rst, now_ts, delta)
+    time.sleep(delta)
+
+def make_rate_limit_handler(session):
+    """
+    Build the handle_rate_limit_func passed to the fetchers for one worker
+    session. After each response it records the token's budget and, if that
+    token is nearly spent or was rejected, moves the session to another one.
+    """
+    def handle_rate_limit_func(resp):
+        if not _count_request():
+            raise RequestBudgetExhausted(f"run request budget of {_request_budget} spent")
+        if not _tokens:
+            return
+        idx = update_from_response(resp)
+        if idx is None:
+            return
+        rejected = resp.status_code in (403, 429)
+        if rejected:
+            logging.warning("HTTP %d => token idx %d rejected => reassign", resp.status_code, idx)
+        if rejected or not has_budget(idx):
+            new_idx = assign_token(session, exclude=idx)
+            if new_idx != idx:
+                logging.info("Switched worker token from idx %d to %d", idx, new_idx)
+    return handle_rate_limit_func
+
+def budget_snapshot():
+    """
+    Return [(idx, remaining, reset, used)] for logging/summary.
+    """
+    with _lock:
+        return [(idx, info["remaining"], info["reset"], info["used"])
+                for idx, info in enumerate(_tokens)]
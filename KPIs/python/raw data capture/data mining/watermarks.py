@@ -0,0 +1,65 @@
+# watermarks.py
+"""
+Per-repo watermarks => one grouped query per driver instead of a
+SELECT MAX(...) per issue / PR / comment before every API call.
+
+  load_last_event_ids() => {number: newest known event id}
+                           GREATEST(parent.last_event_id, MAX(event_id)) so rows
+                           committed before their watermark was written back
+                           still count (no re-insert after a crash)
+  load_max_ids()        => {key: MAX(id_col)} grouped by key_cols
+
+last_event_id itself is written back in batches (flush_last_event_ids) at the
+driver checkpoints and at the end of the driver.
+"""
+
+WRITEBACK_CHUNK = 500
+
+def load_max_ids(conn, table, key_cols, id_col, repo_name):
+    """
+    {key: MAX(id_col)} for the repo. key => the value of key_cols[0], or a tuple
+    when several key columns are given.
+    """
+    cols = ", ".join(key_cols)
+    c = conn.cursor()
+    c.execute(f"""
+      SELECT {cols}, MAX({id_col}) FROM {table}
+      WHERE repo_name=%s GROUP BY {cols}
+    """, (repo_name,))
+    marks = {}
+    for row in c.fetchall():
+        key = row[0] if len(key_cols) == 1 else tuple(row[:-1])
+        marks[key] = row[-1] or 0
+    c.close()
+    return marks
+
+def load_last_event_ids(conn, repo_name, parent_table, number_col, events_table):
+    c = conn.cursor()
+    c.execute(f"SELECT {number_col}, last_event_id FROM {parent_table} WHERE repo_name=%s",
+              (repo_name,))
+    marks = {num: (eid or 0) for (num, eid) in c.fetchall()}
+    c.close()
+    for (num, max_eid) in load_max_ids(conn, events_table, (number_col,), "event_id", repo_name).items():
+        if max_eid > marks.get(num, 0):
+            marks[num] = max_eid
+    return marks
+
+def flush_last_event_ids(conn, parent_table, number_col, repo_name, pending):
+    """
+    pending => {number: new last_event_id}; written with one UPDATE per chunk,
+    then cleared. Caller commits.
+    """
+    items = sorted(pending.items())
+    c = conn.cursor()
+    for i in range(0, len(items), WRITEBACK_CHUNK):
+        chunk = items[i:i + WRITEBACK_CHUNK]
+        cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+        in_list = ",".join(["%s"] * len(chunk))
+        params = [v for pair in chunk for v in pair] + [repo_name] + [num for (num, _eid) in chunk]
+        c.execute(f"""
+          UPDATE {parent_table}
+          SET last_event_id=CASE {number_col} {cases} ELSE last_event_id END
+          WHERE repo_name=%s AND {number_col} IN ({in_list})
+        """, params)
+    c.close()
+    pending.clear()
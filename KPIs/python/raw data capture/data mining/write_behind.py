@@ -0,0 +1,272 @@
+# write_behind.py
+"""
+Write-behind ingest => HTTP latency and MySQL latency overlap instead of adding up.
+
+The fetchers no longer insert and commit a page before asking for the next
+one. They collect the page's writes as deferred calls and submit them:
+
+    ops=[]
+    defer(ops, insert_comment_record, repo_name, issue_num, cid, cdt, cmt, commit=False)
+    defer(ops, save_checkpoint, repo_name, "comments", issue_num, page, highest_cid)
+    submit(conn, ops)
+
+Every deferred call is fn(conn, *args, **kwargs) and gets the connection of
+whoever runs it.
+
+With the writer started (start_write_behind), submit() puts the page on a
+bounded queue and returns at once. One writer thread with its own DB
+connection runs the calls strictly in queue order and commits every
+commit_every_ops calls / commit_interval seconds, so pages of all workers
+and resources share large transactions. A page's checkpoint / watermark /
+completed mark is deferred after its rows and can only commit together with
+or after them.
+
+barrier(conn) blocks until everything queued so far is committed; process_repo
+calls it before each stage because a stage reads what the previous one wrote.
+
+Without the writer, submit() runs the calls inline and commits => the old
+insert-then-commit behaviour.
+
+Row coalescing => the insert_* helpers are @batched and hand their row to
+upsert_row(). While a page runs (_run_ops) the rows wait per table and go
+out as one multi-row INSERT ... ON DUPLICATE KEY UPDATE per table, before
+the next call that is not @batched (checkpoint, flag, update) => statement
+order per page is unchanged. repo_stats counts a row as new when its unique
+key (ROW_KEYS) was not stored before the statement and not seen earlier in
+the batch; one SELECT per batch replaces the per-row rowcount.
+
+A failed write stops the writer: it rolls back, drops whatever is still
+queued and every later submit() / barrier() raises WriteBehindError, so a
+repo fails instead of checkpointing past rows that never landed.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from db import connect_db
+from bulk_load import BULK_TABLES, commit_spooled
+from fetch_metrics import current_key, use_key
+from repo_stats import note_row, note_event_flag
+
+_queue = None
+_thread = None
+_error = None
+_commit_every_ops = 2000
+_commit_interval = 2.0
+_STOP = object()
+# rows per multi-row statement
+_batch_rows = 500
+# rows queued by upsert_row() while the calling thread runs a page
+_rows = threading.local()
+
+# insert table => unique key columns (None => no unique key, every row is new)
+ROW_KEYS = {
+    "watchers": ("repo_name", "user_login"),
+    "forks": ("repo_name", "fork_id"),
+    "stars": ("repo_name", "user_login", "starred_at"),
+    "issues": None,
+    "pulls": None,
+    "issue_events": ("repo_name", "issue_number", "event_id"),
+    "pull_events": ("repo_name", "pull_number", "event_id"),
+    "issue_comments": ("repo_name", "issue_number", "comment_id"),
+    "issue_reactions": ("repo_name", "issue_number", "reaction_id"),
+    "comment_reactions": ("repo_name", "issue_number", "comment_id", "reaction_id")
+}
+
+class WriteBehindError(Exception):
+    """
+    Raised to the fetchers once the writer thread has failed.
+    """
+    pass
+
+def defer(ops, fn, *args, **kwargs):
+    ops.append((fn, args, kwargs))
+
+def batched(fn):
+    """
+    Mark an insert helper whose upsert_row() rows may be coalesced by _run_ops.
+    """
+    fn.batched = True
+    return fn
+
+def upsert_row(conn, table, row, repo_name, dt=None, event_flag=None, commit=True):
+    """
+    Insert-or-update one row of table (columns from BULK_TABLES). Inside _run_ops
+    the row waits for the next flush, otherwise it is written at once.
+    dt => its date for repo_stats; event_flag => (number, event) for note_event_flag.
+    """
+    pending = getattr(_rows, "pending", None)
+    entry = (row, repo_name, dt, event_flag)
+    if pending is None:
+        _write_rows(conn, table, [entry])
+    else:
+        pending.setdefault(table, []).append(entry)
+    if commit:
+        flush_rows(conn)
+        conn.commit()
+
+def flush_rows(conn):
+    """
+    Write the rows queued by upsert_row() => one statement per table and chunk. Caller commits.
+    """
+    pending = getattr(_rows, "pending", None)
+    if not pending:
+        return
+    for table, entries in pending.items():
+        for i in range(0, len(entries), _batch_rows):
+            _write_rows(conn, table, entries[i:i + _batch_rows])
+    pending.clear()
+
+def _write_rows(conn, table, entries):
+    (cols, update_cols) = BULK_TABLES[table]
+    key = ROW_KEYS[table]
+    c = conn.cursor()
+    new = entries
+    if key:
+        idx = [cols.index(k) for k in key]
+        keys = {tuple(row[i] for i in idx) for (row, _repo, _dt, _flag) in entries}
+        tuple_sql = "(" + ", ".join(["%s"] * len(key)) + ")"
+        c.execute(f"""
+          SELECT {", ".join(key)} FROM {table}
+          WHERE ({", ".join(key)}) IN ({", ".join([tuple_sql] * len(keys))})
+        """, [v for k in keys for v in k])
+        seen = set(c.fetchall())
+        new = []
+        for entry in entries:
+            k = tuple(entry[0][i] for i in idx)
+            if k not in seen:
+                seen.add(k)
+                new.append(entry)
+    row_sql = "(" + ", ".join(["%s"] * len(cols)) + ")"
+    c.execute(f"""
+    INSERT INTO {table} ({", ".join(cols)})
+    VALUES {", ".join([row_sql] * len(entries))}
+    ON DUPLICATE KEY UPDATE {", ".join(f"{col}=VALUES({col})" for col in update_cols)}
+    """, [v for (row, _repo, _dt, _flag) in entries for v in row])
+    c.close()
+    for (row, repo_name, dt, event_flag) in new:
+        note_row(repo_name, table, dt)
+        if event_flag:
+            note_event_flag(conn, repo_name, table, *event_flag)
+
+def _run_ops(conn, ops):
+    """
+    Run one page of deferred calls in order; rows of consecutive @batched calls
+    are written together before the next other call.
+    """
+    _rows.pending = {}
+    try:
+        for (fn, args, kwargs) in ops:
+            if not getattr(fn, "batched", False):
+                flush_rows(conn)
+            fn(conn, *args, **kwargs)
+        flush_rows(conn)
+    finally:
+        _rows.pending = None
+
+def submit(conn, ops):
+    """
+    Hand one page of deferred writes to the writer (or run them inline).
+    ops is left empty so the caller can reuse the list.
+    """
+    page_ops = list(ops)
+    del ops[:]
+    if not page_ops:
+        return
+    if _queue is None:
+        _run_ops(conn, page_ops)
+        commit_spooled(conn)
+        return
+    if _error is not None:
+        raise WriteBehindError(f"writer failed => {_error}")
+    # rows are attributed to the endpoint of the page they came from (fetch_metrics)
+    _queue.put((current_key(), page_ops))
+
+def barrier(conn):
+    """
+    Block until everything submitted so far is committed, then end conn's
+    read snapshot so it sees the writer's rows.
+    """
+    if _queue is None:
+        commit_spooled(conn)
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait()
+    if _error is not None:
+        raise WriteBehindError(f"writer failed => {_error}")
+    conn.commit()
+
+def _fail(conn, e):
+    global _error
+    logging.error("Write-behind => write failed => rolling back => dropping queued pages => %s", e)
+    _error = e
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+def _writer_loop(conn):
+    pending = 0
+    last_commit = time.monotonic()
+    while True:
+        try:
+            item = _queue.get(timeout=_commit_interval)
+        except queue.Empty:
+            item = None
+        flush = item is _STOP or isinstance(item, threading.Event)
+        if item is not None and not flush and _error is None:
+            (key, page_ops) = item
+            use_key(key)
+            try:
+                _run_ops(conn, page_ops)
+                pending += len(page_ops)
+            except Exception as e:
+                _fail(conn, e)
+                pending = 0
+        if pending and (flush or pending >= _commit_every_ops
+                        or time.monotonic() - last_commit >= _commit_interval):
+            try:
+                commit_spooled(conn)
+            except Exception as e:
+                _fail(conn, e)
+            pending = 0
+            last_commit = time.monotonic()
+        if item is _STOP:
+            break
+        if flush:
+            item.set()
+    conn.close()
+
+def start_write_behind(cfg):
+    """
+    Start the writer thread (own DB connection) if cfg["write_behind"] is on.
+    """
+    global _queue, _thread, _error, _commit_every_ops, _commit_interval
+    if not cfg["write_behind"]:
+        return
+    _commit_every_ops = max(1, int(cfg["write_behind_commit_every"]))
+    _commit_interval = float(cfg["write_behind_commit_seconds"])
+    _error = None
+    _queue = queue.Queue(maxsize=max(1, int(cfg["write_behind_queue_pages"])))
+    conn = connect_db(cfg, create_db_if_missing=False)
+    _thread = threading.Thread(target=_writer_loop, args=(conn,), name="ingest-writer", daemon=True)
+    _thread.start()
+    logging.info("Write-behind => on => queue=%d pages => commit every %d writes / %.1fs",
+                 _queue.maxsize, _commit_every_ops, _commit_interval)
+
+def stop_write_behind():
+    """
+    Commit what is left and stop the writer.
+    """
+    global _queue, _thread
+    if _thread is None:
+        return
+    _queue.put(_STOP)
+    _thread.join()
+    _thread = None
+    _queue = None
+    if _error is not None:
+        logging.error("Write-behind => stopped after a failed write => %s", _error)
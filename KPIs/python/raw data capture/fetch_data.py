@@ -3,7 +3,10 @@
 
 import os
 import re
+import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import mysql.connector
 from datetime import datetime, timedelta
 from time import sleep
@@ -15,17 +18,19 @@ DB_HOST = "localhost"
 DB_USER = "root"
 DB_PASS = "root"
 
-EPHEMERAL_DB_PREFIX = "my_kpis_run_"
 METADATA_DB = "my_kpis_metadata"
+STAGING_DB = "my_kpis_staging"   # current run's rows, plain tables
+HISTORY_DB = "my_kpis_history"   # every run, one range partition per run_id
+RUN_TABLES = ("forks", "stars", "issues", "pulls")
 
 # If we see 5 consecutive "no new inserts" pages, we break
 MAX_EMPTY_PAGES = 5
 
 TOKENS = []
-CURRENT_TOKEN_INDEX = 0
-MAX_LIMIT_BUFFER = 50  # If near rate limit, switch token
+MAX_LIMIT_BUFFER = 50  # Points kept in reserve on every token
 
 GITHUB_GRAPHQL_ENDPOINT = "https://api.github.com/graphql"
+GRAPHQL_POOL_SIZE = 8  # keep-alive connections kept by the shared session
 
 ################################
 # LOAD TOKENS
@@ -51,20 +56,25 @@ def load_tokens():
             i += 1
         TOKENS = env_tokens
 
+    init_token_budgets()
     if TOKENS:
         print(f"Loaded {len(TOKENS)} GitHub token(s) for GraphQL.")
     else:
         print("No GraphQL tokens found => unauthenticated => extremely limited rate limit.")
 
-def get_session():
+def get_session(pool_size=GRAPHQL_POOL_SIZE):
     """
     Returns a requests.Session for GraphQL. We'll manually attach tokens in each request
-    because we might switch tokens as needed.
+    because we might switch tokens as needed. Create it once per run and pass it
+    around => the keep-alive connection to the endpoint is reused. pool_size => at
+    least the number of threads sharing it.
     """
-    return requests.Session()
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, GRAPHQL_POOL_SIZE)))
+    return session
 
 ################################
-# DB: METADATA & EPHEMERAL
+# DB: METADATA & RUN STORE
 ################################
 def connect_db(database=None):
     return mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASS, database=database)
@@ -86,6 +96,29 @@ def init_metadata_db():
             PRIMARY KEY (owner, repo)
         ) ENGINE=InnoDB
     """)
+    # last_date per connection => a finished connection moves on even if another one failed
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS repo_connection_dates (
+            owner VARCHAR(255) NOT NULL,
+            repo  VARCHAR(255) NOT NULL,
+            connection VARCHAR(32) NOT NULL,
+            last_date DATETIME NOT NULL,
+            run_id INT,
+            PRIMARY KEY (owner, repo, connection)
+        ) ENGINE=InnoDB
+    """)
+    # Descending connections (stars/forks) => where an interrupted run stopped
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS repo_cursors (
+            owner VARCHAR(255) NOT NULL,
+            repo  VARCHAR(255) NOT NULL,
+            connection VARCHAR(32) NOT NULL,
+            cursor_val VARCHAR(255) NOT NULL,
+            upper_date DATETIME NOT NULL,
+            updated_at DATETIME,
+            PRIMARY KEY (owner, repo, connection)
+        ) ENGINE=InnoDB
+    """)
     conn.commit()
     c.close()
     return conn
@@ -120,44 +153,113 @@ def update_repo_last_date(mconn, owner, repo, new_dt):
     mconn.commit()
     c.close()
 
-def create_ephemeral_db():
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    db_name = f"{EPHEMERAL_DB_PREFIX}{timestamp}"
+def get_connection_start_dates(mconn, owner, repo, default_dt):
+    """
+    {connection: last_date}; connections never finished => default_dt (repo_start_dates).
+    """
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("SELECT connection, last_date FROM repo_connection_dates WHERE owner=%s AND repo=%s", (owner, repo))
+    found = dict(c.fetchall())
+    c.close()
+    return {name: found.get(name, default_dt) for name in CONNECTIONS}
 
-    temp_conn = connect_db()
-    c = temp_conn.cursor()
-    c.execute(f"CREATE DATABASE {db_name}")
-    temp_conn.commit()
+def update_connection_last_date(mconn, owner, repo, connection, new_dt, run_id):
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("""
+        INSERT INTO repo_connection_dates (owner, repo, connection, last_date, run_id)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+          last_date=GREATEST(last_date, VALUES(last_date)),
+          run_id=VALUES(run_id)
+    """, (owner, repo, connection, new_dt, run_id))
+    mconn.commit()
     c.close()
-    temp_conn.close()
-    print(f"Created ephemeral DB: {db_name}")
 
-    conn = connect_db(database=db_name)
-    return conn, db_name
+def get_repo_cursor(mconn, owner, repo, connection):
+    """
+    (cursor_val, upper_date) left by an interrupted descending fetch, or None.
+    """
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("SELECT cursor_val, upper_date FROM repo_cursors WHERE owner=%s AND repo=%s AND connection=%s",
+              (owner, repo, connection))
+    row = c.fetchone()
+    c.close()
+    return row
+
+def save_repo_cursor(mconn, owner, repo, connection, cursor_val, upper_dt):
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("""
+        INSERT INTO repo_cursors (owner, repo, connection, cursor_val, upper_date, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+          cursor_val=VALUES(cursor_val),
+          upper_date=VALUES(upper_date),
+          updated_at=VALUES(updated_at)
+    """, (owner, repo, connection, cursor_val, upper_dt, datetime.utcnow()))
+    mconn.commit()
+    c.close()
+
+def clear_repo_cursor(mconn, owner, repo, connection):
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("DELETE FROM repo_cursors WHERE owner=%s AND repo=%s AND connection=%s", (owner, repo, connection))
+    mconn.commit()
+    c.close()
+
+#############################
+# RUN STORE => persistent, one partition per run
+#############################
+# Every run gets a run_id (kpi_runs in the metadata DB). Its rows are inserted into
+# plain staging tables (STAGING_DB, run_id column filled by the insert helpers) and
+# at the end swapped into partition p<run_id> of the history tables (HISTORY_DB,
+# PARTITION BY RANGE (run_id)) with ALTER TABLE ... EXCHANGE PARTITION => no row
+# copy, and all runs stay queryable in one database. drop_run() removes one run
+# instantly with DROP PARTITION.
+#
+# Runs are incremental: each connection starts after its own last_date
+# (repo_connection_dates, exclusive) and only a finished connection moves it.
+# What an unfinished connection staged is kept only if the next run will not
+# read it again:
+#   - stars/forks (newest first) => kept, the next run resumes from the saved
+#     cursor (repo_cursors) below what it already has
+#   - issues/pulls (updated since) => dropped from staging, re-read next run
+# => stars and forks appear once in history; an issue/PR appears once per run
+# in which it was updated (one row per version).
+RUN_ID = None
 
 def create_tables(conn):
+    """
+    The four run tables in conn's current database (no-op if they exist).
+    """
     c = conn.cursor()
 
     c.execute("""
-    CREATE TABLE forks (
+    CREATE TABLE IF NOT EXISTS forks (
+        run_id INT NOT NULL,
         repo_name VARCHAR(255) NOT NULL,
         creator_login VARCHAR(255),
         forked_at DATETIME NOT NULL,
-        PRIMARY KEY (repo_name, forked_at, creator_login)
+        PRIMARY KEY (run_id, repo_name, forked_at, creator_login)
     ) ENGINE=InnoDB
     """)
 
     c.execute("""
-    CREATE TABLE stars (
+    CREATE TABLE IF NOT EXISTS stars (
+        run_id INT NOT NULL,
         repo_name VARCHAR(255) NOT NULL,
         user_login VARCHAR(255),
         starred_at DATETIME NOT NULL,
-        PRIMARY KEY (repo_name, starred_at, user_login)
+        PRIMARY KEY (run_id, repo_name, starred_at, user_login)
     ) ENGINE=InnoDB
     """)
 
     c.execute("""
-    CREATE TABLE issues (
+    CREATE TABLE IF NOT EXISTS issues (
+        run_id INT NOT NULL,
         repo_name VARCHAR(255) NOT NULL,
         issue_number INT NOT NULL,
         created_at DATETIME NOT NULL,
@@ -165,12 +267,13 @@ def create_tables(conn):
         updated_at DATETIME NOT NULL,
         creator_login VARCHAR(255),
         title TEXT,
-        PRIMARY KEY (repo_name, issue_number, created_at)
+        PRIMARY KEY (run_id, repo_name, issue_number, created_at)
     ) ENGINE=InnoDB
     """)
 
     c.execute("""
-    CREATE TABLE pulls (
+    CREATE TABLE IF NOT EXISTS pulls (
+        run_id INT NOT NULL,
         repo_name VARCHAR(255) NOT NULL,
         pr_number INT NOT NULL,
         created_at DATETIME NOT NULL,
@@ -178,36 +281,262 @@ def create_tables(conn):
         updated_at DATETIME NOT NULL,
         creator_login VARCHAR(255),
         title TEXT,
-        PRIMARY KEY (repo_name, pr_number, created_at)
+        PRIMARY KEY (run_id, repo_name, pr_number, created_at)
     ) ENGINE=InnoDB
     """)
 
     conn.commit()
     c.close()
-    print("Created ephemeral tables in the ephemeral DB.")
+
+def init_history_db(mconn):
+    """
+    Create the staging and partitioned history databases/tables and kpi_runs.
+    """
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_runs (
+            run_id INT AUTO_INCREMENT PRIMARY KEY,
+            started_at DATETIME NOT NULL,
+            finished_at DATETIME,
+            rows_loaded BIGINT
+        ) ENGINE=InnoDB
+    """)
+    mconn.commit()
+    c.close()
+
+    conn = connect_db()
+    c = conn.cursor()
+    for db_name in (STAGING_DB, HISTORY_DB):
+        c.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
+    c.execute(f"USE {STAGING_DB}")
+    create_tables(conn)
+    for t in RUN_TABLES:
+        c.execute(f"CREATE TABLE IF NOT EXISTS {HISTORY_DB}.{t} LIKE {STAGING_DB}.{t}")
+        c.execute("""
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s AND PARTITION_NAME IS NOT NULL
+        """, (HISTORY_DB, t))
+        if not c.fetchone()[0]:
+            c.execute(f"ALTER TABLE {HISTORY_DB}.{t} PARTITION BY RANGE (run_id) (PARTITION p0 VALUES LESS THAN (1))")
+    conn.commit()
+    c.close()
+    conn.close()
+
+def begin_run(mconn):
+    """
+    Publish what an interrupted run left in staging, then start a new run.
+    Returns (staging connection, run_id).
+    """
+    global RUN_ID
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("SELECT run_id FROM kpi_runs WHERE finished_at IS NULL ORDER BY run_id")
+    unfinished = [row[0] for row in c.fetchall()]
+    c.close()
+    for run_id in unfinished:
+        # its finished connections already moved last_date => their rows must not be lost
+        print(f"Run {run_id} did not finish => publishing what it staged")
+        discard_unfinished_rows(run_id)
+        publish_run(mconn, run_id)
+
+    c = mconn.cursor()
+    c.execute("INSERT INTO kpi_runs (started_at) VALUES (%s)", (datetime.utcnow(),))
+    RUN_ID = c.lastrowid
+    mconn.commit()
+    c.close()
+    print(f"Run {RUN_ID} => staging in {STAGING_DB}, history in {HISTORY_DB}")
+    return connect_db(database=STAGING_DB), RUN_ID
+
+def discard_staged_rows(run_conn, repo_name, tables):
+    """
+    Drop this run's staged rows of repo_name from tables (unfinished connections).
+    """
+    c = run_conn.cursor()
+    for t in tables:
+        c.execute(f"DELETE FROM {t} WHERE run_id=%s AND repo_name=%s", (RUN_ID, repo_name))
+    run_conn.commit()
+    c.close()
+
+def discard_unfinished_rows(run_id):
+    """
+    Crashed run => drop staged issue/pull rows of every repo whose connection did
+    not finish in that run (its last_date did not move, the next run reads them again).
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    for name, spec in CONNECTIONS.items():
+        if spec["descending"]:
+            continue
+        c.execute(f"""
+            DELETE s FROM {STAGING_DB}.{spec['table']} s
+            WHERE s.run_id=%s AND NOT EXISTS (
+              SELECT 1 FROM {METADATA_DB}.repo_connection_dates d
+              WHERE CONCAT(d.owner, '/', d.repo)=s.repo_name AND d.connection=%s AND d.run_id=s.run_id)
+        """, (run_id, name))
+        if c.rowcount:
+            print(f"Run {run_id} => {spec['table']} => {c.rowcount} row(s) of unfinished repos dropped")
+    conn.commit()
+    c.close()
+    conn.close()
+
+def partition_exists(c, table, partition_name):
+    c.execute("""
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s AND PARTITION_NAME=%s
+    """, (HISTORY_DB, table, partition_name))
+    return c.fetchone()[0] > 0
+
+def publish_run(mconn, run_id):
+    """
+    Swap the staged rows into partition p<run_id> of every history table.
+    Staging is left empty (it gets the new partition's empty contents).
+    Safe to retry after a crash half way => a table whose partition already holds
+    rows (swapped by the earlier attempt) or whose staging is empty is skipped;
+    a second swap would move the run's rows back into staging.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    rows_loaded = 0
+    for t in RUN_TABLES:
+        partition = f"p{run_id}"
+        if not partition_exists(c, t, partition):
+            c.execute(f"ALTER TABLE {HISTORY_DB}.{t} ADD PARTITION (PARTITION {partition} VALUES LESS THAN ({run_id + 1}))")
+        c.execute(f"SELECT COUNT(*) FROM {HISTORY_DB}.{t} PARTITION ({partition})")
+        published = c.fetchone()[0]
+        c.execute(f"SELECT COUNT(*), COALESCE(SUM(run_id<>%s),0) FROM {STAGING_DB}.{t}", (run_id,))
+        (staged, foreign) = c.fetchone()
+        if foreign:
+            raise RuntimeError(f"{STAGING_DB}.{t} holds {foreign} row(s) of other runs => not publishing run {run_id}")
+        if published and staged:
+            raise RuntimeError(f"{STAGING_DB}.{t} and {HISTORY_DB}.{t} {partition} both hold run {run_id} rows")
+        if published or not staged:
+            print(f"Run {run_id} => {t} => already published or nothing staged => skip")
+        else:
+            c.execute(f"ALTER TABLE {HISTORY_DB}.{t} EXCHANGE PARTITION {partition} WITH TABLE {STAGING_DB}.{t}")
+            print(f"Run {run_id} => {t} => {staged} row(s) => {HISTORY_DB}.{t} partition {partition}")
+        rows_loaded += published + staged
+    c.close()
+    conn.close()
+
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("UPDATE kpi_runs SET finished_at=%s, rows_loaded=%s WHERE run_id=%s",
+              (datetime.utcnow(), rows_loaded, run_id))
+    mconn.commit()
+    c.close()
+
+def drop_run(mconn, run_id):
+    """
+    Remove one run's rows from history => DROP PARTITION, no row deletes.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    for t in RUN_TABLES:
+        if partition_exists(c, t, f"p{run_id}"):
+            c.execute(f"ALTER TABLE {HISTORY_DB}.{t} DROP PARTITION p{run_id}")
+    c.close()
+    conn.close()
+
+    c = mconn.cursor()
+    c.execute(f"USE {METADATA_DB}")
+    c.execute("DELETE FROM kpi_runs WHERE run_id=%s", (run_id,))
+    mconn.commit()
+    c.close()
+    print(f"Run {run_id} dropped from {HISTORY_DB}")
 
 ################################
-# Token Switching & Rate Limits
+# Token Budgets & Rate Limits
 ################################
-def maybe_switch_token_if_needed(resp):
+# Every query asks for rateLimit { cost remaining resetAt } => per token we know the
+# points left and when they come back. Each request takes the token with the most
+# points left (minus what in-flight requests reserved); when no token can pay for the
+# next query plus MAX_LIMIT_BUFFER, the caller sleeps until the earliest reset instead
+# of failing. Thread-safe => concurrent repo fetches spread over the tokens.
+TOKEN_BUDGETS = []
+BUDGET_LOCK = threading.Lock()
+
+GRAPHQL_MAX_RETRIES = 6
+MIN_PAGE_SIZE = 10  # smallest page after halving on server timeouts (502/504)
+
+def init_token_budgets():
+    global TOKEN_BUDGETS
+    with BUDGET_LOCK:
+        TOKEN_BUDGETS = [{"remaining": None, "reset_at": None, "reserved": 0, "used": 0} for _ in TOKENS]
+
+def acquire_token(expected_cost):
     """
-    GraphQL does not return X-RateLimit-Remaining for every request, but sometimes it does.
-    If near the limit, we switch to another token if available.
+    Index of the token to use for a query costing expected_cost (None => no tokens).
+    Reserves the points until release_token(). Sleeps while every token is spent.
     """
-    global TOKENS, CURRENT_TOKEN_INDEX
     if not TOKENS:
+        return None
+    while True:
+        with BUDGET_LOCK:
+            now = datetime.utcnow()
+            best, best_left, wake_at = None, None, None
+            for idx, b in enumerate(TOKEN_BUDGETS):
+                if b["reset_at"] and now >= b["reset_at"]:
+                    # window rolled over => unknown again until the next response
+                    b["remaining"], b["reset_at"] = None, None
+                left = (b["remaining"] if b["remaining"] is not None else float("inf")) - b["reserved"]
+                if left >= expected_cost + MAX_LIMIT_BUFFER:
+                    if best is None or left > best_left:
+                        best, best_left = idx, left
+                elif b["reset_at"] and (wake_at is None or b["reset_at"] < wake_at):
+                    wake_at = b["reset_at"]
+            if best is not None:
+                TOKEN_BUDGETS[best]["reserved"] += expected_cost
+                return best
+        wait_s = max(1, int((wake_at - datetime.utcnow()).total_seconds()) + 1) if wake_at else 60
+        print(f"All {len(TOKENS)} GraphQL token(s) spent => sleeping {wait_s}s until the earliest reset")
+        sleep(wait_s)
+
+def release_token(idx, reserved, rate_limit=None, resp=None):
+    """
+    Drop the reservation and record what the response said about the token's budget
+    (rateLimit field first, X-RateLimit-* headers as fallback).
+    """
+    if idx is None:
         return
-
-    rem_str = resp.headers.get("X-RateLimit-Remaining")
-    if rem_str:
+    with BUDGET_LOCK:
+        b = TOKEN_BUDGETS[idx]
+        b["reserved"] = max(0, b["reserved"] - reserved)
+        if rate_limit:
+            b["remaining"] = rate_limit["remaining"]
+            b["reset_at"] = parse_gh_dt(rate_limit["resetAt"])
+            b["used"] += rate_limit["cost"]
+        elif resp is not None and resp.headers.get("X-RateLimit-Remaining"):
+            try:
+                b["remaining"] = int(resp.headers["X-RateLimit-Remaining"])
+                b["reset_at"] = datetime.utcfromtimestamp(int(resp.headers["X-RateLimit-Reset"]))
+            except (KeyError, ValueError):
+                pass
+
+def mark_token_spent(idx, resp):
+    """
+    Rate limited (HTTP 403/429 or a RATE_LIMITED error) => no points until the reset.
+    """
+    if idx is None:
+        return
+    reset_at = datetime.utcnow() + timedelta(seconds=60)
+    if resp is not None:
         try:
-            rem_val = int(rem_str)
-            if rem_val < MAX_LIMIT_BUFFER and len(TOKENS) > 1:
-                old = CURRENT_TOKEN_INDEX
-                CURRENT_TOKEN_INDEX = (CURRENT_TOKEN_INDEX + 1) % len(TOKENS)
-                print(f"Switching GraphQL token from {old} to {CURRENT_TOKEN_INDEX}, remaining={rem_val}")
+            if resp.headers.get("Retry-After"):
+                reset_at = datetime.utcnow() + timedelta(seconds=int(resp.headers["Retry-After"]))
+            elif resp.headers.get("X-RateLimit-Reset"):
+                reset_at = datetime.utcfromtimestamp(int(resp.headers["X-RateLimit-Reset"]))
         except ValueError:
             pass
+    with BUDGET_LOCK:
+        TOKEN_BUDGETS[idx]["remaining"] = 0
+        TOKEN_BUDGETS[idx]["reset_at"] = reset_at
+    print(f"GraphQL token {idx} rate limited => parked until {reset_at}")
+
+def print_token_budgets():
+    with BUDGET_LOCK:
+        for idx, b in enumerate(TOKEN_BUDGETS):
+            print(f"GraphQL token {idx} => used={b['used']} points => remaining={b['remaining']} => reset={b['reset_at']}")
 
 def check_graphql_errors(resp_json):
     """
@@ -218,34 +547,69 @@ def check_graphql_errors(resp_json):
         return True
     return False
 
-def do_graphql_post(session, query_str, variables):
+def is_rate_limited(resp_json):
+    return any(e.get("type") == "RATE_LIMITED" for e in resp_json.get("errors") or [])
+
+def do_graphql_post(session, query_str, variables, expected_cost=1, partial=False):
     """
-    Makes a POST to the GitHub GraphQL endpoint. Attaches the current token.
+    Makes a POST to the GitHub GraphQL endpoint with the token that has the most
+    budget left. Rate limits park the token and retry on another (or after the
+    reset); server timeouts (502/504) halve variables["pageSize"] and retry, so the
+    caller can read the page size that worked back from variables.
+    partial => errors that only concern some fields (each has a path) still
+    return the JSON, the failed fields are null in "data".
     Returns the parsed JSON or None if error.
     """
-    global TOKENS, CURRENT_TOKEN_INDEX
-    headers = {"Content-Type": "application/json"}
-    if TOKENS:
-        token = TOKENS[CURRENT_TOKEN_INDEX]
-        headers["Authorization"] = f"Bearer {token}"
-
-    resp = session.post(
-        GITHUB_GRAPHQL_ENDPOINT,
-        json={"query": query_str, "variables": variables},
-        headers=headers,
-        timeout=30
-    )
-    # Possibly switch token if near limit
-    maybe_switch_token_if_needed(resp)
-
-    if resp.status_code != 200:
-        print(f"GraphQL query failed, HTTP {resp.status_code}: {resp.text}")
-        return None
+    for attempt in range(1, GRAPHQL_MAX_RETRIES + 1):
+        idx = acquire_token(expected_cost)
+        headers = {"Content-Type": "application/json"}
+        if idx is not None:
+            headers["Authorization"] = f"Bearer {TOKENS[idx]}"
 
-    data = resp.json()
-    if check_graphql_errors(data):
-        return None
-    return data
+        try:
+            resp = session.post(
+                GITHUB_GRAPHQL_ENDPOINT,
+                json={"query": query_str, "variables": variables},
+                headers=headers,
+                timeout=30
+            )
+        except requests.RequestException as e:
+            release_token(idx, expected_cost)
+            print(f"GraphQL request error (attempt {attempt}/{GRAPHQL_MAX_RETRIES}) => {e}")
+            sleep(2 ** attempt)
+            continue
+
+        data = None
+        if resp.status_code == 200:
+            try:
+                data = resp.json()
+            except ValueError:
+                data = None
+        rate_limit = ((data or {}).get("data") or {}).get("rateLimit")
+        release_token(idx, expected_cost, rate_limit, resp)
+
+        if resp.status_code in (403, 429) or (data and is_rate_limited(data)):
+            mark_token_spent(idx, resp)
+            continue
+        if resp.status_code in (502, 504):
+            if variables.get("pageSize", 0) > MIN_PAGE_SIZE:
+                variables["pageSize"] = max(MIN_PAGE_SIZE, variables["pageSize"] // 2)
+            print(f"GraphQL HTTP {resp.status_code} (attempt {attempt}/{GRAPHQL_MAX_RETRIES}) => "
+                  f"retry with pageSize={variables.get('pageSize')}")
+            sleep(2 ** attempt)
+            continue
+        if resp.status_code != 200 or data is None:
+            print(f"GraphQL query failed, HTTP {resp.status_code}: {resp.text}")
+            return None
+
+        if check_graphql_errors(data):
+            if partial and data.get("data") and all(e.get("path") for e in data["errors"]):
+                return data
+            return None
+        return data
+
+    print(f"GraphQL query failed after {GRAPHQL_MAX_RETRIES} attempts => giving up.")
+    return None
 
 ################################
 # DB INSERT UTILS
@@ -254,8 +618,8 @@ def insert_forks(conn, repo_name, fork_rows):
     if not fork_rows:
         return 0
     c = conn.cursor()
-    sql = "INSERT IGNORE INTO forks (repo_name, creator_login, forked_at) VALUES (%s,%s,%s)"
-    data = [(repo_name, f["creator_login"], f["forked_at"]) for f in fork_rows]
+    sql = "INSERT IGNORE INTO forks (run_id, repo_name, creator_login, forked_at) VALUES (%s,%s,%s,%s)"
+    data = [(RUN_ID, repo_name, f["creator_login"], f["forked_at"]) for f in fork_rows]
     c.executemany(sql, data)
     conn.commit()
     inserted = c.rowcount
@@ -266,8 +630,8 @@ def insert_stars(conn, repo_name, star_rows):
     if not star_rows:
         return 0
     c = conn.cursor()
-    sql = "INSERT IGNORE INTO stars (repo_name, user_login, starred_at) VALUES (%s,%s,%s)"
-    data = [(repo_name, s["user_login"], s["starred_at"]) for s in star_rows]
+    sql = "INSERT IGNORE INTO stars (run_id, repo_name, user_login, starred_at) VALUES (%s,%s,%s,%s)"
+    data = [(RUN_ID, repo_name, s["user_login"], s["starred_at"]) for s in star_rows]
     c.executemany(sql, data)
     conn.commit()
     inserted = c.rowcount
@@ -280,11 +644,12 @@ def insert_issues(conn, repo_name, issue_rows):
     c = conn.cursor()
     sql = """
     INSERT IGNORE INTO issues (
-      repo_name, issue_number, created_at, closed_at, updated_at, creator_login, title
-    ) VALUES (%s,%s,%s,%s,%s,%s,%s)
+      run_id, repo_name, issue_number, created_at, closed_at, updated_at, creator_login, title
+    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
     """
     data = [
         (
+            RUN_ID,
             repo_name,
             i["issue_number"],
             i["created_at"],
@@ -307,11 +672,12 @@ def insert_pulls(conn, repo_name, pull_rows):
     c = conn.cursor()
     sql = """
     INSERT IGNORE INTO pulls (
-      repo_name, pr_number, created_at, merged_at, updated_at, creator_login, title
-    ) VALUES (%s,%s,%s,%s,%s,%s,%s)
+      run_id, repo_name, pr_number, created_at, merged_at, updated_at, creator_login, title
+    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
     """
     data = [
         (
+            RUN_ID,
             repo_name,
             p["pr_number"],
             p["created_at"],
@@ -332,448 +698,410 @@ def insert_pulls(conn, repo_name, pull_rows):
 # GRAPHQL QUERIES
 ################################
 
-#############################
-# FORKS => createdAt ASC
-#############################
-FORKS_QUERY = """
-query($owner:String!, $repo:String!, $pageSize:Int!, $after:String) {
-  repository(owner:$owner, name:$repo) {
-    forks(first:$pageSize, after:$after, orderBy:{field:CREATED_AT, direction:ASC}) {
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-      nodes {
-        owner {
-          login
-        }
-        createdAt
-      }
-    }
-  }
-}
-"""
-
-def fetch_forks_graphql(conn, owner, repo, start_dt, end_dt):
-    """
-    1) Page through forks (createdAt ascending).
-    2) If createdAt < start_dt => skip.
-    3) If createdAt > end_dt => break out.
-    4) Insert each chunk into DB.
-    5) Return total inserted, max date.
-
-    FIX: We use len(new_rows) == 0 to increment consecutive_empty
-         so we don't prematurely skip pages if insert_forks => 0
-         because they were duplicates.
-    """
-    repo_name = f"{owner}/{repo}"
-    session = get_session()
+# Nodes per connection per page (GraphQL maximum)
+GRAPHQL_PAGE_SIZE = 100
 
-    after_cursor = None
-    page_size = 50
-    total_inserted = 0
-    global_max_dt = start_dt
+# search returns at most this many results per query => the window slides past it
+SEARCH_RESULT_CAP = 1000
 
-    consecutive_empty = 0
+# Last rateLimit.cost seen per query shape (tuple of connections) => points reserved up front
+QUERY_COSTS = {}
 
-    while True:
-        variables = {
-            "owner": owner,
-            "repo": repo,
-            "pageSize": page_size,
-            "after": after_cursor
-        }
-        data = do_graphql_post(session, FORKS_QUERY, variables)
-        if not data:
-            print("GraphQL error or no data => done.")
-            break
-
-        forks_data = data["data"]["repository"]
-        if not forks_data or not forks_data["forks"]:
-            print("No forks data => done.")
-            break
-
-        page_info = forks_data["forks"]["pageInfo"]
-        nodes = forks_data["forks"]["nodes"]
-        has_next = page_info["hasNextPage"]
-        end_cursor = page_info["endCursor"]
-
-        new_rows = []
-        skip_rest = False
-        for f in nodes:
-            created_str = f["createdAt"]
-            created_dt = datetime.strptime(created_str, "%Y-%m-%dT%H:%M:%SZ")
-
-            # Skip if older than start_dt
-            if created_dt < start_dt:
-                continue
-            if created_dt > end_dt:
-                skip_rest = True
-                break
+def parse_gh_dt(val):
+    return datetime.strptime(val, "%Y-%m-%dT%H:%M:%SZ") if val else None
 
-            new_rows.append({
-                "creator_login": f["owner"]["login"],
-                "forked_at": created_dt
-            })
-            if created_dt > global_max_dt:
-                global_max_dt = created_dt
+def fork_row(node):
+    created_dt = parse_gh_dt(node["createdAt"])
+    return created_dt, {
+        "creator_login": node["owner"]["login"],
+        "forked_at": created_dt
+    }
 
-        inserted_count = insert_forks(conn, repo_name, new_rows)
-        total_inserted += inserted_count
+def star_row(edge):
+    starred_dt = parse_gh_dt(edge["starredAt"])
+    return starred_dt, {
+        "user_login": edge["node"]["login"],
+        "starred_at": starred_dt
+    }
 
-        # --- FIX: Use len(new_rows) to decide if page is "empty" ---
-        if len(new_rows) == 0:
-            consecutive_empty += 1
-        else:
-            consecutive_empty = 0
+def issue_row(issue):
+    updated_dt = parse_gh_dt(issue["updatedAt"])
+    return updated_dt, {
+        "issue_number": issue["number"],
+        "created_at": parse_gh_dt(issue["createdAt"]),
+        "closed_at": parse_gh_dt(issue["closedAt"]),
+        "updated_at": updated_dt,
+        "creator_login": issue["author"]["login"] if issue["author"] else "",
+        "title": issue["title"] or ""
+    }
 
-        # If we found a fork > end_dt or no more pages, break
-        if skip_rest or not has_next:
-            break
+def pull_row(pr):
+    updated_dt = parse_gh_dt(pr["updatedAt"])
+    return updated_dt, {
+        "pr_number": pr["number"],
+        "created_at": parse_gh_dt(pr["createdAt"]),
+        "merged_at": parse_gh_dt(pr["mergedAt"]),
+        "updated_at": updated_dt,
+        "creator_login": pr["author"]["login"] if pr["author"] else "",
+        "title": pr["title"] or ""
+    }
 
-        # If we got 5 consecutive pages with 0 new_rows, break
-        if consecutive_empty >= MAX_EMPTY_PAGES:
-            print(f"Forks => {consecutive_empty} consecutive empty pages => break.")
-            break
+def gh_dt_str(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-        after_cursor = end_cursor
+def issues_variables(owner, repo, state):
+    return {"issuesSince": gh_dt_str(state["window_dt"])}
 
-    print(f"Done fetching forks for {repo_name}, inserted={total_inserted}")
-    return total_inserted, global_max_dt
+def pulls_search_variables(owner, repo, state):
+    return {"pullRequestsQuery": f"repo:{owner}/{repo} is:pr updated:>={gh_dt_str(state['window_dt'])} sort:updated-asc"}
 
 #############################
-# STARS => starredAt ASC
+# CONNECTIONS => one spec per connection
 #############################
-STARS_QUERY = """
-query($owner:String!, $repo:String!, $pageSize:Int!, $after:String) {
-  repository(owner:$owner, name:$repo) {
-    stargazers(first:$pageSize, after:$after, orderBy:{field:STARRED_AT, direction:ASC}) {
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-      edges {
-        starredAt
-        node {
-          login
-        }
-      }
+# args      => ordering / filters of the date each node is windowed on
+# root / field => a top-level field (search) aliased to the connection name,
+#                  instead of one under repository
+# var_decls / variables => extra query variables, variables(owner, repo, state) -> dict
+# result_cap => the connection ends after this many results => restart from the newest
+#               date seen (search)
+# table     => staging/history table the rows go to
+# descending => newest first, stop at the first node not newer than start_dt
+#               (repo_start_dates.last_date) => incremental runs read only the new head
+# items     => "nodes" or "edges"
+# row       => node -> (window date, row dict for insert)
+# stop_on_empty => ascending only => give up after MAX_EMPTY_PAGES pages without a row in the window
+CONNECTIONS = {
+    "forks": {
+        "table": "forks",
+        "args": "orderBy:{field:CREATED_AT, direction:DESC}",
+        "descending": True,
+        "items": "nodes",
+        "selection": "owner { login } createdAt",
+        "row": fork_row,
+        "insert": insert_forks,
+        "stop_on_empty": False
+    },
+    "stargazers": {
+        "table": "stars",
+        "args": "orderBy:{field:STARRED_AT, direction:DESC}",
+        "descending": True,
+        "items": "edges",
+        "selection": "starredAt node { login }",
+        "row": star_row,
+        "insert": insert_stars,
+        "stop_on_empty": False
+    },
+    # filterBy since => the server skips everything not updated since last_date
+    "issues": {
+        "table": "issues",
+        "args": "orderBy:{field:UPDATED_AT, direction:ASC}, filterBy:{since:$issuesSince}",
+        "var_decls": ", $issuesSince:DateTime",
+        "variables": issues_variables,
+        "descending": False,
+        "items": "nodes",
+        "selection": "number title createdAt updatedAt closedAt author { login }",
+        "row": issue_row,
+        "insert": insert_issues,
+        "stop_on_empty": True
+    },
+    # pullRequests has no since filter => search with an updated:>= qualifier
+    "pullRequests": {
+        "table": "pulls",
+        "root": True,
+        "field": "search",
+        "args": "query:$pullRequestsQuery, type:ISSUE",
+        "var_decls": ", $pullRequestsQuery:String!",
+        "variables": pulls_search_variables,
+        "result_cap": SEARCH_RESULT_CAP,
+        "descending": False,
+        "items": "nodes",
+        "selection": "... on PullRequest { number title createdAt updatedAt mergedAt author { login } }",
+        "row": pull_row,
+        "insert": insert_pulls,
+        "stop_on_empty": True
     }
-  }
 }
-"""
+FUSED_ORDER = ("forks", "stargazers", "issues", "pullRequests")
 
-def fetch_stars_graphql(conn, owner, repo, start_dt, end_dt):
+def build_fused_query(active):
     """
-    Similar logic => starredAt ascending.
-    (No changes needed here for empty pages,
-     but you could do the same fix if duplicates occur.)
+    One query advancing every still-active connection by a page, each from its own
+    cursor ($<name>After). Exhausted connections are simply left out.
+    rateLimit => cost and budget left, fed to the token scheduler.
     """
-    repo_name = f"{owner}/{repo}"
-    session = get_session()
-
-    after_cursor = None
-    page_size = 50
-    total_inserted = 0
-    global_max_dt = start_dt
-
-    consecutive_empty = 0
-
-    while True:
-        variables = {
-            "owner": owner,
-            "repo": repo,
-            "pageSize": page_size,
-            "after": after_cursor
-        }
-        data = do_graphql_post(session, STARS_QUERY, variables)
-        if not data:
-            break
-
-        star_data = data["data"]["repository"]
-        if not star_data:
-            print("No data for stargazers => done.")
-            break
-
-        stargazers = star_data["stargazers"]
-        edges = stargazers["edges"]
-        has_next = stargazers["pageInfo"]["hasNextPage"]
-        end_cursor = stargazers["pageInfo"]["endCursor"]
-
-        new_rows = []
-        skip_rest = False
-
-        for edge in edges:
-            starred_at_str = edge["starredAt"]
-            starred_dt = datetime.strptime(starred_at_str, "%Y-%m-%dT%H:%M:%SZ")
-            if starred_dt < start_dt:
+    var_decls = "".join(f", ${name}After:String" + CONNECTIONS[name].get("var_decls", "") for name in active)
+    repo_parts = []
+    root_parts = []
+    for name in active:
+        spec = CONNECTIONS[name]
+        field = f"{name}: {spec['field']}" if "field" in spec else name
+        indent = "  " if spec.get("root") else "    "
+        part = (
+            f"{indent}{field}(first:$pageSize, after:${name}After, {spec['args']}) {{\n"
+            f"{indent}  pageInfo {{ hasNextPage endCursor }}\n"
+            f"{indent}  {spec['items']} {{ {spec['selection']} }}\n"
+            f"{indent}}}"
+        )
+        if spec.get("root"):
+            root_parts.append(part)
+        else:
+            repo_parts.append(part)
+    query = "query($pageSize:Int!"
+    if repo_parts:
+        query += ", $owner:String!, $repo:String!"
+    query += f"{var_decls}) {{\n  rateLimit {{ cost remaining resetAt }}\n"
+    if repo_parts:
+        query += "  repository(owner:$owner, name:$repo) {\n" + "\n".join(repo_parts) + "\n  }\n"
+    if root_parts:
+        query += "\n".join(root_parts) + "\n"
+    return query + "}\n"
+
+def advance_connection(conn, repo_name, name, part, state, end_dt):
+    """
+    Insert one page of a connection and move its cursor.
+    Return True if the connection needs another page.
+    """
+    spec = CONNECTIONS[name]
+    if not part:
+        print(f"{name} => no data => done.")
+        return False
+
+    new_rows = []
+    skip_rest = False
+    for item in part[spec["items"]]:
+        window_dt, row = spec["row"](item)
+        if spec["descending"]:
+            if window_dt > end_dt:
                 continue
-            if starred_dt > end_dt:
+            # exclusive => a node dated exactly last_date was stored by the run that set it
+            if window_dt <= state["stop_dt"]:
                 skip_rest = True
                 break
+        else:
+            if window_dt <= state["start_dt"]:
+                continue
+            if window_dt > end_dt:
+                skip_rest = True
+                break
+        new_rows.append(row)
+        if window_dt > state["max_dt"]:
+            state["max_dt"] = window_dt
 
-            user_login = edge["node"]["login"]
-            new_rows.append({
-                "user_login": user_login,
-                "starred_at": starred_dt
-            })
-            if starred_dt > global_max_dt:
-                global_max_dt = starred_dt
-
-        inserted_count = insert_stars(conn, repo_name, new_rows)
-        total_inserted += inserted_count
-
-        # If you want to do the same fix for stars, you could:
-        # if len(new_rows) == 0:
-        #     consecutive_empty += 1
-        # else:
-        #     consecutive_empty = 0
-
-        if skip_rest or not has_next:
-            break
-        if consecutive_empty >= MAX_EMPTY_PAGES:
-            print(f"Consecutive empty star pages => break.")
-            break
+    state["inserted"] += spec["insert"](conn, repo_name, new_rows)
 
-        after_cursor = end_cursor
+    # a page of duplicates still counts as non-empty => only rows outside the window do
+    if len(new_rows) == 0:
+        state["empty"] += 1
+    else:
+        state["empty"] = 0
+
+    has_next = part["pageInfo"]["hasNextPage"]
+    state["window_count"] += len(part[spec["items"]])
+    if not skip_rest and not has_next and state["window_count"] >= spec.get("result_cap", float("inf")):
+        if state["max_dt"] <= state["window_dt"]:
+            print(f"{name} => {state['window_count']} results share {state['window_dt']} => stop.")
+            state["complete"] = True
+            return False
+        # capped result set => same query again from the newest date seen (overlap is ignored on insert)
+        state["window_dt"] = state["max_dt"]
+        state["window_count"] = 0
+        state["after"] = None
+        return True
+    if skip_rest and state["resume"]:
+        # caught up with the head an interrupted run already read => jump to where it stopped
+        (state["after"], upper_dt) = state["resume"]
+        print(f"{name} => reached {upper_dt} => resuming the interrupted run's cursor")
+        state["resume"] = None
+        state["stop_dt"] = state["start_dt"]
+        # the head is staged => a later failure must resume below it, not re-read it
+        if state["on_cursor"]:
+            state["on_cursor"](name, state["after"], state["max_dt"])
+        return True
+    if skip_rest or not has_next:
+        state["complete"] = True
+        return False
+    if spec["stop_on_empty"] and state["empty"] >= MAX_EMPTY_PAGES:
+        print(f"{name} => {state['empty']} consecutive empty pages => break.")
+        state["complete"] = True
+        return False
+    state["after"] = part["pageInfo"]["endCursor"]
+    # gap recovery => only once past the resumed head, the saved cursor must stay until then
+    if spec["descending"] and state["resume"] is None and state["on_cursor"]:
+        state["on_cursor"](name, state["after"], state["max_dt"])
+    return True
+
+def fetch_connections_graphql(conn, session, owner, repo, start_dt, end_dt, names=FUSED_ORDER, metadata_conn=None,
+                              start_dts=None):
+    """
+    Fused fetch => forks, stargazers, issues and pullRequests advance together,
+    GRAPHQL_PAGE_SIZE nodes each per round trip, until every one is exhausted.
 
-    return total_inserted, global_max_dt
+    With metadata_conn, descending connections save their cursor after every page
+    (repo_cursors) and clear it once they reach start_dt. A run that dies half way
+    leaves it behind => the next run reads the new head down to where the dead run
+    started, then continues from its cursor instead of re-reading the middle.
+    The jump saves that cursor with the new head date at once; a fetch that
+    stops during the head walk drops the head rows it staged.
 
-#############################
-# ISSUES => updatedAt ASC
-#############################
-ISSUES_QUERY = """
-query($owner:String!, $repo:String!, $pageSize:Int!, $after:String) {
-  repository(owner:$owner, name:$repo) {
-    issues(first:$pageSize, after:$after, orderBy:{field:UPDATED_AT, direction:ASC}) {
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-      nodes {
-        number
-        title
-        createdAt
-        updatedAt
-        closedAt
-        author {
-          login
-        }
-      }
-    }
-  }
-}
-"""
+    start_dts => {name: start date} overriding start_dt per connection.
+    A failed page (GraphQL or DB error) ends the fetch; the connections still
+    active are returned as not complete.
 
-def fetch_issues_graphql(conn, owner, repo, start_dt, end_dt):
-    """
-    Similar approach for issues => updatedAt ascending.
+    Return {name: (inserted, max window date, complete)}.
     """
     repo_name = f"{owner}/{repo}"
-    session = get_session()
-
-    after_cursor = None
-    page_size = 50
-    total_inserted = 0
-    global_max_dt = start_dt
-
-    consecutive_empty = 0
-
-    while True:
-        variables = {
-            "owner": owner,
-            "repo": repo,
-            "pageSize": page_size,
-            "after": after_cursor
+    session = session or get_session()
+    on_cursor = None
+    if metadata_conn is not None:
+        on_cursor = lambda name, cursor_val, upper_dt: save_repo_cursor(metadata_conn, owner, repo, name, cursor_val, upper_dt)
+    state = {}
+    for name in names:
+        conn_start_dt = (start_dts or {}).get(name, start_dt)
+        resume = None
+        if metadata_conn is not None and CONNECTIONS[name]["descending"]:
+            resume = get_repo_cursor(metadata_conn, owner, repo, name)
+        state[name] = {
+            "after": None,
+            "inserted": 0,
+            "start_dt": conn_start_dt,
+            "max_dt": conn_start_dt,
+            "empty": 0,
+            "complete": False,
+            "resume": resume,
+            "stop_dt": max(conn_start_dt, resume[1]) if resume else conn_start_dt,
+            "window_dt": conn_start_dt,
+            "window_count": 0,
+            "on_cursor": on_cursor
         }
-        data = do_graphql_post(session, ISSUES_QUERY, variables)
-        if not data:
-            break
-
-        repo_part = data["data"]["repository"]
-        if not repo_part:
-            print("No issue data => done.")
-            break
-
-        issues_part = repo_part["issues"]
-        nodes = issues_part["nodes"]
-        has_next = issues_part["pageInfo"]["hasNextPage"]
-        end_cursor = issues_part["pageInfo"]["endCursor"]
-
-        new_rows = []
-        skip_rest = False
-
-        for issue in nodes:
-            updated_str = issue["updatedAt"]
-            updated_dt = datetime.strptime(updated_str, "%Y-%m-%dT%H:%M:%SZ")
-            if updated_dt < start_dt:
-                continue
-            if updated_dt > end_dt:
-                skip_rest = True
+    active = list(names)
+    pages = 0
+    points = 0
+    page_size = GRAPHQL_PAGE_SIZE
+
+    try:
+        while active:
+            variables = {"pageSize": page_size}
+            if any(not CONNECTIONS[name].get("root") for name in active):
+                variables["owner"] = owner
+                variables["repo"] = repo
+            for name in active:
+                variables[f"{name}After"] = state[name]["after"]
+                if "variables" in CONNECTIONS[name]:
+                    variables.update(CONNECTIONS[name]["variables"](owner, repo, state[name]))
+            shape = tuple(active)
+            data = do_graphql_post(session, build_fused_query(active), variables, QUERY_COSTS.get(shape, 1))
+            pages += 1
+            if not data:
+                print("GraphQL error or no data => done.")
+                break
+            rate_limit = data["data"].get("rateLimit")
+            if rate_limit:
+                QUERY_COSTS[shape] = rate_limit["cost"]
+                points += rate_limit["cost"]
+            # halved on a server timeout => grow back towards the full page
+            page_size = min(GRAPHQL_PAGE_SIZE, variables["pageSize"] * 2)
+
+            repo_part = data["data"].get("repository")
+            if "owner" in variables and not repo_part:
+                print(f"No repository data for {repo_name} => done.")
                 break
 
-            created_str = issue["createdAt"]
-            created_dt = datetime.strptime(created_str, "%Y-%m-%dT%H:%M:%SZ")
-            closed_str = issue["closedAt"]
-            closed_dt = datetime.strptime(closed_str, "%Y-%m-%dT%H:%M:%SZ") if closed_str else None
-
-            user_login = issue["author"]["login"] if issue["author"] else ""
-            number = issue["number"]
-            title = issue["title"] or ""
-
-            new_rows.append({
-                "issue_number": number,
-                "created_at": created_dt,
-                "closed_at": closed_dt,
-                "updated_at": updated_dt,
-                "creator_login": user_login,
-                "title": title
-            })
-
-            if updated_dt > global_max_dt:
-                global_max_dt = updated_dt
-
-        inserted_count = insert_issues(conn, repo_name, new_rows)
-        total_inserted += inserted_count
-
-        if len(new_rows) == 0:
-            consecutive_empty += 1
-        else:
-            consecutive_empty = 0
+            try:
+                active = [name for name in active
+                          if advance_connection(conn, repo_name, name,
+                                                (data["data"] if CONNECTIONS[name].get("root") else repo_part).get(name),
+                                                state[name], end_dt)]
+            except mysql.connector.Error as e:
+                print(f"Insert failed for {repo_name} => {e} => done.")
+                break
+    finally:
+        # resumed head walk not finished => the saved cursor still starts below the old
+        # head, the next run reads this head again => drop what it staged
+        for name in names:
+            st = state[name]
+            if CONNECTIONS[name]["descending"] and st["resume"] and not st["complete"]:
+                print(f"{name} => head walk not finished => staged rows dropped")
+                discard_staged_rows(conn, repo_name, [CONNECTIONS[name]["table"]])
+                st["inserted"] = 0
+
+    if metadata_conn is not None:
+        for name in names:
+            if state[name]["complete"] and CONNECTIONS[name]["descending"]:
+                clear_repo_cursor(metadata_conn, owner, repo, name)
+
+    print(f"Done fetching {', '.join(names)} for {repo_name} => {pages} GraphQL page(s) => {points} point(s)")
+    return {name: (st["inserted"], st["max_dt"], st["complete"]) for name, st in state.items()}
+
+def fetch_forks_graphql(conn, owner, repo, start_dt, end_dt, session=None):
+    """
+    Forks only => createdAt descending down to start_dt. Return (inserted, max date).
+    """
+    return fetch_connections_graphql(conn, session, owner, repo, start_dt, end_dt, ("forks",))["forks"][:2]
 
-        if skip_rest or not has_next:
-            break
-        if consecutive_empty >= MAX_EMPTY_PAGES:
-            print(f"Consecutive empty issue pages => break.")
-            break
+def fetch_stars_graphql(conn, owner, repo, start_dt, end_dt, session=None):
+    """
+    Stargazers only => starredAt descending down to start_dt. Return (inserted, max date).
+    """
+    return fetch_connections_graphql(conn, session, owner, repo, start_dt, end_dt, ("stargazers",))["stargazers"][:2]
 
-        after_cursor = end_cursor
+def fetch_issues_graphql(conn, owner, repo, start_dt, end_dt, session=None):
+    """
+    Issues only => updated since start_dt, updatedAt ascending. Return (inserted, max date).
+    """
+    return fetch_connections_graphql(conn, session, owner, repo, start_dt, end_dt, ("issues",))["issues"][:2]
 
-    return total_inserted, global_max_dt
+def fetch_pulls_graphql(conn, owner, repo, start_dt, end_dt, session=None):
+    """
+    PRs only => search updated:>=start_dt, updatedAt ascending. Return (inserted, max date).
+    """
+    return fetch_connections_graphql(conn, session, owner, repo, start_dt, end_dt, ("pullRequests",))["pullRequests"][:2]
 
 #############################
-# PULLS => updatedAt ASC
+# REPO SIZES => schedule the largest repos first
 #############################
-PULLS_QUERY = """
-query($owner:String!, $repo:String!, $pageSize:Int!, $after:String) {
-  repository(owner:$owner, name:$repo) {
-    pullRequests(first:$pageSize, after:$after, orderBy:{field:UPDATED_AT, direction:ASC}) {
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-      nodes {
-        number
-        title
-        createdAt
-        updatedAt
-        mergedAt
-        author {
-          login
-        }
-      }
-    }
-  }
-}
-"""
+SIZE_BATCH = 25  # repositories per size query
 
-def fetch_pulls_graphql(conn, owner, repo, start_dt, end_dt):
+def fetch_repo_sizes(session, repos):
     """
-    For PRs => updatedAt ascending.
+    {(owner, repo): stars + forks + issues + PRs} for every (owner, repo), one
+    aliased query per SIZE_BATCH repos. Unknown repos (errors) => 0, the rest
+    of their batch is still sized.
     """
-    repo_name = f"{owner}/{repo}"
-    session = get_session()
-
-    after_cursor = None
-    page_size = 50
-    total_inserted = 0
-    global_max_dt = start_dt
-
-    consecutive_empty = 0
-
-    while True:
-        variables = {
-            "owner": owner,
-            "repo": repo,
-            "pageSize": page_size,
-            "after": after_cursor
-        }
-        data = do_graphql_post(session, PULLS_QUERY, variables)
-        if not data:
-            break
-
-        repo_part = data["data"]["repository"]
-        if not repo_part:
-            print("No pull data => done.")
-            break
-
-        pulls_part = repo_part["pullRequests"]
-        nodes = pulls_part["nodes"]
-        has_next = pulls_part["pageInfo"]["hasNextPage"]
-        end_cursor = pulls_part["pageInfo"]["endCursor"]
-
-        new_rows = []
-        skip_rest = False
-
-        for pr in nodes:
-            updated_str = pr["updatedAt"]
-            updated_dt = datetime.strptime(updated_str, "%Y-%m-%dT%H:%M:%SZ")
-            if updated_dt < start_dt:
-                continue
-            if updated_dt > end_dt:
-                skip_rest = True
-                break
-
-            created_str = pr["createdAt"]
-            created_dt = datetime.strptime(created_str, "%Y-%m-%dT%H:%M:%SZ")
-            merged_str = pr["mergedAt"]
-            merged_dt = datetime.strptime(merged_str, "%Y-%m-%dT%H:%M:%SZ") if merged_str else None
-
-            user_login = pr["author"]["login"] if pr["author"] else ""
-            number = pr["number"]
-            title = pr["title"] or ""
-
-            new_rows.append({
-                "pr_number": number,
-                "created_at": created_dt,
-                "merged_at": merged_dt,
-                "updated_at": updated_dt,
-                "creator_login": user_login,
-                "title": title
-            })
-
-            if updated_dt > global_max_dt:
-                global_max_dt = updated_dt
-
-        inserted_count = insert_pulls(conn, repo_name, new_rows)
-        total_inserted += inserted_count
-
-        if len(new_rows) == 0:
-            consecutive_empty += 1
-        else:
-            consecutive_empty = 0
-
-        if skip_rest or not has_next:
-            break
-        if consecutive_empty >= MAX_EMPTY_PAGES:
-            print(f"Consecutive empty pull pages => break.")
-            break
-
-        after_cursor = end_cursor
-
-    return total_inserted, global_max_dt
+    sizes = {}
+    for i in range(0, len(repos), SIZE_BATCH):
+        batch = repos[i:i + SIZE_BATCH]
+        parts = [
+            f"  r{j}: repository(owner:{json.dumps(owner)}, name:{json.dumps(repo)}) {{ "
+            f"stargazerCount forkCount issues {{ totalCount }} pullRequests {{ totalCount }} }}"
+            for j, (owner, repo) in enumerate(batch)
+        ]
+        query = "query {\n  rateLimit { cost remaining resetAt }\n" + "\n".join(parts) + "\n}\n"
+        data = do_graphql_post(session, query, {}, partial=True)
+        repo_data = (data or {}).get("data") or {}
+        for j, key in enumerate(batch):
+            node = repo_data.get(f"r{j}")
+            sizes[key] = (node["stargazerCount"] + node["forkCount"] + node["issues"]["totalCount"]
+                          + node["pullRequests"]["totalCount"]) if node else 0
+    return sizes
 
 ################################
 # MASTER FETCH
 ################################
-def fetch_all_data_for_repo(ephemeral_conn, metadata_conn, owner, repo, fallback_str="", end_str=None):
+def fetch_all_data_for_repo(run_conn, metadata_conn, owner, repo, fallback_str="", end_str=None, session=None):
     """
-    1) Determine start_dt from metadata or fallback.
+    1) Determine start_dt from metadata or fallback, per connection (repo_connection_dates).
     2) End date => parse end_str or default to now.
-    3) Fetch forks, stars, issues, pulls using GraphQL with ascending date sort.
-    4) Insert them into ephemeral DB, track total inserts, track global max date.
-    5) Update metadata with that global max date.
+    3) Fetch forks, stars, issues, pulls with one fused GraphQL query per page
+       (one cursor per connection) on session. Stars/forks newest first down to
+       start_dt, issues/pulls updated since start_dt (filterBy since / search
+       updated:>=) by updatedAt ascending.
+    4) Insert them into the run's staging tables, track total inserts, track global max date.
+    5) Move each finished connection's last_date to its max date; an unfinished
+       one keeps it (a newest-first connection knows the max date before the gap
+       is filled) and its re-readable rows are dropped from staging.
+       repo_start_dates.last_date moves only once every connection finished.
     6) Print summary.
+    Returns {"forks", "stars", "issues", "pulls", "last_date", "complete"}.
     """
     if not fallback_str:
         fallback_str = "2007-01-01"
@@ -786,30 +1114,35 @@ def fetch_all_data_for_repo(ephemeral_conn, metadata_conn, owner, repo, fallback
     else:
         end_dt = datetime.utcnow()
 
-    overall_max_dt = start_dt
-
-    # Forks
-    forks_inserted, forks_max_dt = fetch_forks_graphql(ephemeral_conn, owner, repo, start_dt, end_dt)
-    if forks_max_dt > overall_max_dt:
-        overall_max_dt = forks_max_dt
-
-    # Stars
-    stars_inserted, stars_max_dt = fetch_stars_graphql(ephemeral_conn, owner, repo, start_dt, end_dt)
-    if stars_max_dt > overall_max_dt:
-        overall_max_dt = stars_max_dt
-
-    # Issues
-    issues_inserted, issues_max_dt = fetch_issues_graphql(ephemeral_conn, owner, repo, start_dt, end_dt)
-    if issues_max_dt > overall_max_dt:
-        overall_max_dt = issues_max_dt
-
-    # Pulls
-    pulls_inserted, pulls_max_dt = fetch_pulls_graphql(ephemeral_conn, owner, repo, start_dt, end_dt)
-    if pulls_max_dt > overall_max_dt:
-        overall_max_dt = pulls_max_dt
-
-    # Update metadata
-    update_repo_last_date(metadata_conn, owner, repo, overall_max_dt)
+    start_dts = get_connection_start_dates(metadata_conn, owner, repo, start_dt)
+    repo_name = f"{owner}/{repo}"
+    try:
+        results = fetch_connections_graphql(run_conn, session, owner, repo, start_dt, end_dt,
+                                            metadata_conn=metadata_conn, start_dts=start_dts)
+    except Exception:
+        # no connection moved its last_date => issues/pulls are read again next run
+        discard_staged_rows(run_conn, repo_name, [s["table"] for s in CONNECTIONS.values() if not s["descending"]])
+        raise
+    forks_inserted = results["forks"][0]
+    stars_inserted = results["stargazers"][0]
+    issues_inserted = results["issues"][0]
+    pulls_inserted = results["pullRequests"][0]
+    incomplete = [name for name, (inserted, max_dt, complete) in results.items() if not complete]
+
+    # Update metadata => per connection, only what finished
+    for name, (inserted, max_dt, complete) in results.items():
+        if complete:
+            update_connection_last_date(metadata_conn, owner, repo, name, max_dt, RUN_ID)
+        elif not CONNECTIONS[name]["descending"]:
+            print(f"{name} not finished => staged rows dropped, last_date stays {start_dts[name]}")
+            discard_staged_rows(run_conn, repo_name, [CONNECTIONS[name]["table"]])
+        else:
+            print(f"{name} not finished => last_date stays {start_dts[name]}, next run resumes from its cursor")
+    overall_max_dt = max([start_dt] + [max_dt for (inserted, max_dt, complete) in results.values()])
+    if incomplete:
+        overall_max_dt = start_dt
+    else:
+        update_repo_last_date(metadata_conn, owner, repo, overall_max_dt)
 
     # Print summary
     print(f"\n**** Summary for {owner}/{repo} ****")
@@ -818,6 +1151,14 @@ def fetch_all_data_for_repo(ephemeral_conn, metadata_conn, owner, repo, fallback
     print(f"Issues inserted: {issues_inserted}")
     print(f"Pulls inserted:  {pulls_inserted}")
     print(f"Updated last_date => {overall_max_dt}")
+    return {
+        "forks": forks_inserted,
+        "stars": stars_inserted,
+        "issues": issues_inserted,
+        "pulls": pulls_inserted,
+        "last_date": overall_max_dt,
+        "complete": not incomplete
+    }
 
 if __name__ == "__main__":
     print("fetch_data.py (GraphQL) => Typically invoked via caller.py")